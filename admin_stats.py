@@ -5,109 +5,128 @@
 Вывод статистики по базе данных для админа
 """
 
-import sqlite3
 import logging
-from datetime import datetime, timedelta
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from timeutils import now_ts, from_ts, local_day_bounds, format_samara_time
+from db import pool, recent_cache, known_users, rebuild_aggregates, verify_user_summary
+from migrations import get_migrations_status
+from send_queue import admin_lane
+from metrics import (registry, summarize, handler_seconds, handler_errors, db_query_seconds, db_query_errors,
+                     db_slow_queries, backup_seconds)
 
 logger = logging.getLogger(__name__)
 ADMIN_ID = 203790724
 
+# Пользователей на странице списка в админке
+USERS_PAGE_SIZE = 10
+# Строк в таблицах /perf
+PERF_TOP = 10
+USERS_OLDER = 'older'
+USERS_NEWER = 'newer'
+_MAX_KEY = 2 ** 63 - 1
 
-def get_db_stats():
-    """Собирает статистику по базе данных"""
-    conn = sqlite3.connect('data/weight_tracker.db')
+
+def _get_db_stats(conn):
+    """Собирает статистику по базе данных из счётчиков global_stats,
+    дневных корзин daily_stats и сводки user_summary"""
     cursor = conn.cursor()
 
     stats = {}
 
     # Общая статистика
-    cursor.execute("SELECT COUNT(*) FROM users")
-    stats['total_users'] = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM weight_records")
-    stats['total_records'] = cursor.fetchone()[0]
-
-    # Статистика по записям
     cursor.execute("""
-        SELECT COUNT(DISTINCT user_id) 
-        FROM weight_records 
-        WHERE date >= date('now', '-7 days')
+        SELECT total_users, total_records, weight_sum, min_weight, max_weight, first_ts, last_ts
+        FROM global_stats WHERE id = 1
     """)
-    stats['active_users_7d'] = cursor.fetchone()[0]
+    total_users, total_records, weight_sum, min_weight, max_weight, first_ts, last_ts = cursor.fetchone()
+    stats['total_users'] = total_users
+    stats['total_records'] = total_records
+
+    # Статистика по записям (окна считаются от начала местного дня)
+    day_7d, since_7d, _ = local_day_bounds(now_ts() - 7 * 86400)
+    day_30d, _, _ = local_day_bounds(now_ts() - 30 * 86400)
 
     cursor.execute("""
         SELECT COUNT(*) 
-        FROM weight_records 
-        WHERE date >= date('now', '-7 days')
-    """)
-    stats['records_7d'] = cursor.fetchone()[0]
+        FROM user_summary 
+        WHERE last_ts >= ?
+    """, (since_7d,))
+    stats['active_users_7d'] = cursor.fetchone()[0]
 
     cursor.execute("""
-        SELECT COUNT(*) 
-        FROM weight_records 
-        WHERE date >= date('now', '-30 days')
-    """)
-    stats['records_30d'] = cursor.fetchone()[0]
+        SELECT
+            COALESCE(SUM(CASE WHEN day >= ? THEN records_count END), 0),
+            COALESCE(SUM(records_count), 0)
+        FROM daily_stats 
+        WHERE day >= ?
+    """, (day_7d, day_30d))
+    stats['records_7d'], stats['records_30d'] = cursor.fetchone()
 
     # Первая и последняя запись
-    cursor.execute("SELECT MIN(date), MAX(date) FROM weight_records")
-    first_date, last_date = cursor.fetchone()
-    stats['first_record'] = first_date
-    stats['last_record'] = last_date
+    stats['first_record'] = first_ts
+    stats['last_record'] = last_ts
 
     # Топ пользователей по количеству записей
     cursor.execute("""
-        SELECT user_id, COUNT(*) as count 
-        FROM weight_records 
-        GROUP BY user_id 
-        ORDER BY count DESC 
+        SELECT user_id, records_count 
+        FROM user_summary 
+        ORDER BY records_count DESC 
         LIMIT 5
     """)
     stats['top_users'] = cursor.fetchall()
 
     # Средний вес по всем пользователям
-    cursor.execute("SELECT AVG(weight) FROM weight_records")
-    stats['avg_weight'] = cursor.fetchone()[0]
+    stats['avg_weight'] = weight_sum / total_records if total_records else None
 
     # Минимальный и максимальный вес
-    cursor.execute("SELECT MIN(weight), MAX(weight) FROM weight_records")
-    stats['min_weight'], stats['max_weight'] = cursor.fetchone()
+    stats['min_weight'], stats['max_weight'] = min_weight, max_weight
 
-    conn.close()
     return stats
 
 
-def get_users_list(limit=20):
-    """Получает список пользователей"""
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
+def _get_users_page(conn, direction=USERS_OLDER, cursor=None, limit=USERS_PAGE_SIZE):
+    """Страница пользователей, новые сверху, по ключу (created_at, user_id).
 
-    cursor.execute("""
-        SELECT 
+    direction=USERS_OLDER - пользователи, зарегистрированные раньше cursor
+    (без курсора - первая страница), USERS_NEWER - позже cursor.
+    Возвращает users, признаки has_newer/has_older и total из global_stats."""
+    newer = direction == USERS_NEWER
+    if cursor is None:
+        cursor = (_MAX_KEY, _MAX_KEY)
+
+    rows = conn.execute(f"""
+        SELECT
             u.user_id,
             u.username,
             u.first_name,
             u.last_name,
             u.created_at,
-            COUNT(w.id) as records_count,
-            MAX(w.date) as last_record
+            COALESCE(s.records_count, 0) as records_count,
+            s.last_ts as last_record
         FROM users u
-        LEFT JOIN weight_records w ON u.user_id = w.user_id
-        GROUP BY u.user_id
-        ORDER BY u.created_at DESC
+        LEFT JOIN user_summary s ON u.user_id = s.user_id
+        WHERE (u.created_at, u.user_id) {'>' if newer else '<'} (?, ?)
+        ORDER BY u.created_at {'ASC' if newer else 'DESC'}, u.user_id {'ASC' if newer else 'DESC'}
         LIMIT ?
-    """, (limit,))
+    """, (*cursor, limit + 1)).fetchall()
 
-    users = cursor.fetchall()
-    conn.close()
-    return users
+    # Лишняя строка показывает, что в этом направлении есть ещё страница
+    more = len(rows) > limit
+    users = rows[:limit]
+    if newer:
+        users.reverse()
+
+    return {
+        'users': users,
+        'has_newer': more if newer else cursor[0] != _MAX_KEY,
+        'has_older': True if newer else more,
+        'total': conn.execute('SELECT total_users FROM global_stats WHERE id = 1').fetchone()[0],
+    }
 
 
-def get_detailed_user_stats(user_id):
+def _get_detailed_user_stats(conn, user_id):
     """Получает детальную статистику по конкретному пользователю"""
-    conn = sqlite3.connect('data/weight_tracker.db')
     cursor = conn.cursor()
 
     # Информация о пользователе
@@ -118,35 +137,32 @@ def get_detailed_user_stats(user_id):
     user_info = cursor.fetchone()
 
     if not user_info:
-        conn.close()
         return None
 
-    # Статистика записей
+    # Статистика записей (из сводной таблицы user_summary)
     cursor.execute("""
         SELECT 
-            COUNT(*) as total_records,
-            AVG(weight) as avg_weight,
-            MIN(weight) as min_weight,
-            MAX(weight) as max_weight,
-            MIN(date) as first_record,
-            MAX(date) as last_record
-        FROM weight_records 
+            records_count,
+            weight_sum / records_count as avg_weight,
+            min_weight,
+            max_weight,
+            first_ts,
+            last_ts
+        FROM user_summary 
         WHERE user_id = ?
     """, (user_id,))
-    record_stats = cursor.fetchone()
+    record_stats = cursor.fetchone() or (0, None, None, None, None, None)
 
     # Последние 10 записей
     cursor.execute("""
-        SELECT weight, date 
+        SELECT weight, ts 
         FROM weight_records 
         WHERE user_id = ? 
-        ORDER BY date DESC 
+        ORDER BY ts DESC 
         LIMIT 10
     """, (user_id,))
     recent_records = cursor.fetchall()
 
-    conn.close()
-
     return {
         'user_info': user_info,
         'record_stats': record_stats,
@@ -154,63 +170,202 @@ def get_detailed_user_stats(user_id):
     }
 
 
-def format_stats_message(stats):
-    """Форматирует статистику для вывода"""
-    message = "📊 **ОБЩАЯ СТАТИСТИКА БОТА**\n\n"
-    message += f"👥 Всего пользователей: **{stats['total_users']}**\n"
-    message += f"📝 Всего записей: **{stats['total_records']:,d}**\n"
-    message += f"📊 Средний вес: **{stats['avg_weight']:.1f} кг**\n"
-    message += f"⬇️ Мин. вес: **{stats['min_weight']:.1f} кг**\n"
-    message += f"⬆️ Макс. вес: **{stats['max_weight']:.1f} кг**\n\n"
+async def get_db_stats():
+    stats = await pool.read(_get_db_stats)
+    stats['caches'] = [
+        ("Кэш последних записей", recent_cache.stats()),
+        ("Известные пользователи", known_users.stats()),
+    ]
+    stats['group_commit'] = pool.group_commit_stats()
+    return stats
+
 
-    message += "📅 **Активность:**\n"
-    message += f"🔥 Активных за 7 дней: **{stats['active_users_7d']}**\n"
-    message += f"📊 Записей за 7 дней: **{stats['records_7d']}**\n"
-    message += f"📊 Записей за 30 дней: **{stats['records_30d']}**\n\n"
+async def get_users_page(direction=USERS_OLDER, cursor=None, limit=USERS_PAGE_SIZE):
+    return await pool.read(_get_users_page, direction, cursor, limit)
+
+
+async def get_detailed_user_stats(user_id):
+    return await pool.read(_get_detailed_user_stats, user_id)
+
+
+# Шаблоны сводки /stats в Markdown; для ответа без разметки (кнопка "Назад
+# к статистике") из них при импорте убирается **, остальное совпадает
+_STATS_TEMPLATES = {
+    'totals': (
+        "📊 **ОБЩАЯ СТАТИСТИКА БОТА**\n\n"
+        "👥 Всего пользователей: **{total_users}**\n"
+        "📝 Всего записей: **{total_records:,d}**\n"
+        "📊 Средний вес: **{avg_weight:.1f} кг**\n"
+        "⬇️ Мин. вес: **{min_weight:.1f} кг**\n"
+        "⬆️ Макс. вес: **{max_weight:.1f} кг**\n\n"
+        "📅 **Активность:**\n"
+        "🔥 Активных за 7 дней: **{active_users_7d}**\n"
+        "📊 Записей за 7 дней: **{records_7d}**\n"
+        "📊 Записей за 30 дней: **{records_30d}**\n\n"
+    ),
+    'period': (
+        "🎯 Первая запись: **{:%d.%m.%Y}**\n"
+        "🎯 Последняя запись: **{:%d.%m.%Y}**\n"
+        "📆 Всего дней: **{}**\n\n"
+    ),
+    'top_header': "🏆 **Топ-5 пользователей:**\n",
+    'top_user': "{}. ID {}: **{}** записей\n",
+    'cache': (
+        "\n🧠 **{}:**\n"
+        "📦 Пользователей: **{size}** из {maxsize}\n"
+        "🎯 Попаданий: **{}** ({hits} / {})\n"
+        "♻️ Вытеснено: {evictions}, устарело: {expirations}\n"
+    ),
+    'group_commit': (
+        "\n📦 **Групповой коммит:**\n"
+        "🧾 Пачек: **{batches}**, записей: **{rows}**\n"
+        "📏 Размер пачки: ср. {avg_batch:.1f}, макс. {max_batch}\n"
+        "💾 COMMIT: ср. {avg_commit_ms:.1f} мс, макс. {max_commit_ms:.1f} мс\n"
+        "⏳ Ожидание ответа: ср. {avg_wait_ms:.1f} мс, макс. {max_wait_ms:.1f} мс\n"
+    ),
+}
+_STATS_FORMATS = {
+    markdown: {name: (text if markdown else text.replace('**', '')).format for name, text in _STATS_TEMPLATES.items()}
+    for markdown in (True, False)
+}
+
+
+def format_stats_message(stats, markdown=True):
+    """Форматирует статистику для вывода (markdown=False - без разметки)"""
+    formats = _STATS_FORMATS[markdown]
+    parts = [formats['totals'](**stats)]
 
     if stats['first_record']:
-        first = datetime.strptime(stats['first_record'], '%Y-%m-%d %H:%M:%S')
-        last = datetime.strptime(stats['last_record'], '%Y-%m-%d %H:%M:%S')
-        message += f"🎯 Первая запись: **{first.strftime('%d.%m.%Y')}**\n"
-        message += f"🎯 Последняя запись: **{last.strftime('%d.%m.%Y')}**\n"
-        message += f"📆 Всего дней: **{(last - first).days + 1}**\n\n"
+        first = from_ts(stats['first_record'])
+        last = from_ts(stats['last_record'])
+        parts.append(formats['period'](first, last, (last - first).days + 1))
 
-    message += "🏆 **Топ-5 пользователей:**\n"
-    for i, (user_id, count) in enumerate(stats['top_users'], 1):
-        message += f"{i}. ID {user_id}: **{count}** записей\n"
+    parts.append(formats['top_header']())
+    parts.extend(formats['top_user'](i, user_id, count) for i, (user_id, count) in enumerate(stats['top_users'], 1))
 
-    return message
+    for title, cache in stats.get('caches', []):
+        hit_rate = f"{cache['hit_rate']:.0%}" if cache['hit_rate'] is not None else "—"
+        parts.append(formats['cache'](title, hit_rate, cache['hits'] + cache['misses'], **cache))
 
+    group = stats.get('group_commit')
+    if group and group['enabled']:
+        parts.append(formats['group_commit'](**group))
 
-def format_users_list(users):
-    """Форматирует список пользователей"""
-    message = "👥 **СПИСОК ПОЛЬЗОВАТЕЛЕЙ**\n\n"
+    return ''.join(parts)
 
-    for user in users:
-        user_id, username, first_name, last_name, created_at, records_count, last_record = user
 
-        name = first_name or ""
-        if last_name:
-            name += f" {last_name}"
+def format_users_page(page):
+    """Форматирует страницу списка пользователей (без Markdown: имена бывают любыми)"""
+    message = f"👥 ПОЛЬЗОВАТЕЛИ (всего {page['total']})\n\n"
+    if not page['users']:
+        return message + "Пользователей нет\n"
 
-        username_display = f"@{username}" if username else "нет username"
-        created = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
+    for user in page['users']:
+        user_id, username, first_name, last_name, created_at, records_count, last_record = user
+
+        name = " ".join(part for part in (first_name, last_name) if part) or "нет имени"
+        username_str = f"@{username}" if username else "нет username"
+        created = format_samara_time(created_at, date_only=True)
 
-        message += f"🆔 **ID:** `{user_id}`\n"
-        message += f"👤 **Имя:** {name}\n"
-        message += f"📱 **Username:** {username_display}\n"
-        message += f"📅 **Регистрация:** {created}\n"
-        message += f"📊 **Записей:** {records_count}\n"
+        message += f"🆔 ID: {user_id}\n"
+        message += f"👤 Имя: {name}\n"
+        message += f"📱 Username: {username_str}\n"
+        message += f"📅 Регистрация: {created}\n"
+        message += f"📊 Записей: {records_count}\n"
 
         if last_record:
-            last = datetime.strptime(last_record, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-            message += f"🕐 **Последняя запись:** {last}\n"
+            last = format_samara_time(last_record, date_only=True)
+            message += f"🕐 Последняя запись: {last}\n"
 
         message += "─" * 30 + "\n"
 
     return message
 
 
+def users_page_keyboard(page):
+    """Кнопки листания: курсор - ключ (created_at, user_id) крайней строки страницы"""
+    users = page['users']
+    navigation = []
+    if page['has_newer'] and users:
+        first = users[0]
+        navigation.append(InlineKeyboardButton(
+            "◀️ Новее", callback_data=f"admin_users_{USERS_NEWER}_{first[4]}_{first[0]}"))
+    if page['has_older'] and users:
+        last = users[-1]
+        navigation.append(InlineKeyboardButton(
+            "Раньше ▶️", callback_data=f"admin_users_{USERS_OLDER}_{last[4]}_{last[0]}"))
+
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("📊 Назад к статистике", callback_data="admin_stats")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def parse_users_page(data):
+    """Разбирает callback_data страницы: (direction, cursor); без курсора - первая страница"""
+    parts = data.split('_')
+    if len(parts) == 5 and parts[2] in (USERS_OLDER, USERS_NEWER):
+        return parts[2], (int(parts[3]), int(parts[4]))
+    return USERS_OLDER, None
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f}" if seconds is not None else "—"
+
+
+def _gauge(name):
+    """Текущие значения метрики из реестра: {labels: value}"""
+    return dict(registry.metrics[name].values())
+
+
+def format_perf_message(top=PERF_TOP):
+    """Сводка метрик с запуска: обработчики и запросы по суммарному времени, очереди, кэши, бэкапы"""
+    message = "⏱️ ПРОИЗВОДИТЕЛЬНОСТЬ (с запуска)\n"
+
+    sections = (
+        ("🤖 Обработчики", handler_seconds, handler_errors),
+        ("🗄️ Запросы к БД", db_query_seconds, db_query_errors),
+    )
+    for title, histogram, errors in sections:
+        rows = summarize(histogram)
+        message += f"\n{title} (вызовы, ср. / p95 / p99 / макс. мс):\n"
+        if not rows:
+            message += "пока нет вызовов\n"
+        for labels, calls, mean, _, p95, p99, peak in rows[:top]:
+            failed = errors.values.get(labels, 0)
+            message += (f"• {' '.join(labels)}: {calls}, {_ms(mean)} / {_ms(p95)} / {_ms(p99)} / {_ms(peak)}"
+                        + (f", ошибок {failed}" if failed else "") + "\n")
+        if len(rows) > top:
+            message += f"… ещё {len(rows) - top}\n"
+
+    slow = db_slow_queries.values.get((), 0)
+    if slow:
+        message += f"🐢 Медленных операторов: {slow} (подробности в логе)\n"
+
+    queues = (
+        ("update_queue", _gauge('bot_update_queue_size').get(())),
+        ("пользователей в обработке", _gauge('bot_user_queues').get(())),
+        ("очередь отправки", _gauge('send_queue_size').get(())),
+    )
+    message += "\n📬 Очереди: " + ", ".join(f"{name} {value}" for name, value in queues if value is not None) + "\n"
+
+    hits, misses = _gauge('cache_hits_total'), _gauge('cache_misses_total')
+    message += "\n🧠 Кэши:\n"
+    for labels, size in _gauge('cache_size').items():
+        lookups = hits.get(labels, 0) + misses.get(labels, 0)
+        hit_rate = f"{hits.get(labels, 0) / lookups:.0%}" if lookups else "—"
+        message += f"• {labels[0]}: {size} записей, попаданий {hit_rate} из {lookups}\n"
+
+    backups = {labels[0]: row for labels, *row in summarize(backup_seconds)}
+    if backups:
+        message += "\n💾 Бэкапы (ср. / макс. с):\n"
+        for stage in ('copy', 'verify', 'write', 'total'):
+            if stage in backups:
+                calls, mean, *_, peak = backups[stage]
+                message += f"• {stage}: {mean:.2f} / {peak:.2f} ({calls})\n"
+
+    return message
+
+
 def format_user_details(stats):
     """Форматирует детальную статистику пользователя"""
     user_info, record_stats, recent_records = stats['user_info'], stats['record_stats'], stats['recent_records']
@@ -224,7 +379,7 @@ def format_user_details(stats):
     message = f"👤 **ДЕТАЛЬНАЯ СТАТИСТИКА ПОЛЬЗОВАТЕЛЯ**{username_display}\n\n"
     message += f"🆔 **ID:** `{user_id}`\n"
     message += f"👤 **Имя:** {name or 'не указано'}\n"
-    message += f"📅 **Регистрация:** {datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}\n\n"
+    message += f"📅 **Регистрация:** {format_samara_time(created_at)}\n\n"
 
     message += "📊 **Статистика записей:**\n"
     message += f"📝 Всего записей: **{total_records}**\n"
@@ -233,21 +388,22 @@ def format_user_details(stats):
     message += f"⬆️ Макс. вес: **{max_weight:.1f} кг**\n"
 
     if first_record and last_record:
-        first = datetime.strptime(first_record, '%Y-%m-%d %H:%M:%S')
-        last = datetime.strptime(last_record, '%Y-%m-%d %H:%M:%S')
+        first = from_ts(first_record)
+        last = from_ts(last_record)
         message += f"📅 Первая запись: **{first.strftime('%d.%m.%Y')}**\n"
         message += f"📅 Последняя запись: **{last.strftime('%d.%m.%Y')}**\n"
         message += f"📆 Период: **{(last - first).days + 1} дней**\n\n"
 
     if recent_records:
         message += "📋 **Последние 10 записей:**\n"
-        for weight, date in recent_records:
-            record_date = datetime.strptime(date, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')
+        for weight, ts in recent_records:
+            record_date = format_samara_time(ts)
             message += f"   • {record_date}: **{weight} кг**\n"
 
     return message
 
 
+@admin_lane
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /stats - общая статистика"""
     user_id = update.effective_user.id
@@ -259,7 +415,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔄 Собираю статистику...")
 
     try:
-        stats = get_db_stats()
+        stats = await get_db_stats()
         message = format_stats_message(stats)
 
         # Кнопки для навигации
@@ -279,6 +435,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"❌ Ошибка: {e}")
 
 
+@admin_lane
 async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /users - список пользователей"""
     user_id = update.effective_user.id
@@ -290,22 +447,14 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("🔄 Загружаю список пользователей...")
 
     try:
-        users = get_users_list(20)
-        message = format_users_list(users)
-
-        # Если сообщение слишком длинное, разбиваем
-        if len(message) > 4000:
-            parts = [message[i:i + 4000] for i in range(0, len(message), 4000)]
-            for part in parts:
-                await update.message.reply_text(part, parse_mode='Markdown')
-        else:
-            await update.message.reply_text(message, parse_mode='Markdown')
-
+        page = await get_users_page()
+        await update.message.reply_text(format_users_page(page), reply_markup=users_page_keyboard(page))
     except Exception as e:
         logger.error(f"Ошибка при получении списка пользователей: {e}")
         await update.message.reply_text(f"❌ Ошибка: {e}")
 
 
+@admin_lane
 async def user_details_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /user <id> - детальная информация о пользователе"""
     user_id = update.effective_user.id
@@ -329,7 +478,7 @@ async def user_details_command(update: Update, context: ContextTypes.DEFAULT_TYP
     await update.message.reply_text(f"🔄 Загружаю статистику пользователя {target_user_id}...")
 
     try:
-        stats = get_detailed_user_stats(target_user_id)
+        stats = await get_detailed_user_stats(target_user_id)
         if not stats:
             await update.message.reply_text(f"❌ Пользователь с ID {target_user_id} не найден")
             return
@@ -342,6 +491,84 @@ async def user_details_command(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(f"❌ Ошибка: {e}")
 
 
+@admin_lane
+async def summary_check_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /summary_check [rebuild] - проверка user_summary и пересборка всех агрегатов"""
+    user_id = update.effective_user.id
+
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда только для администратора")
+        return
+
+    try:
+        if context.args and context.args[0] == 'rebuild':
+            await update.message.reply_text("🔄 Пересобираю сводку пользователей и статистику...")
+            count = await rebuild_aggregates()
+            await update.message.reply_text(f"✅ Сводка пересобрана: {count} пользователей")
+            return
+
+        await update.message.reply_text("🔄 Проверяю сводку пользователей...")
+        drifted = await verify_user_summary()
+        if not drifted:
+            await update.message.reply_text("✅ Сводка совпадает с данными")
+        else:
+            ids = ", ".join(str(uid) for uid in drifted[:20])
+            await update.message.reply_text(
+                f"⚠️ Расхождения у {len(drifted)} пользователей: {ids}\n"
+                f"Исправить: /summary_check rebuild"
+            )
+
+    except Exception as e:
+        logger.error(f"Ошибка при проверке сводки: {e}")
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
+
+@admin_lane
+async def migrations_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /migrations - версии схемы и прогресс фоновых заполнений"""
+    user_id = update.effective_user.id
+
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда только для администратора")
+        return
+
+    try:
+        rows, pending = await get_migrations_status()
+        response = "🧬 МИГРАЦИИ СХЕМЫ\n\n"
+        for version, name, status, done, total, applied_at in rows:
+            if status == 'applied':
+                response += f"✅ v{version} {name} ({format_samara_time(applied_at)})\n"
+            else:
+                percent = f" ({min(100, done * 100 // total)}%)" if total else ""
+                response += f"🔄 v{version} {name}: заполнение {done}/{total or '?'}{percent}\n"
+        for line in pending:
+            response += f"⏳ {line}\n"
+
+        await update.message.reply_text(response)
+
+    except Exception as e:
+        logger.error(f"Ошибка при получении статуса миграций: {e}")
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
+
+@admin_lane
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /perf - задержки обработчиков и запросов, очереди, кэши и бэкапы"""
+    user_id = update.effective_user.id
+
+    if user_id != ADMIN_ID:
+        await update.message.reply_text("⛔ Эта команда только для администратора")
+        return
+
+    try:
+        # Без Markdown: в именах обработчиков и запросов есть подчёркивания
+        await update.message.reply_text(format_perf_message())
+    except Exception as e:
+        logger.error(f"Ошибка при получении метрик: {e}")
+        await update.message.reply_text(f"❌ Ошибка: {e}")
+
+
+@admin_lane
 async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик callback-кнопок для админ-панели"""
     query = update.callback_query
@@ -357,31 +584,9 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
     try:
         if query.data == "admin_stats":
             logger.info("📊 Обработка admin_stats")
-            stats = get_db_stats()
-
-            # Простое форматирование без Markdown
-            message = "📊 ОБЩАЯ СТАТИСТИКА БОТА\n\n"
-            message += f"👥 Всего пользователей: {stats['total_users']}\n"
-            message += f"📝 Всего записей: {stats['total_records']}\n"
-            message += f"📊 Средний вес: {stats['avg_weight']:.1f} кг\n"
-            message += f"⬇️ Мин. вес: {stats['min_weight']:.1f} кг\n"
-            message += f"⬆️ Макс. вес: {stats['max_weight']:.1f} кг\n\n"
-
-            message += "📅 Активность:\n"
-            message += f"🔥 Активных за 7 дней: {stats['active_users_7d']}\n"
-            message += f"📊 Записей за 7 дней: {stats['records_7d']}\n"
-            message += f"📊 Записей за 30 дней: {stats['records_30d']}\n\n"
-
-            if stats['first_record']:
-                first = datetime.strptime(stats['first_record'], '%Y-%m-%d %H:%M:%S')
-                last = datetime.strptime(stats['last_record'], '%Y-%m-%d %H:%M:%S')
-                message += f"🎯 Первая запись: {first.strftime('%d.%m.%Y')}\n"
-                message += f"🎯 Последняя запись: {last.strftime('%d.%m.%Y')}\n"
-                message += f"📆 Всего дней: {(last - first).days + 1}\n\n"
-
-            message += "🏆 Топ-5 пользователей:\n"
-            for i, (uid, count) in enumerate(stats['top_users'], 1):
-                message += f"{i}. ID {uid}: {count} записей\n"
+            stats = await get_db_stats()
+            # Та же сводка, что в /stats, но без Markdown
+            message = format_stats_message(stats, markdown=False)
 
             # Только одна кнопка - список пользователей
             keyboard = [
@@ -394,117 +599,19 @@ async def admin_callback_handler(update: Update, context: ContextTypes.DEFAULT_T
             )
             logger.info("✅ admin_stats обработано")
 
-        elif query.data == "admin_users":
-            logger.info("👥 Обработка admin_users")
-            users = get_users_list(10)
-
-            message = "👥 ПОСЛЕДНИЕ 10 ПОЛЬЗОВАТЕЛЕЙ\n\n"
+        elif query.data.startswith("admin_users"):
+            # admin_users - первая страница, admin_users_<direction>_<created_at>_<user_id> - от курсора
+            # (admin_users_more от старых сообщений тоже открывает первую страницу)
+            logger.info(f"👥 Обработка {query.data}")
+            direction, cursor = parse_users_page(query.data)
+            page = await get_users_page(direction, cursor)
 
-            for user in users:
-                user_id, username, first_name, last_name, created_at, records_count, last_record = user
-
-                name_parts = []
-                if first_name:
-                    name_parts.append(first_name)
-                if last_name:
-                    name_parts.append(last_name)
-                name = " ".join(name_parts) if name_parts else "нет имени"
-
-                username_str = f"@{username}" if username else "нет username"
-                created = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-
-                message += f"🆔 ID: {user_id}\n"
-                message += f"👤 Имя: {name}\n"
-                message += f"📱 Username: {username_str}\n"
-                message += f"📅 Регистрация: {created}\n"
-                message += f"📊 Записей: {records_count}\n"
-
-                if last_record:
-                    last = datetime.strptime(last_record, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-                    message += f"🕐 Последняя запись: {last}\n"
-
-                message += "─" * 30 + "\n"
-
-            # Кнопки: назад к статистике и ещё 10
-            keyboard = [
-                [
-                    InlineKeyboardButton("📊 Назад к статистике", callback_data="admin_stats"),
-                    InlineKeyboardButton("🔄 Ещё 10", callback_data="admin_users_more")
-                ]
-            ]
-
-            # Если сообщение слишком длинное
-            if len(message) > 4000:
-                await query.edit_message_text(
-                    text="👥 Список пользователей (первые 4000 символов):",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-                await context.bot.send_message(
-                    chat_id=ADMIN_ID,
-                    text=message[:4000]
-                )
-            else:
-                await query.edit_message_text(
-                    text=message,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
+            await query.edit_message_text(
+                text=format_users_page(page),
+                reply_markup=users_page_keyboard(page)
+            )
             logger.info("✅ admin_users обработано")
 
-        elif query.data == "admin_users_more":
-            logger.info("👥 Обработка admin_users_more")
-            users = get_users_list(20)
-
-            message = "👥 ПОЛНЫЙ СПИСОК ПОЛЬЗОВАТЕЛЕЙ (20)\n\n"
-
-            for user in users:
-                user_id, username, first_name, last_name, created_at, records_count, last_record = user
-
-                name_parts = []
-                if first_name:
-                    name_parts.append(first_name)
-                if last_name:
-                    name_parts.append(last_name)
-                name = " ".join(name_parts) if name_parts else "нет имени"
-
-                username_str = f"@{username}" if username else "нет username"
-                created = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-
-                message += f"🆔 ID: {user_id}\n"
-                message += f"👤 Имя: {name}\n"
-                message += f"📱 Username: {username_str}\n"
-                message += f"📅 Регистрация: {created}\n"
-                message += f"📊 Записей: {records_count}\n"
-
-                if last_record:
-                    last = datetime.strptime(last_record, '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y')
-                    message += f"🕐 Последняя запись: {last}\n"
-
-                message += "─" * 30 + "\n"
-
-            # Только кнопка назад к статистике
-            keyboard = [
-                [InlineKeyboardButton("📊 Назад к статистике", callback_data="admin_stats")]
-            ]
-
-            if len(message) > 4000:
-                await query.edit_message_text(
-                    text="👥 Полный список пользователей (первые 4000 символов):",
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-                # Отправляем остаток
-                remaining = message[4000:8000]
-                if remaining:
-                    await context.bot.send_message(
-                        chat_id=ADMIN_ID,
-                        text=remaining
-                    )
-            else:
-                await query.edit_message_text(
-                    text=message,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-            logger.info("✅ admin_users_more обработано")
-
     except Exception as e:
         logger.error(f"❌ Ошибка: {e}")
         await query.edit_message_text(f"❌ Произошла ошибка: {str(e)}")
\ No newline at end of file
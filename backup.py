@@ -2,62 +2,395 @@
 # -*- coding: utf-8 -*-
 """
 🤖 Telegram Weight Tracker - Автобэкапы
-✅ БЕКАП КАЖДУЮ МИНУТУ В ЛИЧКУ АДМИНУ
+✅ БЕКАП ПО РАСПИСАНИЮ (JobQueue бота) В ЛИЧКУ АДМИНУ
 """
 
 import os
+import sys
+import gzip
+import json
+import time
 import shutil
+import struct
+import hashlib
 import sqlite3
 import asyncio
 import logging
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Bot
+from db import DB_PATH
+from timeutils import now_ts
+from metrics import backup_seconds
+from send_queue import PRIORITY_BACKGROUND, send_lane
 
 # ==================== КОНФИГУРАЦИЯ ====================
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 ADMIN_ID = 203790724
-DB_PATH = "data/weight_tracker.db"
 BACKUP_DIR = "backups"
 
+# Копирование идёт шагами по BACKUP_STEP_PAGES страниц с паузой между ними,
+# чтобы бэкап не забирал диск и блокировки у записей пользователей
+BACKUP_STEP_PAGES = int(os.getenv('BACKUP_STEP_PAGES', '1024'))
+BACKUP_STEP_PAUSE = float(os.getenv('BACKUP_STEP_PAUSE', '0.005'))
+# Проверка копии: integrity (полная), quick (quick_check) или off
+BACKUP_VERIFY = os.getenv('BACKUP_VERIFY', 'integrity')
+
+# Цепочка: полный снимок + до BACKUP_CHAIN_LENGTH инкрементов изменившихся страниц.
+# Новая цепочка начинается и раньше, если изменилось больше BACKUP_FULL_RATIO страниц.
+BACKUP_CHAIN_LENGTH = int(os.getenv('BACKUP_CHAIN_LENGTH', '24'))
+BACKUP_FULL_RATIO = float(os.getenv('BACKUP_FULL_RATIO', '0.5'))
+BACKUP_GZIP_LEVEL = int(os.getenv('BACKUP_GZIP_LEVEL', '6'))
+# Хранение: цепочки с точками восстановления за последние N часов / дней / недель
+BACKUP_KEEP_HOURLY = int(os.getenv('BACKUP_KEEP_HOURLY', '24'))
+BACKUP_KEEP_DAILY = int(os.getenv('BACKUP_KEEP_DAILY', '7'))
+BACKUP_KEEP_WEEKLY = int(os.getenv('BACKUP_KEEP_WEEKLY', '4'))
+
+# Расписание автобэкапов (секунды)
+BACKUP_INTERVAL = int(os.getenv('BACKUP_INTERVAL', '21600'))
+BACKUP_JITTER = int(os.getenv('BACKUP_JITTER', '60'))
+BACKUP_MISFIRE_GRACE = int(os.getenv('BACKUP_MISFIRE_GRACE', '600'))
+BACKUP_JOB_NAME = 'backup'
+
+MANIFEST_FILE = 'manifest.json'
+HASHES_FILE = 'hashes.bin'
+_DIFF_MAGIC = b'WTBDIFF1'
+_DIFF_HEADER = struct.Struct('>8sIII')
+_PAGE_NO = struct.Struct('>I')
+
 # Логирование
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('backup')
 
+_backup_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='backup')
+
+
+def _backup_step_pause(status, remaining, total):
+    if remaining and BACKUP_STEP_PAUSE > 0:
+        time.sleep(BACKUP_STEP_PAUSE)
+
+
+def _copy_database(source_path, target_path):
+    """Копирует БД через online backup API SQLite. Возвращает (число страниц, размер страницы)."""
+    source = sqlite3.connect(source_path, isolation_level=None, timeout=30)
+    target = sqlite3.connect(target_path)
+    try:
+        # В WAL открытая транзакция чтения фиксирует снимок: записи бота идут
+        # параллельно и не заставляют копирование начинаться заново
+        wal = source.execute('PRAGMA journal_mode').fetchone()[0].lower() == 'wal'
+        if wal:
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+        source.backup(target, pages=BACKUP_STEP_PAGES, progress=_backup_step_pause)
+        if wal:
+            source.execute('COMMIT')
+
+        # Копия должна быть одним файлом, без -wal/-shm рядом
+        target.execute('PRAGMA journal_mode=DELETE')
+        return (
+            target.execute('PRAGMA page_count').fetchone()[0],
+            target.execute('PRAGMA page_size').fetchone()[0],
+        )
+    finally:
+        target.close()
+        source.close()
+
+
+def verify_backup(path):
+    """Проверяет целостность файла бэкапа, при ошибке бросает sqlite3.DatabaseError"""
+    if BACKUP_VERIFY == 'off':
+        return
+    pragma = 'quick_check' if BACKUP_VERIFY == 'quick' else 'integrity_check'
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute(f'PRAGMA {pragma}').fetchall()
+    finally:
+        conn.close()
+    if result != [('ok',)]:
+        raise sqlite3.DatabaseError(f"{pragma}: " + "; ".join(row[0] for row in result[:5]))
+
+
+def _page_hashes(path, page_size):
+    """Хэши всех страниц файла БД (по 16 байт)"""
+    hashes = []
+    with open(path, 'rb') as f:
+        while True:
+            page = f.read(page_size)
+            if not page:
+                break
+            hashes.append(hashlib.blake2b(page, digest_size=16).digest())
+    return hashes
+
+
+def _read_hashes(chain_dir):
+    path = os.path.join(chain_dir, HASHES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f:
+        data = f.read()
+    return [data[i:i + 16] for i in range(0, len(data), 16)]
+
+
+def _write_atomic(path, data):
+    with open(path + '.part', 'wb') as f:
+        f.write(data)
+    os.replace(path + '.part', path)
+
+
+def _load_manifest(chain_dir):
+    with open(os.path.join(chain_dir, MANIFEST_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_manifest(chain_dir, manifest):
+    data = json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8')
+    _write_atomic(os.path.join(chain_dir, MANIFEST_FILE), data)
+
+
+def list_chains():
+    """Цепочки бэкапов [(папка, manifest), ...] от старых к новым"""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    chains = []
+    for name in os.listdir(BACKUP_DIR):
+        chain_dir = os.path.join(BACKUP_DIR, name)
+        if name.startswith('chain_') and os.path.exists(os.path.join(chain_dir, MANIFEST_FILE)):
+            chains.append((chain_dir, _load_manifest(chain_dir)))
+    # По времени первого бэкапа; в одну секунду - по имени с микросекундами
+    chains.sort(key=lambda chain: (chain[1]['entries'][0]['created'] if chain[1]['entries'] else 0, chain[0]))
+    return chains
+
+
+def _write_full(snapshot, target):
+    """Полный снимок: gzip файла БД. Возвращает (байт до сжатия, байт на диске)."""
+    with open(snapshot, 'rb') as src, gzip.open(target + '.part', 'wb', compresslevel=BACKUP_GZIP_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(target + '.part', target)
+    return os.path.getsize(snapshot), os.path.getsize(target)
+
+
+def _write_diff(snapshot, target, page_size, page_count, changed):
+    """Инкремент: изменившиеся страницы. Формат (внутри gzip):
+    заголовок (magic, page_size, page_count, число страниц), затем номер + страница."""
+    payload = _DIFF_HEADER.size
+    with open(snapshot, 'rb') as src, gzip.open(target + '.part', 'wb', compresslevel=BACKUP_GZIP_LEVEL) as dst:
+        dst.write(_DIFF_HEADER.pack(_DIFF_MAGIC, page_size, page_count, len(changed)))
+        for page_no in changed:
+            src.seek(page_no * page_size)
+            dst.write(_PAGE_NO.pack(page_no))
+            dst.write(src.read(page_size))
+            payload += _PAGE_NO.size + page_size
+    os.replace(target + '.part', target)
+    return payload, os.path.getsize(target)
+
 
-def create_backup():
-    """Создает копию БД"""
+def _retained_chains(chains, now):
+    """Папки цепочек, которые нужно оставить: текущая и те, где есть точка
+    восстановления из последних N часов / дней / недель"""
+    keep = {chains[-1][0]} if chains else set()
+    points = sorted(
+        ((entry['created'], chain_dir) for chain_dir, manifest in chains for entry in manifest['entries']),
+        reverse=True
+    )
+    for span, count in ((3600, BACKUP_KEEP_HOURLY), (86400, BACKUP_KEEP_DAILY), (7 * 86400, BACKUP_KEEP_WEEKLY)):
+        slots = set()
+        for created, chain_dir in points:
+            slot = (now - created) // span
+            if slot >= count:
+                break
+            if slot not in slots:
+                slots.add(slot)
+                keep.add(chain_dir)
+    return keep
+
+
+def apply_retention(now=None):
+    """Удаляет цепочки, не попавшие в политику хранения. Возвращает число удалённых."""
+    chains = list_chains()
+    keep = _retained_chains(chains, now or now_ts())
+    removed = 0
+    for chain_dir, _ in chains:
+        if chain_dir not in keep:
+            shutil.rmtree(chain_dir)
+            removed += 1
+            logger.info(f"🗑️ Удалена старая цепочка бэкапов {os.path.basename(chain_dir)}")
+    return removed
+
+
+def create_backup(full=False):
+    """Создает согласованную копию БД (online backup API), проверяет её
+    и сохраняет в текущую цепочку: полным снимком или инкрементом
+    изменившихся страниц. Возвращает запись manifest с путём 'path'."""
     os.makedirs(BACKUP_DIR, exist_ok=True)
     if not os.path.exists(DB_PATH):
         return None
 
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_file = os.path.join(BACKUP_DIR, f'weight_backup_{timestamp}.db')
-    shutil.copy2(DB_PATH, backup_file)
-    return backup_file
+    created = now_ts()
+    started_at = datetime.now()
+    timestamp = started_at.strftime('%Y%m%d_%H%M%S')
+    snapshot = os.path.join(BACKUP_DIR, f'snapshot_{timestamp}.db.part')
+
+    try:
+        started = time.perf_counter()
+        page_count, page_size = _copy_database(DB_PATH, snapshot)
+        copied = time.perf_counter()
+        verify_backup(snapshot)
+        verified = time.perf_counter()
+        hashes = _page_hashes(snapshot, page_size)
+
+        chains = list_chains()
+        chain_dir, manifest = chains[-1] if chains else (None, None)
+        previous = _read_hashes(chain_dir) if chain_dir else None
+        changed = []
+        if previous is not None and manifest['page_size'] == page_size:
+            changed = [i for i, h in enumerate(hashes) if i >= len(previous) or previous[i] != h]
+
+        start_chain = (
+            full
+            or previous is None
+            or manifest['page_size'] != page_size
+            or len(manifest['entries']) > BACKUP_CHAIN_LENGTH
+            or len(changed) > page_count * BACKUP_FULL_RATIO
+        )
+        if start_chain:
+            # Микросекунды в имени: две цепочки за одну секунду (ручной /backup
+            # во время планового) не совпадают и сортируются по времени
+            chain_dir = os.path.join(BACKUP_DIR, f'chain_{timestamp}_{started_at:%f}')
+            os.makedirs(chain_dir)
+            manifest = {'page_size': page_size, 'entries': []}
+            name = f'{len(manifest["entries"]):03d}_full_{timestamp}.db.gz'
+            payload, stored = _write_full(snapshot, os.path.join(chain_dir, name))
+            kind, pages = 'full', page_count
+        else:
+            name = f'{len(manifest["entries"]):03d}_incr_{timestamp}.diff.gz'
+            payload, stored = _write_diff(snapshot, os.path.join(chain_dir, name), page_size, page_count, changed)
+            kind, pages = 'incr', len(changed)
+    finally:
+        if os.path.exists(snapshot):
+            os.remove(snapshot)
+
+    entry = {
+        'file': name,
+        'kind': kind,
+        'created': created,
+        'page_count': page_count,
+        'pages': pages,
+        'db_bytes': page_count * page_size,
+        'payload_bytes': payload,
+        'stored_bytes': stored,
+    }
+    manifest['entries'].append(entry)
+    # Хэши пишутся до manifest: при сбое между ними следующий бэкап начнёт новую цепочку
+    _write_atomic(os.path.join(chain_dir, HASHES_FILE), b''.join(hashes))
+    _save_manifest(chain_dir, manifest)
+    finished = time.perf_counter()
+    backup_seconds.observe(copied - started, 'copy')
+    backup_seconds.observe(verified - copied, 'verify')
+    backup_seconds.observe(finished - verified, 'write')
+    backup_seconds.observe(finished - started, 'total')
+
+    logger.info(
+        f"✅ Бэкап {os.path.basename(chain_dir)}/{name}: {kind}, {pages}/{page_count} страниц, "
+        f"{stored / 1024:.1f} KB (x{entry['db_bytes'] / stored:.1f} к полной копии), "
+        f"копирование {copied - started:.2f} с, проверка {verified - copied:.2f} с, "
+        f"запись {finished - verified:.2f} с"
+    )
+    apply_retention(created)
+    return dict(entry, path=os.path.join(chain_dir, name), chain=os.path.basename(chain_dir))
+
+
+def restore_chain(chain_dir, output, until=None):
+    """Восстанавливает БД из цепочки: полный снимок + инкременты по порядку
+    (до файла until включительно). Результат проверяется integrity_check."""
+    manifest = _load_manifest(chain_dir)
+    entries = manifest['entries']
+    if until is not None:
+        names = [entry['file'] for entry in entries]
+        if until not in names:
+            raise ValueError(f"В цепочке нет файла {until}")
+        entries = entries[:names.index(until) + 1]
+
+    part = output + '.part'
+    with gzip.open(os.path.join(chain_dir, entries[0]['file']), 'rb') as src, open(part, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+    with open(part, 'r+b') as dst:
+        for entry in entries[1:]:
+            with gzip.open(os.path.join(chain_dir, entry['file']), 'rb') as src:
+                magic, page_size, page_count, count = _DIFF_HEADER.unpack(src.read(_DIFF_HEADER.size))
+                if magic != _DIFF_MAGIC:
+                    raise ValueError(f"{entry['file']}: не инкремент бэкапа")
+                for _ in range(count):
+                    page_no, = _PAGE_NO.unpack(src.read(_PAGE_NO.size))
+                    dst.seek(page_no * page_size)
+                    dst.write(src.read(page_size))
+                dst.truncate(page_count * page_size)
+
+    verify_backup(part)
+    os.replace(part, output)
+    return entries[-1]
+
+
+def get_backup_status():
+    """Сводка по цепочкам бэкапов для /backup_status"""
+    chains = list_chains()
+    if not chains:
+        return None
+    chain_dir, manifest = chains[-1]
+    entries = manifest['entries']
+    chain_stored = sum(e['stored_bytes'] for e in entries)
+    return {
+        'chains': len(chains),
+        'chain': os.path.basename(chain_dir),
+        'entries': entries,
+        'chain_stored': chain_stored,
+        'compression': sum(e['payload_bytes'] for e in entries) / chain_stored,
+        'vs_full_copies': sum(e['db_bytes'] for e in entries) / chain_stored,
+        'total_stored': sum(e['stored_bytes'] for _, m in chains for e in m['entries']),
+    }
+
+
+async def _run_in_backup_worker(fn, *args):
+    """Бэкапы выполняются в отдельном потоке по одному: копирование, сжатие
+    и запись цепочки не занимают event loop и не пересекаются между собой"""
+    return await asyncio.get_running_loop().run_in_executor(_backup_executor, fn, *args)
+
+
+async def fetch_backup_status():
+    """get_backup_status в потоке бэкапов: листинг папки и чтение manifest
+    не блокируют event loop и не видят цепочку посреди записи"""
+    return await _run_in_backup_worker(get_backup_status)
 
 
 # ✅ ДОБАВЛЯЕМ ЭТУ ФУНКЦИЮ ДЛЯ backup_command
-def backup_database():
-    """Создает бэкап и возвращает путь к файлу"""
-    return create_backup()
+async def backup_database():
+    """Начинает новую цепочку полным бэкапом и возвращает путь к файлу (None при ошибке)"""
+    try:
+        entry = await _run_in_backup_worker(create_backup, True)
+        return entry['path'] if entry else None
+    except Exception as e:
+        logger.error(f"❌ Ошибка создания бэкапа: {e}")
+        return None
 
 
-async def send_backup():
-    """Создает и отправляет бэкап админу"""
+async def send_backup(bot):
+    """Создает бэкап (полный или инкремент) и отправляет его админу"""
     try:
         # Создаем бэкап
-        backup_file = create_backup()
-        if not backup_file:
+        entry = await _run_in_backup_worker(create_backup)
+        if not entry:
             logger.error("БД не найдена")
             return
 
         # Отправляем
-        bot = Bot(token=TELEGRAM_TOKEN)
-        with open(backup_file, 'rb') as f:
+        kind = "Полный бэкап" if entry['kind'] == 'full' else "Инкремент"
+        with open(entry['path'], 'rb') as f:
             await bot.send_document(
                 chat_id=ADMIN_ID,
                 document=f,
-                caption=f"✅ Бэкап {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}"
+                filename=f"{entry['chain']}_{entry['file']}",
+                caption=f"✅ {kind} {datetime.now().strftime('%d.%m.%Y %H:%M:%S')}\n"
+                        f"🔗 {entry['chain']} | 📄 {entry['pages']} стр. | 📦 {entry['stored_bytes'] / 1024:.1f} KB"
             )
         logger.info(f"✅ Бэкап отправлен админу {ADMIN_ID}")
 
@@ -65,29 +398,60 @@ async def send_backup():
         logger.error(f"❌ Ошибка: {e}")
 
 
-async def main():
-    """Главная функция - бесконечный цикл"""
-    logger.info("🚀 Запуск бэкапов каждую минуту")
-    while True:
-        await send_backup()
-        await asyncio.sleep(21600)  # 1 минута
+async def backup_job(context):
+    """Задача JobQueue: бэкап через общий бот приложения"""
+    with send_lane(PRIORITY_BACKGROUND):
+        await send_backup(context.bot)
 
 
-def start_backup_scheduler():
-    """Запускает планировщик бэкапов"""
-    logger.info("🚀 ЗАПУСК ПЛАНИРОВЩИКА БЭКАПОВ (1 МИНУТА)")
+def _last_backup_ts():
+    chains = list_chains()
+    return chains[-1][1]['entries'][-1]['created'] if chains else None
 
-    # Создаём и запускаем поток с asyncio
-    import threading
-    def run_async():
-        asyncio.run(main())
 
-    thread = threading.Thread(target=run_async, daemon=True)
-    thread.start()
+def schedule_backups(application):
+    """Ставит автобэкапы в JobQueue приложения.
+    Если с последнего бэкапа прошло больше интервала (бот был выключен),
+    первый бэкап делается сразу, иначе - когда подойдёт срок."""
+    if application.job_queue is None:
+        logger.error("❌ JobQueue недоступна: установите python-telegram-bot[job-queue]")
+        return None
+
+    last = _last_backup_ts()
+    first = 0 if last is None else max(0, last + BACKUP_INTERVAL - now_ts())
+    job = application.job_queue.run_repeating(
+        backup_job,
+        interval=BACKUP_INTERVAL,
+        first=first,
+        name=BACKUP_JOB_NAME,
+        job_kwargs={
+            # Разброс старта, чтобы бэкап не совпадал с другими задачами по расписанию
+            'jitter': BACKUP_JITTER,
+            # Пропущенные запуски (event loop был занят) выполняются один раз,
+            # если опоздание не больше BACKUP_MISFIRE_GRACE
+            'misfire_grace_time': BACKUP_MISFIRE_GRACE,
+            'coalesce': True,
+            'max_instances': 1,
+        },
+    )
+    logger.info(f"🚀 Автобэкапы каждые {BACKUP_INTERVAL // 60} мин, первый через {first // 60} мин")
+    return job
+
+
+async def _backup_once():
+    async with Bot(token=TELEGRAM_TOKEN) as bot:
+        await send_backup(bot)
 
 
 if __name__ == "__main__":
+    # Восстановление: python backup.py restore backups/chain_... output.db [файл_до_которого]
+    if len(sys.argv) >= 4 and sys.argv[1] == 'restore':
+        last = restore_chain(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+        print(f"✅ БД восстановлена в {sys.argv[3]} (точка {last['file']})")
+        exit(0)
+
+    # Разовый бэкап с отправкой админу (например, из cron)
     if not TELEGRAM_TOKEN:
         print("❌ TELEGRAM_TOKEN не найден!")
         exit(1)
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(_backup_once())
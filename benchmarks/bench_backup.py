@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк бэкапа: shutil.copy2 vs online backup API SQLite
+Строит синтетическую БД на N записей, открывает её в WAL через пул db.py и
+делает бэкап обоими способами, пока пользователи пишут вес.
+Показывает время бэкапа, задержки record_weight во время него и сколько
+записей попало в копию.
+
+Запуск: python benchmarks/bench_backup.py [records] [users]
+(например: python benchmarks/bench_backup.py 10000000 50000)
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import backup
+from timeutils import now_ts
+from bench_stats import build_db
+
+
+async def write_load(stop, latencies):
+    """Пользователи отправляют вес, пока идёт бэкап"""
+    i = 0
+    while not stop.is_set():
+        t = time.perf_counter()
+        await db.record_weight(i % 1000 + 1, 'bench', 'Bench', None, 70 + i % 50, now_ts())
+        latencies.append(time.perf_counter() - t)
+        i += 1
+        await asyncio.sleep(0.002)
+
+
+async def run_with_load(fn):
+    stop = asyncio.Event()
+    latencies = []
+    writer = asyncio.create_task(write_load(stop, latencies))
+    await asyncio.sleep(0.2)
+    t = time.perf_counter()
+    result = await asyncio.to_thread(fn)
+    elapsed = time.perf_counter() - t
+    stop.set()
+    await writer
+    latencies.sort()
+    return result, elapsed, latencies
+
+
+def inspect_copy(path):
+    """(записей в копии, результат integrity_check)"""
+    conn = sqlite3.connect(path)
+    try:
+        records = conn.execute('SELECT COUNT(*) FROM weight_records').fetchone()[0]
+        return records, conn.execute('PRAGMA integrity_check').fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        return 0, str(e)
+    finally:
+        conn.close()
+
+
+def report(title, elapsed, latencies, path):
+    p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+    worst = latencies[-1] * 1000 if latencies else 0
+    records, integrity = inspect_copy(path)
+    print(f"{title}: {elapsed:.2f} с | record_weight p50 {p50:.1f} мс, max {worst:.1f} мс "
+          f"| записей в копии {records:,d}, integrity_check: {integrity}")
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        t = time.perf_counter()
+        build_db(path, records, users)
+        print(f"🏗️ БД на {records:,d} записей / {users:,d} пользователей построена за {time.perf_counter() - t:.1f} с")
+
+        db.pool = db.ConnectionPool(path)
+        db.pool.open()
+        backup.DB_PATH = path
+        backup.BACKUP_DIR = os.path.join(tmp, 'backups')
+        print(f"📦 Размер БД: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        async def bench():
+            # Записи после последнего чекпоинта лежат в -wal: copy2 их не видит
+            copy_file = os.path.join(tmp, 'copy2.db')
+            _, elapsed, latencies = await run_with_load(lambda: shutil.copy2(path, copy_file))
+            report("🐢 shutil.copy2      ", elapsed, latencies, copy_file)
+
+            entry, elapsed, latencies = await run_with_load(backup.create_backup)
+            # Бэкап - сжатый элемент цепочки: для проверки восстанавливаем его в обычный файл
+            restored = os.path.join(tmp, 'restored.db')
+            backup.restore_chain(os.path.join(backup.BACKUP_DIR, entry['chain']), restored, entry['file'])
+            report("🚀 backup API + check", elapsed, latencies, restored)
+
+            total = await db.pool.read(lambda conn: conn.execute('SELECT COUNT(*) FROM weight_records').fetchone()[0])
+            print(f"📊 Записей в живой БД после обоих бэкапов: {total:,d}")
+
+        asyncio.run(bench())
+        db.close_db()
+
+
+if __name__ == '__main__':
+    main()
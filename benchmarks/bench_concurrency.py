@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Нагрузочный тест параллельной обработки обновлений
+Запускает бота в webhook-режиме против заглушки Bot API с задержкой ответа
+(как у настоящего Telegram) при разных UPDATE_CONCURRENCY. Каждый пользователь
+отправляет все сообщения сразу; проверяется, что ответы пришли в том же порядке.
+
+Запуск: python benchmarks/bench_concurrency.py [users] [updates_per_user] [api_latency_ms]
+"""
+
+import re
+import sys
+import asyncio
+import tempfile
+
+from bench_webhook import run_mode, synthetic_updates, chat_of, percentile
+
+LEVELS = (1, 4, 16, 64)
+
+
+def check_order(updates, api):
+    """Число пользователей, у которых ответы пришли не в порядке отправки"""
+    sent = {}
+    for update in updates:
+        sent.setdefault(chat_of(update), []).append(float(update['message']['text']))
+    broken = 0
+    for chat_id, weights in sent.items():
+        replied = [float(m.group(1)) for m in (re.search(r'Вес: ([\d.]+) кг', t) for t in api.replies.get(chat_id, [])) if m]
+        if replied != weights:
+            broken += 1
+    return broken
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    api_latency = (float(sys.argv[3]) if len(sys.argv) > 3 else 50) / 1000
+    updates = list(synthetic_updates(users, per_user))
+
+    print(f"📨 Обновлений: {len(updates)}, задержка Bot API: {api_latency * 1000:.0f} мс")
+    with tempfile.TemporaryDirectory() as tmp:
+        base = None
+        for level in LEVELS:
+            rate, latencies, api = asyncio.run(run_mode(
+                'webhook', updates, tmp, {'UPDATE_CONCURRENCY': str(level), 'DB_PATH': f'{tmp}/c{level}.db'},
+                api_latency=api_latency, burst=True
+            ))
+            base = base or rate
+            print(f"⚡ UPDATE_CONCURRENCY={level:3d}: {rate:6.0f} обновлений/с (x{rate / base:.1f}) | "
+                  f"p50 {percentile(latencies, 0.5) * 1000:.0f} мс, p99 {percentile(latencies, 0.99) * 1000:.0f} мс "
+                  f"| порядок нарушен у {check_order(updates, api)} польз.")
+
+
+if __name__ == '__main__':
+    main()
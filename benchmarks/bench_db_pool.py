@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк доступа к БД: sqlite3.connect на каждый вызов vs пул db.py
+Симулирует N одновременных пользователей, каждый отправляет вес M раз
+(register_user + get_last_weight + save_weight + ответ в Telegram;
+в пуле это одна транзакция record_weight).
+
+Запуск: python benchmarks/bench_db_pool.py [users] [updates_per_user]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import migrations
+
+REPLY_LATENCY = 0.005  # имитация сетевого вызова reply_text
+TS = 1704096000
+
+
+def old_register_user(path, user_id):
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT OR IGNORE INTO users (user_id, username, first_name, last_name) VALUES (?, ?, ?, ?)',
+                 (user_id, 'bench', 'Bench', None))
+    conn.commit()
+    conn.close()
+
+
+def old_get_last_weight(path, user_id):
+    conn = sqlite3.connect(path)
+    result = conn.execute('SELECT weight, ts, id FROM weight_records WHERE user_id = ? ORDER BY ts DESC LIMIT 1',
+                          (user_id,)).fetchone()
+    conn.close()
+    return result
+
+
+def old_save_weight(path, user_id, weight):
+    conn = sqlite3.connect(path)
+    conn.execute('INSERT INTO weight_records (user_id, weight, ts) VALUES (?, ?, ?)', (user_id, weight, TS))
+    conn.commit()
+    conn.close()
+
+
+async def old_update(path, user_id, weight):
+    old_register_user(path, user_id)
+    old_get_last_weight(path, user_id)
+    old_save_weight(path, user_id, weight)
+    await asyncio.sleep(REPLY_LATENCY)
+
+
+async def new_update(path, user_id, weight):
+    await db.record_weight(user_id, 'bench', 'Bench', None, weight, TS)
+    await asyncio.sleep(REPLY_LATENCY)
+
+
+async def simulate(handler, path, users, per_user):
+    async def user_loop(user_id):
+        for i in range(per_user):
+            await handler(path, user_id, 70 + i * 0.1)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user_loop(uid) for uid in range(1, users + 1)))
+    return users * per_user / (time.perf_counter() - start)
+
+
+def fresh_db(directory, name):
+    path = os.path.join(directory, name)
+    db.pool = db.ConnectionPool(path)
+    migrations.init_db()
+    return path
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = fresh_db(tmp, 'old.db')
+        db.close_db()
+        before = asyncio.run(simulate(old_update, path, users, per_user))
+
+        path = fresh_db(tmp, 'new.db')
+        after = asyncio.run(simulate(new_update, path, users, per_user))
+        db.close_db()
+
+    print(f"👥 Пользователей: {users}, обновлений на пользователя: {per_user}")
+    print(f"🐢 До (connect на каждый вызов): {before:.0f} обновлений/с")
+    print(f"🚀 После (пул db.py):            {after:.0f} обновлений/с")
+    print(f"📈 Ускорение: x{after / before:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк группового коммита: COMMIT на каждую запись vs пачки
+Пользователи одновременно отправляют вес (record_weight) при synchronous=FULL,
+каждый ждёт подтверждения перед следующей отправкой. Считаются пропускная
+способность, время ответа, размер пачек и время COMMIT.
+
+Запуск: python benchmarks/bench_group_commit.py [users] [updates_per_user] [interval_ms] [batch]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import migrations
+
+TS = 1704096000
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def simulate(users, per_user):
+    latencies = []
+
+    async def user_loop(user_id):
+        for i in range(per_user):
+            started = time.perf_counter()
+            previous, _ = await db.record_weight(user_id, 'bench', 'Bench', None, 70 + i * 0.1, TS + i * 60)
+            latencies.append(time.perf_counter() - started)
+            if i and previous is None:
+                raise AssertionError(f"Пользователь {user_id}: потеряна предыдущая запись")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user_loop(uid) for uid in range(1, users + 1)))
+    elapsed = time.perf_counter() - start
+
+    stored = await db.pool.read(lambda conn: conn.execute('SELECT COUNT(*) FROM weight_records').fetchone()[0])
+    if stored != users * per_user:
+        raise AssertionError(f"Сохранено {stored} записей из {users * per_user}")
+    return users * per_user / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def run(tmp, name, interval, batch, users, per_user):
+    db.pool = db.ConnectionPool(os.path.join(tmp, name), pragmas=db.get_storage_pragmas('durable'),
+                                group_interval=interval, group_size=batch)
+    migrations.init_db()
+    result = asyncio.run(simulate(users, per_user))
+    stats = db.pool.group_commit_stats()
+    db.close_db()
+    return result, stats
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    interval = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.002
+    batch = int(sys.argv[4]) if len(sys.argv) > 4 else db.DB_GROUP_COMMIT_BATCH
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(tmp, 'single.db', 0, batch, users, per_user)
+        after = run(tmp, 'grouped.db', interval, batch, users, per_user)
+
+    print(f"👥 Пользователей: {users}, отправок веса на пользователя: {per_user} (synchronous=FULL)")
+    for title, ((rate, p50, p99), _) in (("🐢 COMMIT на запись ", before),
+                                         (f"🚀 Пачки ({interval * 1000:g} мс/{batch})", after)):
+        print(f"{title}: {rate:.0f} записей/с | ответ p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс")
+    stats = after[1]
+    print(f"📦 Пачек {stats['batches']}: ср. {stats['avg_batch']:.1f}, макс. {stats['max_batch']} | "
+          f"COMMIT ср. {stats['avg_commit_ms']:.2f} мс, макс. {stats['max_commit_ms']:.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
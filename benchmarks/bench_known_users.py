@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк регистрации: INSERT OR IGNORE на каждое сообщение vs known_users
+Каждый пользователь несколько раз отправляет /start и вес; иногда меняет имя.
+Считаются транзакции записи и пропускная способность.
+
+Запуск: python benchmarks/bench_known_users.py [users] [messages_per_user]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import migrations
+from cache import LRUCache
+from bench_recent_cache import NoCache, CountingPool
+
+TS = 1704096000
+
+
+async def simulate(users, per_user):
+    rnd = random.Random(42)
+
+    async def user_loop(user_id):
+        name = f'user{user_id}'
+        for i in range(per_user):
+            if rnd.random() < 0.02:
+                name = f'user{user_id}_{i}'
+            if rnd.random() < 0.3:
+                await db.register_user(user_id, 'bench', name, None)
+            else:
+                await db.record_weight(user_id, 'bench', name, None, 70 + i * 0.1, TS + i * 60)
+        return name
+
+    start = time.perf_counter()
+    names = await asyncio.gather(*(user_loop(uid) for uid in range(1, users + 1)))
+    elapsed = time.perf_counter() - start
+
+    stored = await db.pool.read(lambda conn: dict(conn.execute('SELECT user_id, first_name FROM users')))
+    stale = sum(1 for uid, name in enumerate(names, 1) if stored.get(uid) != name)
+    return users * per_user / elapsed, stale
+
+
+def run(tmp, name, cache, users, per_user):
+    db.pool = CountingPool(os.path.join(tmp, name))
+    db.known_users = cache
+    migrations.init_db()
+    rate, stale = asyncio.run(simulate(users, per_user))
+    writes = db.pool.writes
+    db.close_db()
+    return rate, writes, stale
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(tmp, 'nocache.db', NoCache(1), users, per_user)
+        after = run(tmp, 'cache.db', LRUCache(db.KNOWN_USERS_SIZE), users, per_user)
+
+    print(f"👥 Пользователей: {users}, сообщений на пользователя: {per_user} (30% - /start)")
+    for title, (rate, writes, stale) in (("🐢 Без known_users", before), ("🚀 С known_users ", after)):
+        print(f"{title}: {rate:.0f} сообщений/с | транзакций записи {writes} | устаревших имён {stale}")
+
+
+if __name__ == '__main__':
+    main()
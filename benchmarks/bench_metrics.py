@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк накладных расходов метрик
+Сколько стоит одно наблюдение гистограммы, обёртка обработчика
+(timed_handler) и замер запроса в пуле БД, и сколько занимает снятие /metrics.
+
+Запуск: python benchmarks/bench_metrics.py [iterations]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import metrics
+
+
+def per_call(fn, iterations):
+    started = time.perf_counter()
+    fn(iterations)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def bench_observe(iterations):
+    histogram = metrics.Histogram('bench_seconds', 'bench', ('handler',))
+
+    def run(n):
+        for i in range(n):
+            histogram.observe(0.003, 'handle_weight_message')
+    return per_call(run, iterations)
+
+
+def bench_handler(iterations):
+    async def handler(update, context):
+        return None
+
+    wrapped = metrics.timed_handler('bench_handler', handler)
+
+    def run_with(callback):
+        async def loop(n):
+            for _ in range(n):
+                await callback(None, None)
+        return lambda n: asyncio.run(loop(n))
+
+    return per_call(run_with(handler), iterations), per_call(run_with(wrapped), iterations)
+
+
+def bench_pool(iterations):
+    def noop(conn):
+        return None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = db.ConnectionPool(os.path.join(tmp, 'bench.db'), readers=1)
+        pool.open()
+        readers = pool._reader_conns
+
+        def bare(n):
+            # То же, что _run_read, без замера
+            for _ in range(n):
+                conn = readers.get()
+                try:
+                    noop(conn)
+                finally:
+                    readers.put(conn)
+
+        def timed(n):
+            for _ in range(n):
+                pool._run_read(noop, ())
+
+        result = per_call(bare, iterations), per_call(timed, iterations)
+        pool.close()
+    return result
+
+
+def bench_render(series):
+    for i in range(series):
+        metrics.handler_seconds.observe(0.001 * (i % 50), f'handler_{i}')
+    started = time.perf_counter()
+    body = metrics.registry.render()
+    return (time.perf_counter() - started) * 1000, len(body)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    observe = bench_observe(iterations)
+    bare_handler, wrapped_handler = bench_handler(iterations)
+    bare_query, timed_query = bench_pool(iterations)
+    render_ms, render_bytes = bench_render(50)
+
+    print(f"🔁 Итераций: {iterations}")
+    print(f"📊 Histogram.observe: {observe:.2f} мкс")
+    print(f"🤖 Обработчик: {bare_handler:.2f} -> {wrapped_handler:.2f} мкс "
+          f"(+{wrapped_handler - bare_handler:.2f} мкс на обновление)")
+    print(f"🗄️ Запрос в пуле: {bare_query:.2f} -> {timed_query:.2f} мкс "
+          f"(+{timed_query - bare_query:.2f} мкс на запрос)")
+    print(f"📈 /metrics для 50 обработчиков: {render_ms:.2f} мс, {render_bytes / 1024:.1f} KB")
+
+
+if __name__ == '__main__':
+    main()
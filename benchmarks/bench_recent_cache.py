@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк кэша последних записей: горячий путь без кэша и с кэшем
+Каждый пользователь M раз отправляет вес (record_weight), иногда смотрит
+/last и /history. Считаются обращения к пулу БД и пропускная способность.
+
+Запуск: python benchmarks/bench_recent_cache.py [users] [updates_per_user]
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import migrations
+from cache import LRUCache
+
+TS = 1704096000
+
+
+class NoCache(LRUCache):
+    """Кэш, который ничего не хранит: поведение до появления кэша"""
+
+    def set(self, key, value):
+        pass
+
+
+class CountingPool(db.ConnectionPool):
+    def __init__(self, path):
+        super().__init__(path)
+        self.reads = 0
+        self.writes = 0
+
+    async def read(self, fn, *args):
+        self.reads += 1
+        return await super().read(fn, *args)
+
+    async def write(self, fn, *args):
+        self.writes += 1
+        return await super().write(fn, *args)
+
+
+async def simulate(users, per_user):
+    rnd = random.Random(42)
+
+    async def user_loop(user_id):
+        for i in range(per_user):
+            previous, _ = await db.record_weight(user_id, 'bench', 'Bench', None, 70 + i * 0.1, TS + i * 60)
+            if i and previous is None:
+                raise AssertionError(f"Пользователь {user_id}: потеряна предыдущая запись")
+            if rnd.random() < 0.2:
+                await db.get_last_weight(user_id)
+            if rnd.random() < 0.1:
+                await db.get_weight_history(user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user_loop(uid) for uid in range(1, users + 1)))
+    return users * per_user / (time.perf_counter() - start)
+
+
+def run(tmp, name, cache, users, per_user):
+    db.pool = CountingPool(os.path.join(tmp, name))
+    db.recent_cache = cache
+    migrations.init_db()
+    rate = asyncio.run(simulate(users, per_user))
+    pool, stats = db.pool, db.recent_cache.stats()
+    db.close_db()
+    return rate, pool.reads, pool.writes, stats
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = run(tmp, 'nocache.db', NoCache(1), users, per_user)
+        after = run(tmp, 'cache.db', LRUCache(db.RECENT_CACHE_SIZE, db.RECENT_CACHE_TTL), users, per_user)
+
+    print(f"👥 Пользователей: {users}, отправок веса на пользователя: {per_user}")
+    for title, (rate, reads, writes, stats) in (("🐢 Без кэша", before), ("🚀 С кэшем ", after)):
+        print(f"{title}: {rate:.0f} отправок/с | чтений пула {reads}, записей {writes} | "
+              f"попаданий {stats['hit_rate']:.0%}")
+
+
+if __name__ == '__main__':
+    main()
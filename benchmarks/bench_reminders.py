@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк напоминаний: выборка по индексу минуты vs полный просмотр reminders
+Строит БД на N подписчиков (часть выбрала популярные 07:00-09:00, часть уже
+взвесилась сегодня), сравнивает стоимость минутной выборки и проводит рассылку
+самой загруженной минуты через SendQueue и заглушку Bot API из bench_webhook.
+
+Запуск: python benchmarks/bench_reminders.py [users] [send_rate] [api_latency_ms]
+send_rate - лимит SendQueue, сообщений/с (по умолчанию 1000, у Telegram ~30)
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+SEND_RATE = sys.argv[2] if len(sys.argv) > 2 else '1000'
+# Лимиты читаются при импорте send_queue
+os.environ.setdefault('SEND_GLOBAL_RATE', SEND_RATE)
+os.environ.setdefault('SEND_GLOBAL_BURST', SEND_RATE)
+
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+import db
+import migrations
+import reminders
+from send_queue import SendQueue
+from timeutils import MINUTES_PER_DAY, now_ts, local_day_bounds, utc_minute_of_day
+from bench_webhook import FakeBotApi, TOKEN
+
+RUNS = 5
+WEIGHED_TODAY = 0.3
+
+
+def build_db(path, users):
+    """Возвращает (utc-минута пика, подписчики пика, из них ещё не взвесившиеся)"""
+    conn = sqlite3.connect(path)
+    migrations._apply_pending(conn)
+    rnd = random.Random(42)
+    popular = [7 * 60 + 15 * i for i in range(9)]
+    rows = []
+    for uid in range(1, users + 1):
+        local = rnd.choice(popular) if rnd.random() < 0.4 else rnd.randrange(MINUTES_PER_DAY)
+        rows.append((uid, local, utc_minute_of_day(local)))
+    conn.executemany('INSERT INTO users (user_id, first_name) VALUES (?, ?)',
+                     ((uid, f'user{uid}') for uid, _, _ in rows))
+    conn.executemany('INSERT INTO reminders (user_id, local_minute, utc_minute) VALUES (?, ?, ?)', rows)
+
+    weighed = {uid for uid, _, _ in rows if rnd.random() < WEIGHED_TODAY}
+    conn.executemany('''
+        INSERT INTO user_summary (user_id, records_count, weight_sum, min_weight, max_weight,
+                                  first_ts, last_ts, last_weight, last_record_id)
+        VALUES (?, 1, 70, 70, 70, ?, ?, 70, 0)
+    ''', ((uid, now_ts(), now_ts()) for uid in weighed))
+    conn.commit()
+    conn.close()
+
+    counts = {}
+    for uid, _, utc in rows:
+        counts.setdefault(utc, []).append(uid)
+    peak = max(counts, key=lambda m: len(counts[m]))
+    due = [uid for uid in counts[peak] if uid not in weighed]
+    return peak, len(counts[peak]), due
+
+
+def scan_due(conn, minute, after, limit):
+    """Та же выборка без индекса по минуте: каждый тик читает всю таблицу"""
+    return [row[0] for row in conn.execute('''
+        SELECT r.user_id
+        FROM reminders r NOT INDEXED
+        LEFT JOIN user_summary s ON s.user_id = r.user_id
+        WHERE r.utc_minute = ? AND r.user_id > ?
+          AND (s.last_ts IS NULL OR s.last_ts < ? - r.local_minute * 60)
+        ORDER BY r.user_id
+        LIMIT ?
+    ''', (minute % MINUTES_PER_DAY, after, minute * 60, limit))]
+
+
+def today_minute(utc_minute):
+    """Минута Unix сегодняшнего местного дня с минутой суток UTC utc_minute"""
+    minute = local_day_bounds(now_ts())[1] // 60
+    return minute + (utc_minute - minute) % MINUTES_PER_DAY
+
+
+def measure_tick(conn, query, minute):
+    best = float('inf')
+    for _ in range(RUNS):
+        t = time.perf_counter()
+        after = reminders._MIN_USER_ID
+        while True:
+            ids = query(conn, minute, after, reminders.REMINDER_BATCH)
+            if len(ids) < reminders.REMINDER_BATCH:
+                break
+            after = ids[-1]
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+async def dispatch(peak_minute, api_latency):
+    api = FakeBotApi(api_latency)
+    server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    bot = ExtBot(
+        TOKEN,
+        base_url=f'http://127.0.0.1:{port}/bot',
+        request=HTTPXRequest(connection_pool_size=256),
+        rate_limiter=SendQueue(),
+    )
+    try:
+        async with bot:
+            t = time.perf_counter()
+            result = await reminders.send_reminders(bot, today_minute(peak_minute))
+            elapsed = time.perf_counter() - t
+    finally:
+        server.close()
+        await server.wait_closed()
+    return result, elapsed, api
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    api_latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.05
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        t = time.perf_counter()
+        peak, subscribers, due = build_db(path, users)
+        print(f"🏗️ БД на {users:,d} подписчиков построена за {time.perf_counter() - t:.1f} с")
+        print(f"📈 Пиковая минута: {subscribers:,d} подписчиков, {len(due):,d} ещё не взвешивались")
+
+        conn = sqlite3.connect(path)
+        before = measure_tick(conn, scan_due, today_minute(peak))
+        after = measure_tick(conn, reminders._due_reminders, today_minute(peak))
+        quiet = measure_tick(conn, reminders._due_reminders, today_minute(peak + 1))
+        conn.close()
+        print(f"🐢 Тик без индекса (полный просмотр):   {before * 1000:.2f} мс, "
+              f"{before * MINUTES_PER_DAY:.1f} с/сутки")
+        print(f"🚀 Тик по idx_reminders_utc_minute:      {after * 1000:.2f} мс (пик), {quiet * 1000:.3f} мс (обычная минута)")
+
+        db.pool = db.ConnectionPool(path)
+        (sent, removed, failed), elapsed, api = asyncio.run(dispatch(peak, api_latency))
+        db.close_db()
+
+    received = {chat_id for chat_id, texts in api.replies.items() if texts}
+    duplicates = sum(len(texts) - 1 for texts in api.replies.values())
+    print(f"📤 Рассылка пика: {sent:,d} за {elapsed:.1f} с ({sent / elapsed:.0f} сообщений/с, "
+          f"лимит {SEND_RATE}/с, задержка API {api_latency * 1000:.0f} мс), ошибок {failed}, отписано {removed}")
+    print(f"✅ Получили все, кому пора: {received == set(due)}, повторов: {duplicates}")
+    print(f"⏳ При лимите Telegram 30/с пик занял бы ~{len(due) / 30:.0f} с")
+
+
+if __name__ == '__main__':
+    main()
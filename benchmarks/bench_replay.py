@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Сквозной офлайн-бенчмарк: синтетические обновления через настоящий Application
+Создаёт БД заданного размера (generate_db.py), собирает Application с обработчиками бота
+(weight_bot.add_handlers) и заглушкой бота, которая записывает вызовы Bot API
+вместо сети, и кладёт обновления в update_queue с заданной частотой.
+Считает пропускную способность, задержки обработчиков (p50/p95/p99),
+время в БД и вызовы Bot API.
+
+Запуск: python benchmarks/bench_replay.py [--users N] [--records N] [--updates N]
+        [--rate N] [--mix weight=60,last=10,...] [--api-latency MS] [--rate-limit]
+"""
+
+import os
+import sys
+import time
+import logging
+import random
+import asyncio
+import argparse
+import tempfile
+import contextvars
+from itertools import accumulate
+from collections import Counter, defaultdict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+TOKEN = '123456:BENCHMARK'
+# Модули бота читают окружение при импорте
+os.environ.setdefault('TELEGRAM_TOKEN', TOKEN)
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DB_PATH'] = os.path.join(_tmp.name, 'replay.db')
+# Лимиты очереди отправки сняты: меряется обработка, а не лимиты Telegram
+for _name in ('SEND_GLOBAL_RATE', 'SEND_GLOBAL_BURST', 'SEND_CHAT_RATE', 'SEND_CHAT_BURST'):
+    os.environ.setdefault(_name, '100000')
+# Построчные логи бота заглушили бы отчёт (basicConfig в weight_bot уже не сработает)
+logging.basicConfig(level=logging.WARNING)
+
+import db
+
+DEFAULT_MIX = 'weight=60,last=10,history=10,trend=5,delete=5,confirm=5,stats=1'
+
+_db_time = contextvars.ContextVar('db_time', default=None)
+
+
+class TimingPool(db.ConnectionPool):
+    """Пул, который считает время запросов и относит его к текущему обработчику"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = 0
+        self.busy = 0.0
+
+    async def _timed(self, call):
+        started = time.perf_counter()
+        try:
+            return await call
+        finally:
+            elapsed = time.perf_counter() - started
+            self.calls += 1
+            self.busy += elapsed
+            spent = _db_time.get()
+            if spent is not None:
+                spent[0] += elapsed
+
+    async def read(self, fn, *args):
+        return await self._timed(super().read(fn, *args))
+
+    async def write(self, fn, *args):
+        return await self._timed(super().write(fn, *args))
+
+    async def write_grouped(self, fn, *args):
+        if self.group_interval <= 0:
+            # Без группового коммита это обычный write, он уже считается
+            return await super().write_grouped(fn, *args)
+        return await self._timed(super().write_grouped(fn, *args))
+
+
+# Пул подменяется до импорта модулей бота: они берут db.pool при импорте
+db.pool = TimingPool(os.environ['DB_PATH'])
+
+import migrations
+import weight_bot
+from generate_db import generate
+from admin_stats import ADMIN_ID
+from concurrency import configure_concurrency
+from send_queue import SendQueue
+from telegram import Update
+from telegram.ext import Application, ExtBot
+
+BOT_USER = {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+# ==================== ОБНОВЛЕНИЯ ====================
+def _user(uid):
+    return {'id': uid, 'is_bot': False, 'first_name': f'User {uid}', 'username': f'user{uid}'}
+
+
+def _message(uid, message_id, text):
+    message = {
+        'message_id': message_id,
+        'date': int(time.time()),
+        'chat': {'id': uid, 'type': 'private', 'first_name': f'User {uid}'},
+        'from': _user(uid),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return message
+
+
+def _callback(uid, message_id, data):
+    return {
+        'id': str(message_id),
+        'from': _user(uid),
+        'chat_instance': 'bench',
+        'data': data,
+        'message': {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': uid, 'type': 'private', 'first_name': f'User {uid}'},
+            'text': '❓',
+        },
+    }
+
+
+def make_update(kind, uid, message_id, rnd):
+    if kind == 'weight':
+        return {'message': _message(uid, message_id, f'{rnd.uniform(60, 110):.1f}')}
+    if kind == 'confirm':
+        return {'callback_query': _callback(uid, message_id, f'delete_confirm_{uid}')}
+    if kind == 'stats':
+        return {'message': _message(ADMIN_ID, message_id, '/stats')}
+    command = {'last': '/last', 'history': '/history', 'trend': '/trend', 'delete': '/delete_last'}[kind]
+    return {'message': _message(uid, message_id, command)}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in ('weight', 'last', 'history', 'trend', 'delete', 'confirm', 'stats'):
+            raise ValueError(f"Неизвестный тип обновления: {kind}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def synthetic_updates(count, users, mix, skew=1.0, seed=42):
+    """count обновлений: тип по весам mix, пользователь - по закону Ципфа
+    с показателем skew (пользователь k пишет в k^skew раз реже первого)"""
+    rnd = random.Random(seed)
+    kinds, weights = zip(*mix.items())
+    uids = range(1, users + 1)
+    activity = list(accumulate(1 / uid ** skew for uid in uids))
+    for i in range(count):
+        kind = rnd.choices(kinds, weights)[0]
+        uid = rnd.choices(uids, cum_weights=activity)[0]
+        yield kind, dict(make_update(kind, uid, i + 1, rnd), update_id=i + 1)
+
+
+# ==================== ЗАГЛУШКА БОТА ====================
+class RecordingBot(ExtBot):
+    """Бот без сети: _do_post записывает вызов и отвечает как Bot API"""
+
+    def __init__(self, *args, latency=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        with self._unfrozen():
+            self.latency = latency
+            self.api_calls = Counter()
+            self._message_id = 0
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        self.api_calls[endpoint] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if endpoint == 'getMe':
+            return BOT_USER
+        if endpoint in ('sendMessage', 'editMessageText', 'sendDocument'):
+            self._message_id += 1
+            chat_id = int(data.get('chat_id', 0))
+            return {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': str(data.get('text', '')),
+            }
+        return True
+
+
+# ==================== ПРОГОН ====================
+class Recorder:
+    """Оборачивает обработчики: время обработчика, время в БД, задержка от постановки в очередь"""
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.finished = asyncio.Event()
+        self.queued = {}
+        self.handler_times = defaultdict(list)
+        self.db_times = defaultdict(list)
+        self.end_to_end = []
+
+    def wrap(self, name, callback):
+        async def timed(update, context):
+            spent = [0.0]
+            token = _db_time.set(spent)
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            finally:
+                finished = time.perf_counter()
+                _db_time.reset(token)
+                self.handler_times[name].append(finished - started)
+                self.db_times[name].append(spent[0])
+                queued = self.queued.pop(update.update_id, None)
+                if queued is not None:
+                    self.end_to_end.append(finished - queued)
+                self.done += 1
+                if self.done >= self.total:
+                    self.finished.set()
+        return timed
+
+    def instrument(self, application):
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                handler.callback = self.wrap(handler.callback.__name__, handler.callback)
+
+
+async def replay(application, updates, rate, recorder):
+    await application.initialize()
+    await application.start()
+    await weight_bot.warm_known_users()
+
+    started = time.perf_counter()
+    for i, (_, data) in enumerate(updates):
+        if rate:
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(data, application.bot)
+        recorder.queued[update.update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+    await recorder.finished.wait()
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.shutdown()
+    return elapsed
+
+
+def report(args, records, kinds, elapsed, recorder, bot):
+    total = recorder.total
+    print(f"🗄️ БД: {args.users} пользователей, {records} записей | обновлений: {total}, "
+          f"частота: {args.rate or 'без ограничения'}/с")
+    print(f"🧪 Состав: " + ", ".join(f"{kind} {count}" for kind, count in kinds.most_common()))
+    print(f"🚀 Пропускная способность: {total / elapsed:.0f} обновлений/с ({elapsed:.2f} с)")
+    e2e = sorted(recorder.end_to_end)
+    print(f"⏱️ От очереди до ответа: p50 {percentile(e2e, 0.5) * 1000:.1f} мс, "
+          f"p95 {percentile(e2e, 0.95) * 1000:.1f} мс, p99 {percentile(e2e, 0.99) * 1000:.1f} мс")
+    print(f"🗄️ Запросов к пулу: {db.pool.calls}, в БД {db.pool.busy:.2f} с")
+
+    print(f"\n{'обработчик':<28}{'вызовов':>8}{'ср. мс':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'БД ср. мс':>11}")
+    for name, times in sorted(recorder.handler_times.items(), key=lambda item: -len(item[1])):
+        times = sorted(times)
+        avg = sum(times) / len(times)
+        db_avg = sum(recorder.db_times[name]) / len(times)
+        print(f"{name:<28}{len(times):>8}{avg * 1000:>9.2f}{percentile(times, 0.5) * 1000:>9.2f}"
+              f"{percentile(times, 0.95) * 1000:>9.2f}{percentile(times, 0.99) * 1000:>9.2f}{db_avg * 1000:>11.2f}")
+
+    print("\n📤 Вызовы Bot API: " + ", ".join(f"{name} {count}" for name, count in bot.api_calls.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Офлайн-прогон обновлений через обработчики бота')
+    parser.add_argument('--users', type=int, default=1000, help='пользователей в БД')
+    parser.add_argument('--records', type=int, default=100000, help='записей веса в БД')
+    parser.add_argument('--updates', type=int, default=5000, help='сколько обновлений проиграть')
+    parser.add_argument('--rate', type=float, default=0, help='обновлений в секунду (0 - без ограничения)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='веса типов обновлений')
+    parser.add_argument('--skew', type=float, default=1.0, help='неравномерность активности пользователей (Ципф)')
+    parser.add_argument('--api-latency', type=float, default=0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--rate-limit', action='store_true', help='отправка через SendQueue (лимиты Telegram)')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    _, records = generate(db.pool.path, args.users, args.records, progress=lambda message: None)
+    migrations.init_db()
+
+    bot = RecordingBot(TOKEN, latency=args.api_latency / 1000,
+                       rate_limiter=SendQueue() if args.rate_limit else None)
+    application = configure_concurrency(Application.builder().bot(bot).updater(None)).build()
+    weight_bot.add_handlers(application)
+
+    updates = list(synthetic_updates(args.updates, args.users, mix, args.skew))
+    kinds = Counter(kind for kind, _ in updates)
+    recorder = Recorder(len(updates))
+    recorder.instrument(application)
+
+    elapsed = asyncio.run(replay(application, updates, args.rate, recorder))
+    db.close_db()
+    report(args, records, kinds, elapsed, recorder, bot)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    finally:
+        _tmp.cleanup()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк сборки ответов: конкатенация += и новая клавиатура на каждый ответ
+против шаблонов replies.py и общей MAIN_KEYBOARD.
+Считает время сборки одного ответа (текст + reply_markup) и пик памяти,
+выделенной под один ответ (tracemalloc).
+
+Запуск: python benchmarks/bench_replies.py [iterations]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from telegram import ReplyKeyboardMarkup, KeyboardButton
+import replies
+
+ZONE = 'Самара (UTC+4)'
+NOW = '15.02.2024 08:12'
+HISTORY = [(f'{day:02d}.02.2024', 80 - day * 0.1) for day in range(10, 0, -1)]
+TREND = [(f'{week:02d}.01.2024', 80 - week * 0.2, 79.0, 81.0, 80.5 - week * 0.2) for week in range(12)]
+
+
+# ==================== КАК БЫЛО ====================
+def legacy_keyboard():
+    keyboard = [
+        [KeyboardButton("📊 Отправить вес")],
+        [KeyboardButton("📅 Последний вес"), KeyboardButton("📈 История")],
+        [KeyboardButton("🗑️ Удалить последнее"), KeyboardButton("ℹ️ Помощь")]
+    ]
+    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+
+
+def legacy_weight_saved(weight, previous):
+    response = f"✅ Вес сохранен!\n\n"
+    response += f"🌍 Временная зона: {ZONE}\n"
+    response += f"📅 Дата и время: {NOW}\n"
+    response += f"⚖️ Вес: {weight} кг\n"
+    last_date, last_weight_value = previous
+    difference = weight - last_weight_value
+    response += f"\n📊 Сравнение с последним измерением ({last_date}):\n"
+    response += f"Предыдущий вес: {last_weight_value} кг\n"
+    if difference > 0:
+        response += f"📈 Изменение: +{difference:.1f} кг"
+    elif difference < 0:
+        response += f"📉 Изменение: {difference:.1f} кг"
+    else:
+        response += f"📊 Вес не изменился"
+    return response, legacy_keyboard()
+
+
+def legacy_history(history):
+    response = f"🌍 Временная зона: {ZONE}\n"
+    response += "📊 История ваших измерений:\n\n"
+    for i, (formatted_date, weight) in enumerate(history, 1):
+        response += f"{i}. {formatted_date}: {weight} кг\n"
+    difference = history[0][1] - history[-1][1]
+    if difference > 0:
+        response += f"\n📈 Общее изменение: +{difference:.1f} кг"
+    elif difference < 0:
+        response += f"\n📉 Общее изменение: {difference:.1f} кг"
+    else:
+        response += f"\n📊 Вес не изменился"
+    return response, legacy_keyboard()
+
+
+def legacy_trend(rollups):
+    lines = [f"📊 Динамика веса по неделям (последние {len(rollups)}):\n"]
+    for formatted_date, avg, min_w, max_w, last in rollups:
+        lines.append(f"📅 {formatted_date}: ⌀ {avg:.1f} кг (⬇️ {min_w} / ⬆️ {max_w}), последний {last} кг")
+    difference = rollups[-1][4] - rollups[0][4]
+    if difference > 0:
+        lines.append(f"\n📈 Изменение за период: +{difference:.1f} кг")
+    elif difference < 0:
+        lines.append(f"\n📉 Изменение за период: {difference:.1f} кг")
+    else:
+        lines.append("\n📊 Вес не изменился")
+    return "\n".join(lines), legacy_keyboard()
+
+
+# ==================== КАК СТАЛО ====================
+def new_weight_saved(weight, previous):
+    return replies.render_weight_saved(ZONE, NOW, weight, previous), replies.MAIN_KEYBOARD
+
+
+def new_history(history):
+    return replies.render_history(ZONE, history), replies.MAIN_KEYBOARD
+
+
+def new_trend(rollups):
+    return replies.render_trend('неделям', len(rollups), rollups), replies.MAIN_KEYBOARD
+
+
+CASES = [
+    ('вес сохранён', legacy_weight_saved, new_weight_saved, (81.3, ('14.02.2024', 81.7))),
+    ('история (10)', legacy_history, new_history, (HISTORY,)),
+    ('динамика (12)', legacy_trend, new_trend, (TREND,)),
+]
+
+
+def per_reply_us(fn, args, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn(*args)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def per_reply_bytes(fn, args):
+    """Пик памяти, выделенной под один ответ (текст и объекты клавиатуры)"""
+    fn(*args)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        result = fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak - before
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    for (_, legacy, new, args) in CASES:
+        assert legacy(*args)[0] == new(*args)[0], f"Тексты {legacy.__name__} и {new.__name__} разошлись"
+
+    print(f"🔁 Итераций: {iterations}")
+    print(f"{'ответ':<16}{'было мкс':>10}{'стало мкс':>11}{'было байт':>11}{'стало байт':>12}")
+    for name, legacy, new, args in CASES:
+        print(f"{name:<16}{per_reply_us(legacy, args, iterations):>10.2f}{per_reply_us(new, args, iterations):>11.2f}"
+              f"{per_reply_bytes(legacy, args):>11}{per_reply_bytes(new, args):>12}")
+
+    keyboard_us = per_reply_us(legacy_keyboard, (), iterations)
+    print(f"\n⌨️ Новая клавиатура на ответ: {keyboard_us:.2f} мкс, {per_reply_bytes(legacy_keyboard, ())} байт "
+          f"(теперь одна на процесс)")
+
+
+if __name__ == '__main__':
+    main()
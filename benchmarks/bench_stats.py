@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк /stats: девять агрегатов по weight_records vs счётчики global_stats
+Строит синтетическую БД на N записей и сравнивает время get_db_stats.
+
+Запуск: python benchmarks/bench_stats.py [records] [users]
+(например: python benchmarks/bench_stats.py 10000000 50000)
+"""
+
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import migrations
+from timeutils import now_ts, local_day_bounds
+from admin_stats import _get_db_stats
+
+RUNS = 5
+
+
+def old_get_db_stats(conn):
+    """get_db_stats до появления global_stats/daily_stats"""
+    _, since_7d, _ = local_day_bounds(now_ts() - 7 * 86400)
+    _, since_30d, _ = local_day_bounds(now_ts() - 30 * 86400)
+    cursor = conn.cursor()
+    stats = {}
+    stats['total_users'] = cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    stats['total_records'] = cursor.execute("SELECT COUNT(*) FROM weight_records").fetchone()[0]
+    stats['active_users_7d'] = cursor.execute(
+        "SELECT COUNT(DISTINCT user_id) FROM weight_records WHERE ts >= ?", (since_7d,)).fetchone()[0]
+    stats['records_7d'] = cursor.execute(
+        "SELECT COUNT(*) FROM weight_records WHERE ts >= ?", (since_7d,)).fetchone()[0]
+    stats['records_30d'] = cursor.execute(
+        "SELECT COUNT(*) FROM weight_records WHERE ts >= ?", (since_30d,)).fetchone()[0]
+    stats['first_record'], stats['last_record'] = cursor.execute(
+        "SELECT MIN(ts), MAX(ts) FROM weight_records").fetchone()
+    stats['top_users'] = cursor.execute(
+        "SELECT user_id, COUNT(*) as count FROM weight_records GROUP BY user_id ORDER BY count DESC LIMIT 5").fetchall()
+    stats['avg_weight'] = cursor.execute("SELECT AVG(weight) FROM weight_records").fetchone()[0]
+    stats['min_weight'], stats['max_weight'] = cursor.execute(
+        "SELECT MIN(weight), MAX(weight) FROM weight_records").fetchone()
+    return stats
+
+
+def build_db(path, records, users):
+    conn = sqlite3.connect(path)
+    migrations._apply_pending(conn)
+    conn.executemany('INSERT INTO users (user_id, first_name) VALUES (?, ?)',
+                     ((uid, f'user{uid}') for uid in range(1, users + 1)))
+
+    start = now_ts() - 365 * 3 * 86400
+    step = 365 * 3 * 86400 / records
+    rnd = random.Random(42)
+
+    def rows():
+        for i in range(records):
+            yield rnd.randint(1, users), round(rnd.uniform(50, 120), 1), int(start + step * i)
+
+    conn.executemany('INSERT INTO weight_records (user_id, weight, ts) VALUES (?, ?, ?)', rows())
+    migrations._backfill_all(conn, 10000)
+    conn.commit()
+    conn.close()
+
+
+def measure(conn, fn):
+    best = float('inf')
+    for _ in range(RUNS):
+        t = time.perf_counter()
+        fn(conn)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        t = time.perf_counter()
+        build_db(path, records, users)
+        print(f"🏗️ БД на {records:,d} записей / {users:,d} пользователей построена за {time.perf_counter() - t:.1f} с")
+
+        conn = sqlite3.connect(path)
+        before = measure(conn, old_get_db_stats)
+        after = measure(conn, _get_db_stats)
+        conn.close()
+
+    print(f"🐢 До (9 агрегатов по weight_records): {before * 1000:.1f} мс")
+    print(f"🚀 После (global_stats + daily_stats):  {after * 1000:.3f} мс")
+    print(f"📈 Ускорение: x{before / after:.0f}")
+
+
+if __name__ == '__main__':
+    main()
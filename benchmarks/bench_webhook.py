@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏱️ Бенчмарк приёма обновлений: run_polling vs webhook
+Поднимает локальную заглушку Telegram Bot API, запускает weight_bot.py
+(TELEGRAM_API_URL указывает на заглушку) и проигрывает обновления:
+в polling - через getUpdates, в webhook - POST на сервер бота с секретом.
+Задержка - от отправки обновления до ответа бота (sendMessage в этот чат).
+
+Запуск: python benchmarks/bench_webhook.py [users] [updates_per_user] [updates.jsonl]
+updates.jsonl - записанные обновления (по одному JSON Update в строке);
+без него генерируются сообщения с весом от users пользователей.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import tempfile
+import subprocess
+from urllib.parse import parse_qs
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TOKEN = '123456:BENCHMARK'
+SECRET = 'bench-secret'
+READY_TIMEOUT = 30
+
+# Лимиты очереди отправки (send_queue) сняты: заглушке API они не нужны,
+# а с лимитами Telegram (30/с на бота, 1/с в чат) бенчмарк мерил бы их
+NO_SEND_LIMITS = {
+    'SEND_GLOBAL_RATE': '100000',
+    'SEND_GLOBAL_BURST': '100000',
+    'SEND_CHAT_RATE': '100000',
+    'SEND_CHAT_BURST': '100000',
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def synthetic_updates(users, per_user):
+    rnd = random.Random(42)
+    for i in range(per_user):
+        for uid in range(1, users + 1):
+            yield {
+                'message': {
+                    'message_id': i + 1,
+                    'date': int(time.time()),
+                    'chat': {'id': uid, 'type': 'private', 'first_name': f'user{uid}'},
+                    'from': {'id': uid, 'is_bot': False, 'first_name': f'user{uid}'},
+                    'text': f'{rnd.uniform(60, 100):.1f}',
+                }
+            }
+
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class FakeBotApi:
+    """Заглушка Bot API: отвечает на методы бота, раздаёт обновления через
+    getUpdates и сообщает о каждом sendMessage"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.replies = {}
+        self.updates = []
+        self.update_id = 0
+        self.new_updates = asyncio.Event()
+        self.pending = {}
+        self.ready = asyncio.Event()
+        self.message_id = 0
+
+    def next_update(self, update):
+        self.update_id += 1
+        return dict(update, update_id=self.update_id)
+
+    def push_update(self, update):
+        update = self.next_update(update)
+        self.updates.append(update)
+        self.new_updates.set()
+        return update
+
+    def expect_reply(self, chat_id):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(chat_id, []).append(future)
+        return future
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        self.updates = [u for u in self.updates if u['update_id'] >= offset]
+        self.ready.set()
+        if not self.updates:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:int(params.get('limit') or 100)]
+
+    def sent_message(self, params):
+        chat_id = int(params.get('chat_id', 0))
+        self.replies.setdefault(chat_id, []).append(params.get('text', ''))
+        waiters = self.pending.get(chat_id)
+        if waiters:
+            future = waiters.pop(0)
+            if not future.done():
+                future.set_result(time.perf_counter())
+        self.message_id += 1
+        return {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def call(self, method, params):
+        if method == 'getMe':
+            return {'id': 123456, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method == 'getUpdates':
+            return await self.get_updates(params)
+        if method in ('sendMessage', 'sendDocument'):
+            # Ответ засчитывается сразу, задержка имитирует путь до Telegram и обратно
+            result = self.sent_message(params)
+            await asyncio.sleep(self.latency)
+            return result
+        if method == 'setWebhook':
+            self.ready.set()
+        return True
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                method = request_line.split()[1].decode().rsplit('/', 1)[-1]
+                result = await self.call(method, parse_body(headers.get('content-type', ''), body))
+                payload = json.dumps({'ok': True, 'result': result}).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(payload)).encode() + b'\r\n\r\n' + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+
+def parse_body(content_type, body):
+    if not body:
+        return {}
+    if 'json' in content_type:
+        return json.loads(body)
+    if 'multipart' in content_type:
+        # Из multipart (sendDocument) нужен только chat_id
+        marker = b'name="chat_id"\r\n\r\n'
+        start = body.find(marker)
+        if start < 0:
+            return {}
+        start += len(marker)
+        return {'chat_id': body[start:body.find(b'\r\n', start)].decode()}
+    return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+
+
+class WebhookClient:
+    """Keep-alive HTTP-клиент для POST обновлений на webhook бота"""
+
+    def __init__(self, port, path, secret):
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.reader = self.writer = None
+
+    async def post(self, update):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        body = json.dumps(update).encode()
+        self.writer.write(
+            f'POST /{self.path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n'
+            f'X-Telegram-Bot-Api-Secret-Token: {self.secret}\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+        )
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        await self.reader.readexactly(length)
+        return status
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+def chat_of(update):
+    for key in ('message', 'edited_message', 'callback_query'):
+        if key in update:
+            obj = update[key]
+            return (obj.get('chat') or obj.get('message', {}).get('chat') or obj['from'])['id']
+    return None
+
+
+async def run_mode(mode, updates, tmp, extra_env=None, api_latency=0.0, burst=False):
+    """Проигрывает updates в режиме mode. burst=False - пользователь ждёт ответа
+    перед следующим сообщением, burst=True - отправляет все сообщения сразу.
+    Возвращает (обновлений/с, отсортированные задержки, заглушка API)."""
+    api = FakeBotApi(api_latency)
+    server = await asyncio.start_server(api.handle, '127.0.0.1', 0)
+    api_port = server.sockets[0].getsockname()[1]
+    hook_port = free_port()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN=TOKEN,
+        TELEGRAM_API_URL=f'http://127.0.0.1:{api_port}',
+        DB_PATH=os.path.join(tmp, f'{mode}.db'),
+        BOT_MODE=mode,
+        WEBHOOK_URL=f'http://127.0.0.1:{hook_port}',
+        WEBHOOK_LISTEN='127.0.0.1',
+        WEBHOOK_PORT=str(hook_port),
+        WEBHOOK_SECRET=SECRET,
+        BACKUP_INTERVAL='86400',
+        **NO_SEND_LIMITS,
+    )
+    env.update(extra_env or {})
+    log = open(os.path.join(tmp, f'{mode}.log'), 'w')
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, 'weight_bot.py')],
+                           cwd=tmp, env=env, stdout=log, stderr=subprocess.STDOUT)
+    clients = {}
+    try:
+        await asyncio.wait_for(api.ready.wait(), READY_TIMEOUT)
+        if mode == 'webhook':
+            # Сервер бота поднимается сразу после setWebhook
+            for _ in range(100):
+                try:
+                    probe = WebhookClient(hook_port, 'telegram', 'wrong-secret')
+                    rejected = await probe.post({'update_id': 0})
+                    probe.close()
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+            print(f"🔐 Запрос с неверным секретом: HTTP {rejected}")
+
+        by_chat = {}
+        for update in updates:
+            by_chat.setdefault(chat_of(update), []).append(update)
+        latencies = []
+
+        async def send(chat_id, update):
+            reply = api.expect_reply(chat_id)
+            t = time.perf_counter()
+            if mode == 'webhook':
+                client = clients.setdefault(chat_id, WebhookClient(hook_port, 'telegram', SECRET))
+                await client.post(api.next_update(update))
+            else:
+                api.push_update(update)
+            return reply, t
+
+        async def wait_reply(reply, t):
+            latencies.append(await asyncio.wait_for(reply, READY_TIMEOUT) - t)
+
+        async def user_loop(chat_id, chat_updates):
+            if burst:
+                sent = [await send(chat_id, update) for update in chat_updates]
+                await asyncio.gather(*(wait_reply(*s) for s in sent))
+            else:
+                for update in chat_updates:
+                    await wait_reply(*await send(chat_id, update))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user_loop(c, u) for c, u in by_chat.items()))
+        elapsed = time.perf_counter() - start
+    finally:
+        for client in clients.values():
+            client.close()
+        bot.terminate()
+        bot.wait(10)
+        log.close()
+        server.close()
+        await server.wait_closed()
+
+    latencies.sort()
+    return len(latencies) / elapsed, latencies, api
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    updates = load_updates(sys.argv[3]) if len(sys.argv) > 3 else list(synthetic_updates(users, per_user))
+
+    print(f"📨 Обновлений: {len(updates)}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('polling', 'webhook'):
+            rate, latencies, _ = asyncio.run(run_mode(mode, updates, tmp))
+            print(f"{'🐢' if mode == 'polling' else '🚀'} {mode:8s}: {rate:.0f} обновлений/с | "
+                  f"p50 {percentile(latencies, 0.5) * 1000:.1f} мс, p90 {percentile(latencies, 0.9) * 1000:.1f} мс, "
+                  f"p99 {percentile(latencies, 0.99) * 1000:.1f} мс, max {latencies[-1] * 1000:.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🏭 Synthetic Database Generator for Weight Tracker Bot
+Создаёт weight_tracker.db нужного размера с правдоподобными данными:
+активность пользователей по степенному закону (немногие пишут почти каждый день,
+большинство - изредка), взвешивания утром раз в день с пропусками, вес медленно
+дрейфует, часть пользователей бросила бота. Схема создаётся миграциями.
+
+Агрегаты (user_summary, global_stats, daily_stats, weight_rollups) считаются
+здесь же, на лету: пересборка SQL-запросами db._rebuild_aggregates на миллионах
+записей занимает минуты. --rebuild-aggregates пересобирает их через db (медленно,
+зато заполняет и сводные таблицы, о которых генератор не знает).
+
+Скорость: записи вставляются executemany крупными транзакциями без журнала,
+вторичные индексы удаляются на время загрузки и строятся заново.
+
+Запуск: python benchmarks/generate_db.py PATH [--users N] [--records N] [--days N]
+        [--churn 0.35] [--reminders 0.1] [--seed N] [--rebuild-aggregates] [--force]
+"""
+
+import os
+import sys
+import math
+import time
+import random
+import sqlite3
+import argparse
+from bisect import bisect_left
+from itertools import repeat
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import migrations
+from timeutils import DEFAULT_OFFSET, now_ts, local_day_bounds, utc_minute_of_day
+
+DAY = 86400
+# Примерно столько записей в одной транзакции; внутри порции записи идут по времени,
+# как в живой БД, где строки добавляются в порядке поступления
+CHUNK_ROWS = 1000000
+# Показатель Парето для числа записей на пользователя (~ правило 80/20)
+ACTIVITY_ALPHA = 1.16
+# Заранее посчитанные случайные величины: шум веса (десятые доли кг), время
+# утреннего взвешивания и пропуски дней; каждый пользователь идёт по таблицам со своего места
+_TABLE_SIZE = 1 << 14
+_TABLE_MASK = _TABLE_SIZE - 1
+
+FIRST_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Алексей', 'Дмитрий',
+               'Сергей', 'Андрей', 'Иван', 'Екатерина', 'Татьяна', 'Михаил', 'Павел']
+LAST_NAMES = [None, None, 'Иванов', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева']
+
+
+def _record_counts(rnd, users, records, days):
+    """Число записей каждого пользователя: Парето, не больше одной в день,
+    в сумме около records (срезанный хвост перераспределяется на остальных)"""
+    weights = [rnd.paretovariate(ACTIVITY_ALPHA) for _ in range(users)]
+    capped = [False] * users
+    counts = [1] * users
+    for _ in range(5):
+        budget = records - days * sum(capped)
+        free = sum(w for w, c in zip(weights, capped) if not c)
+        if budget <= 0 or free <= 0:
+            break
+        scale = budget / free
+        changed = False
+        for i, w in enumerate(weights):
+            if capped[i]:
+                continue
+            n = w * scale
+            if n >= days:
+                capped[i] = changed = True
+                counts[i] = days
+            else:
+                counts[i] = max(1, round(n))
+        if not changed:
+            break
+    return counts
+
+
+def _calendar(days, today_start):
+    """Для каждого дня истории (0 - самый ранний, days-1 - сегодня): начало дня,
+    корзины свёрток day/week/month как у _local_day_sql и индексы дней,
+    с которых начинаются следующая неделя и следующий месяц"""
+    today = datetime.fromtimestamp(today_start + DEFAULT_OFFSET, timezone.utc).date()
+    starts, day_names, week_names, month_names, next_week, next_month = [], [], [], [], [], []
+    for i in range(days):
+        day = today - timedelta(days=days - 1 - i)
+        month = day.replace(day=1)
+        following = (month + timedelta(days=32)).replace(day=1)
+        starts.append(today_start - (days - 1 - i) * DAY)
+        day_names.append(day.isoformat())
+        week_names.append((day - timedelta(days=day.weekday())).isoformat())
+        month_names.append(month.isoformat())
+        next_week.append(i + 7 - day.weekday())
+        next_month.append(i + (following - day).days)
+    return starts, day_names, week_names, month_names, next_week, next_month
+
+
+def _drop_indexes(conn, tables):
+    """Удаляет вторичные индексы таблиц и возвращает их CREATE INDEX для восстановления"""
+    placeholders = ', '.join('?' * len(tables))
+    indexes = conn.execute(f'''
+        SELECT name, sql FROM sqlite_master
+        WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', tables).fetchall()
+    for name, _ in indexes:
+        conn.execute(f'DROP INDEX {name}')
+    return [sql for _, sql in indexes]
+
+
+def generate(path, users, records, days=730, churn=0.35, reminders=0.1, seed=42,
+             rebuild_aggregates=False, progress=print):
+    """Создаёт БД path. Возвращает (пользователей, записей)."""
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    now = now_ts()
+    _, today_start, _ = local_day_bounds(now)
+    starts, day_names, week_names, month_names, next_week, next_month = _calendar(days, today_start)
+
+    noise = [round(rnd.gauss(0, 4)) for _ in range(_TABLE_SIZE)]
+    uniform = [rnd.random() for _ in range(_TABLE_SIZE)]
+    morning = [min(23 * 3600, max(5 * 3600, int(rnd.gauss(8 * 3600, 5400)))) for _ in range(_TABLE_SIZE)]
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        # threads - потоки сортировки для CREATE INDEX на многоядерной машине
+        for pragma in ('journal_mode = OFF', 'synchronous = OFF', 'locking_mode = EXCLUSIVE',
+                       'cache_size = -524288', 'temp_store = MEMORY', 'threads = 4'):
+            conn.execute(f'PRAGMA {pragma}')
+
+        migrations._apply_pending(conn)
+        conn.execute('COMMIT')
+        indexes = _drop_indexes(conn, ('users', 'weight_records'))
+
+        # Порция сначала пишется во временную таблицу в порядке пользователей, оттуда
+        # одним INSERT ... SELECT: в weight_records - по времени (AUTOINCREMENT на
+        # построчных вставках вдвое дороже), в дневные свёртки - по ключу
+        # (у пользователя не больше одной записи в день, корзина дня - одна запись)
+        conn.execute('CREATE TEMP TABLE staged (user_id INTEGER, weight REAL, ts INTEGER)')
+        counts = _record_counts(rnd, users, records, days)
+        users_rows, summary_rows, reminder_rows = [], [], []
+        daily = [0] * days
+        staged, rollups = [], []
+        total = 0
+
+        def flush():
+            nonlocal total
+            conn.execute('BEGIN')
+            conn.executemany('INSERT INTO staged VALUES (?, ?, ?)', staged)
+            conn.execute('INSERT INTO weight_records (user_id, weight, ts) SELECT * FROM staged ORDER BY ts')
+            conn.execute(f'''
+                INSERT INTO weight_rollups
+                SELECT user_id, 'day', {db._local_day_sql('ts')}, 1, weight, weight, weight, weight, ts
+                FROM staged
+            ''')
+            conn.executemany('INSERT INTO weight_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rollups)
+            conn.execute('DELETE FROM staged')
+            conn.execute('COMMIT')
+            total += len(staged)
+            staged.clear()
+            rollups.clear()
+            progress(f"📝 Записей: {total:,d} ({time.perf_counter() - started:.1f} с)")
+
+        for uid, count in enumerate(counts, 1):
+            # Промежуток активности в днях; взвешивается в доле дней count / span
+            span = min(days, max(count, math.ceil(count / rnd.uniform(0.35, 1.0))))
+            # Бросившие заканчивают в случайный день прошлого, остальные пишут до сегодня
+            end = rnd.randrange(span - 1, days - 1) if span < days - 1 and rnd.random() < churn else days - 1
+            first = end - span + 1
+            shift = rnd.randrange(_TABLE_SIZE)
+            chance = count / span
+            offsets = [i for i in range(first, end + 1) if uniform[(shift + i) & _TABLE_MASK] < chance] or [end]
+
+            # Вес в десятых долях кг: начальный, дрейф в день, шум из таблицы.
+            # Дрейф ограничен так, чтобы вес за весь промежуток остался в 45-180 кг
+            base = min(1800, max(450, int(rnd.gauss(850, 150))))
+            trend = max((450 - base) / span, min((1800 - base) / span, rnd.gauss(-0.05, 0.1)))
+            weights = [(base + int(trend * (i - first)) + noise[(shift + i) & _TABLE_MASK]) / 10 for i in offsets]
+            stamps = [starts[i] + morning[(shift + i) & _TABLE_MASK] for i in offsets]
+            if stamps[-1] > now:
+                stamps[-1] = now
+            staged.extend(zip(repeat(uid), weights, stamps))
+            for i in offsets:
+                daily[i] += 1
+
+            # Записи пользователя идут по времени: корзина недели или месяца - отрезок offsets
+            for period, names, next_bucket in (('week', week_names, next_week), ('month', month_names, next_month)):
+                k = 0
+                while k < len(offsets):
+                    j = bisect_left(offsets, next_bucket[offsets[k]], k)
+                    part = weights[k:j]
+                    rollups.append((uid, period, names[offsets[k]], j - k, sum(part), min(part), max(part),
+                                    part[-1], stamps[j - 1]))
+                    k = j
+
+            first_ts = stamps[0]
+            summary_rows.append((uid, len(offsets), sum(weights), min(weights), max(weights),
+                                 first_ts, stamps[-1], weights[-1]))
+            created_at = first_ts - DAY + rnd.randrange(DAY // 2)
+            users_rows.append((uid, f'user{uid}', rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES), created_at))
+            if rnd.random() < reminders:
+                minute = rnd.randrange(6 * 60, 10 * 60, 15)
+                reminder_rows.append((uid, minute, utc_minute_of_day(minute)))
+
+            if len(staged) >= CHUNK_ROWS:
+                flush()
+        if staged:
+            flush()
+
+        conn.execute('BEGIN')
+        conn.executemany('INSERT INTO users (user_id, username, first_name, last_name, created_at) '
+                         'VALUES (?, ?, ?, ?, ?)', users_rows)
+        conn.executemany('INSERT INTO reminders (user_id, local_minute, utc_minute) VALUES (?, ?, ?)',
+                         reminder_rows)
+        conn.executemany('''
+            INSERT INTO user_summary (user_id, records_count, weight_sum, min_weight, max_weight,
+                                      first_ts, last_ts, last_weight)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', summary_rows)
+        conn.executemany('INSERT INTO daily_stats (day, records_count, active_users) VALUES (?, ?, ?)',
+                         ((day_names[i], n, n) for i, n in enumerate(daily) if n))
+        conn.execute('''
+            UPDATE global_stats SET
+                total_users = (SELECT COUNT(*) FROM users),
+                total_records = (SELECT COALESCE(SUM(records_count), 0) FROM user_summary),
+                weight_sum = (SELECT COALESCE(SUM(weight_sum), 0) FROM user_summary),
+                min_weight = (SELECT MIN(min_weight) FROM user_summary),
+                max_weight = (SELECT MAX(max_weight) FROM user_summary),
+                first_ts = (SELECT MIN(first_ts) FROM user_summary),
+                last_ts = (SELECT MAX(last_ts) FROM user_summary)
+            WHERE id = 1
+        ''')
+        conn.execute('COMMIT')
+
+        progress(f"🗂️ Индексы ({time.perf_counter() - started:.1f} с)")
+        conn.execute('BEGIN')
+        for sql in indexes:
+            conn.execute(sql)
+        # id последней записи известен только после вставки
+        conn.execute('''
+            UPDATE user_summary SET last_record_id = (
+                SELECT w.id FROM weight_records w
+                WHERE w.user_id = user_summary.user_id
+                ORDER BY w.ts DESC LIMIT 1
+            )
+        ''')
+        if rebuild_aggregates:
+            progress(f"📊 Пересборка агрегатов ({time.perf_counter() - started:.1f} с)")
+            db._rebuild_aggregates(conn)
+        # Агрегаты уже полные: фоновое заполнение при запуске бота не нужно
+        conn.execute('''
+            UPDATE schema_migrations
+            SET status = 'applied', backfill_cursor = NULL, backfill_done = COALESCE(backfill_total, 0)
+            WHERE status = 'backfill'
+        ''')
+        conn.execute('COMMIT')
+
+        conn.execute('PRAGMA locking_mode = NORMAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+    finally:
+        conn.close()
+
+    progress(f"✅ Готово за {time.perf_counter() - started:.1f} с")
+    return users, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор синтетической БД бота')
+    parser.add_argument('path', help='файл БД')
+    parser.add_argument('--users', type=int, default=None, help='пользователей (по умолчанию records / 100)')
+    parser.add_argument('--records', type=int, default=1000000, help='записей веса (примерно)')
+    parser.add_argument('--days', type=int, default=730, help='глубина истории в днях')
+    parser.add_argument('--churn', type=float, default=0.35, help='доля бросивших бота')
+    parser.add_argument('--reminders', type=float, default=0.1, help='доля пользователей с напоминанием')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rebuild-aggregates', action='store_true',
+                        help='пересобрать агрегаты через db._rebuild_aggregates (медленно)')
+    parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            print(f"❌ {args.path} уже существует (--force для перезаписи)")
+            sys.exit(1)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    os.makedirs(os.path.dirname(args.path) or '.', exist_ok=True)
+
+    users = args.users or max(1, args.records // 100)
+    users, records = generate(args.path, users, args.records, args.days, args.churn,
+                              args.reminders, args.seed, args.rebuild_aggregates)
+    size = os.path.getsize(args.path) / 1024 / 1024
+    print(f"🗄️ {args.path}: {users:,d} пользователей, {records:,d} записей, {size:.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
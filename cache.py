@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧠 In-process caches for Weight Tracker Bot
+Небольшие кэши в памяти процесса для горячих путей обработчиков.
+Все обращения идут из event loop, поэтому блокировки не нужны.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Кэш на maxsize ключей: при переполнении вытесняется давно не использованный.
+    ttl - время жизни записи в секундах с момента set (None - без ограничения)."""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires, value = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key, default=None):
+        """Значение без учёта в статистике и без продвижения в LRU"""
+        entry = self._data.get(key)
+        if entry is None or (entry[0] is not None and entry[0] <= time.monotonic()):
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
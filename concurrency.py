@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⚡ Concurrent Update Processing for Weight Tracker Bot
+Обновления разных пользователей обрабатываются параллельно (не больше
+UPDATE_CONCURRENCY одновременно), обновления одного пользователя - строго
+по очереди в порядке поступления, чтобы запись и удаление веса не гонялись.
+"""
+
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# 1 - последовательная обработка, как в PTB по умолчанию
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '16'))
+
+# PTB сразу создаёт задачу на каждое обновление и ограничивает их своим семафором.
+# Его лимит заведомо больше: слоты раздаются уже после очереди пользователя, иначе
+# поток сообщений одного пользователя занял бы все слоты, ожидая своей блокировки.
+_PTB_CONCURRENT_UPDATES = 100000
+
+
+class UserLocks:
+    """Блокировки по пользователю; запись удаляется, когда её никто не ждёт"""
+
+    def __init__(self):
+        self._locks = {}
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+
+def update_key(update):
+    """Ключ очереди обновления: пользователь, иначе чат, иначе без очереди"""
+    if isinstance(update, Update):
+        if update.effective_user:
+            return update.effective_user.id
+        if update.effective_chat:
+            return update.effective_chat.id
+    return None
+
+
+class OrderedApplication(Application):
+    """Application с параллельной обработкой и порядком внутри пользователя"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.user_locks = UserLocks()
+        self._update_slots = None
+
+    async def _process_in_slot(self, update):
+        # Семафор создаётся в работающем event loop (важно для Python 3.9)
+        if self._update_slots is None:
+            self._update_slots = asyncio.Semaphore(UPDATE_CONCURRENCY)
+        async with self._update_slots:
+            await super().process_update(update)
+
+    async def process_update(self, update):
+        key = update_key(update)
+        if key is None:
+            await self._process_in_slot(update)
+            return
+        async with self.user_locks.hold(key):
+            await self._process_in_slot(update)
+
+
+def configure_concurrency(builder):
+    """Включает параллельную обработку обновлений в ApplicationBuilder"""
+    if UPDATE_CONCURRENCY <= 1:
+        logger.info("⚡ Обновления обрабатываются последовательно")
+        return builder
+    logger.info(f"⚡ Параллельная обработка: до {UPDATE_CONCURRENCY} обновлений, по очереди внутри пользователя")
+    return builder.application_class(OrderedApplication).concurrent_updates(_PTB_CONCURRENT_UPDATES)
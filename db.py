@@ -0,0 +1,939 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🗄️ Database Access Layer for Weight Tracker Bot
+Единая точка доступа к SQLite: пул соединений (1 писатель + N читателей),
+все вызовы из обработчиков асинхронные и выполняются в отдельных потоках,
+чтобы не блокировать event loop бота.
+"""
+
+import os
+import re
+import time
+import queue
+import sqlite3
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+from metrics import db_query_seconds, db_query_errors, db_slow_queries, watch_cache
+from timeutils import DEFAULT_OFFSET, LOCAL_MODIFIER, UTC_MODIFIER, local_day_bounds
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv('DB_PATH', 'data/weight_tracker.db')
+DB_READERS = int(os.getenv('DB_READERS', '4'))
+DB_PROFILE = os.getenv('DB_PROFILE', 'wal')
+DB_CHECKPOINT_INTERVAL = int(os.getenv('DB_CHECKPOINT_INTERVAL', '300'))
+# Групповой коммит записей веса: ждать до DB_GROUP_COMMIT_MS мс или
+# DB_GROUP_COMMIT_BATCH записей и коммитить их одной транзакцией (0 - выключен).
+# Выигрыш заметен при synchronous=FULL (DB_PROFILE=durable): один fsync на пачку.
+DB_GROUP_COMMIT_MS = float(os.getenv('DB_GROUP_COMMIT_MS', '0'))
+DB_GROUP_COMMIT_BATCH = int(os.getenv('DB_GROUP_COMMIT_BATCH', '64'))
+# Журнал медленных запросов: SQL-оператор дольше DB_SLOW_QUERY_MS мс пишется в лог
+# с параметрами и планом (0 - выключен, соединения пула открываются без обёртки)
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '0'))
+
+# Кэш последних RECENT_RECORDS записей активных пользователей:
+# "отправил вес - увидел разницу", /last и /history обходятся без чтения БД
+RECENT_RECORDS = int(os.getenv('RECENT_RECORDS', '10'))
+RECENT_CACHE_SIZE = int(os.getenv('RECENT_CACHE_SIZE', '10000'))
+RECENT_CACHE_TTL = float(os.getenv('RECENT_CACHE_TTL', '3600'))
+# Известные пользователи с именами из Telegram: для них регистрация не пишет в БД
+KNOWN_USERS_SIZE = int(os.getenv('KNOWN_USERS_SIZE', '100000'))
+
+# Профили хранения: PRAGMA, применяемые к каждому соединению.
+# Любое значение можно переопределить переменной окружения DB_<PRAGMA>,
+# например DB_SYNCHRONOUS=FULL или DB_MMAP_SIZE=0.
+STORAGE_PROFILES = {
+    # Читатели не блокируют писателя, fsync только на чекпоинте
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # WAL, но fsync на каждый коммит
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'cache_size': -16000,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+    # Настройки SQLite по умолчанию (как было раньше)
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+    },
+}
+
+_PRAGMA_VALUE = re.compile(r'^-?[A-Za-z0-9_]+$')
+
+
+def get_storage_pragmas(profile=DB_PROFILE):
+    """Возвращает PRAGMA профиля с учётом переопределений из окружения"""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"Неизвестный профиль БД: {profile}")
+
+    pragmas = dict(STORAGE_PROFILES[profile])
+    for name in ('journal_mode', 'synchronous', 'busy_timeout', 'cache_size', 'mmap_size', 'temp_store'):
+        value = os.getenv(f'DB_{name.upper()}')
+        if value is not None:
+            pragmas[name] = value
+
+    for name, value in pragmas.items():
+        if not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f"Недопустимое значение PRAGMA {name}: {value}")
+    return pragmas
+
+
+# Операторы, для которых есть смысл в EXPLAIN QUERY PLAN
+_PLANNED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+
+def explain(conn, sql, params=()):
+    """План оператора: строки detail из EXPLAIN QUERY PLAN (пусто для BEGIN, PRAGMA и т.п.)"""
+    if not sql.lstrip().upper().startswith(_PLANNED_STATEMENTS):
+        return []
+    return [row[3] for row in sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+class AuditCursor(sqlite3.Cursor):
+    """Курсор, который замеряет каждый оператор и сообщает о нём соединению.
+    Замеряется execute (первый шаг оператора): сортировки и агрегаты выполняются
+    в нём целиком, а дочитывание простых выборок остаётся в fetch*."""
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            self.connection.audit(sql, params, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            self.connection.audit(sql, seq_of_params[0] if seq_of_params else (),
+                                  time.perf_counter() - started, len(seq_of_params))
+
+
+class AuditConnection(sqlite3.Connection):
+    """Соединение с журналом медленных запросов (factory для sqlite3.connect).
+    statements - если это список, в него попадают все операторы (sql, params)."""
+
+    slow_ms = DB_SLOW_QUERY_MS
+    statements = None
+
+    def cursor(self, factory=AuditCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def audit(self, sql, params, elapsed, rows=1):
+        if self.statements is not None:
+            self.statements.append((sql, params))
+        if not self.slow_ms or elapsed * 1000 < self.slow_ms:
+            return
+        db_slow_queries.inc()
+        try:
+            plan = " ; ".join(explain(self, sql, params)) or "—"
+        except sqlite3.Error as e:
+            plan = f"не получен ({e})"
+        batch = f" x{rows}" if rows != 1 else ""
+        logger.warning(f"🐢 Медленный запрос {elapsed * 1000:.1f} мс{batch}: {' '.join(sql.split())} | "
+                       f"параметры: {params!r} | план: {plan}")
+
+
+def _query_name(fn):
+    """Имя запроса для метрик: функция (conn, ...) -> результат"""
+    return getattr(fn, '__name__', type(fn).__name__)
+
+
+class ConnectionPool:
+    """Пул соединений SQLite: один писатель и ограниченное число читателей.
+
+    Все записи идут через однопоточный executor, поэтому сериализуются
+    сами собой. Чтения выполняются параллельно в отдельном executor'е,
+    каждое берёт соединение из очереди и возвращает его обратно.
+
+    write_grouped() копит записи до group_interval секунд или group_size штук
+    и выполняет их одной транзакцией: каждая в своём SAVEPOINT (ошибка одной не
+    откатывает остальные), вызывающий получает результат только после COMMIT.
+    """
+
+    def __init__(self, path=DB_PATH, readers=DB_READERS, pragmas=None,
+                 group_interval=DB_GROUP_COMMIT_MS / 1000, group_size=DB_GROUP_COMMIT_BATCH,
+                 slow_ms=DB_SLOW_QUERY_MS):
+        self.path = path
+        self.readers = max(1, readers)
+        self.pragmas = get_storage_pragmas() if pragmas is None else pragmas
+        self.group_interval = group_interval
+        self.group_size = max(1, group_size)
+        self.slow_ms = slow_ms
+        self._writer = None
+        self._reader_conns = queue.Queue(maxsize=self.readers)
+        self._write_executor = None
+        self._read_executor = None
+        self._lock = threading.Lock()
+        self._group = []
+        self._group_timer = None
+        self.group_stats = {'batches': 0, 'rows': 0, 'max_batch': 0,
+                            'commit_time': 0.0, 'max_commit': 0.0, 'wait_time': 0.0, 'max_wait': 0.0}
+
+    def _connect(self, writer=False):
+        busy_timeout = int(self.pragmas.get('busy_timeout', 5000))
+        conn = sqlite3.connect(self.path, timeout=busy_timeout / 1000, check_same_thread=False,
+                               factory=AuditConnection if self.slow_ms > 0 else sqlite3.Connection)
+        if self.slow_ms > 0:
+            conn.slow_ms = self.slow_ms
+        for name, value in self.pragmas.items():
+            # journal_mode хранится в самом файле БД, его достаточно выставить писателю
+            if name == 'journal_mode' and not writer:
+                continue
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def open(self):
+        """Открывает соединения и потоки пула"""
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is not None:
+                return
+            writer = self._connect(writer=True)
+            for _ in range(self.readers):
+                self._reader_conns.put(self._connect())
+            self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-writer')
+            self._read_executor = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='db-reader')
+            self._writer = writer
+            journal_mode = writer.execute('PRAGMA journal_mode').fetchone()[0]
+        logger.info(f"🗄️ Пул БД открыт: 1 писатель, {self.readers} читателей, "
+                    f"journal_mode={journal_mode} ({self.path})")
+        if self.group_interval > 0:
+            logger.info(f"📦 Групповой коммит: до {self.group_interval * 1000:g} мс "
+                        f"или {self.group_size} записей")
+        if self.slow_ms > 0:
+            logger.info(f"🐢 Журнал медленных запросов: от {self.slow_ms:g} мс")
+
+    def close(self):
+        """Дожидается текущих запросов и закрывает все соединения"""
+        with self._lock:
+            if self._writer is None:
+                return
+            if self._group_timer is not None:
+                self._group_timer.cancel()
+                self._group_timer = None
+            if self._group:
+                # Накопленные записи коммитятся до закрытия
+                group, self._group = self._group, []
+                try:
+                    self._finish_group(group, self._write_executor.submit(self._run_group, group))
+                except RuntimeError:
+                    # event loop ожидающих уже закрыт: записи сохранены, ответить некому
+                    pass
+            self._write_executor.shutdown(wait=True)
+            self._read_executor.shutdown(wait=True)
+            while not self._reader_conns.empty():
+                self._reader_conns.get_nowait().close()
+            if str(self.pragmas.get('journal_mode', '')).upper() == 'WAL':
+                _wal_checkpoint(self._writer, 'TRUNCATE')
+            self._writer.close()
+            self._writer = None
+        logger.info("🗄️ Пул БД закрыт")
+
+    def _run_write(self, fn, args):
+        conn = self._writer
+        started = time.perf_counter()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            db_query_errors.inc('write', _query_name(fn))
+            raise
+        finally:
+            db_query_seconds.observe(time.perf_counter() - started, 'write', _query_name(fn))
+
+    def _run_read(self, fn, args):
+        conn = self._reader_conns.get()
+        started = time.perf_counter()
+        try:
+            return fn(conn, *args)
+        except Exception:
+            db_query_errors.inc('read', _query_name(fn))
+            raise
+        finally:
+            db_query_seconds.observe(time.perf_counter() - started, 'read', _query_name(fn))
+            self._reader_conns.put(conn)
+
+    def _run_group(self, group):
+        """Выполняет пачку записей одной транзакцией (в потоке писателя)"""
+        conn = self._writer
+        results = []
+        try:
+            if not conn.in_transaction:
+                conn.execute('BEGIN')
+            for fn, args, _, _ in group:
+                conn.execute('SAVEPOINT grouped_write')
+                started = time.perf_counter()
+                try:
+                    results.append((True, fn(conn, *args)))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO grouped_write')
+                    db_query_errors.inc('group', _query_name(fn))
+                    results.append((False, e))
+                db_query_seconds.observe(time.perf_counter() - started, 'group', _query_name(fn))
+                conn.execute('RELEASE grouped_write')
+            started = time.perf_counter()
+            conn.commit()
+            return results, time.perf_counter() - started
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _finish_group(self, group, done):
+        """Раздаёт результаты пачки ожидающим и обновляет метрики"""
+        try:
+            results, commit_time = done.result()
+        except Exception as e:
+            for _, _, future, _ in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        now = time.perf_counter()
+        stats = self.group_stats
+        stats['batches'] += 1
+        stats['rows'] += len(group)
+        stats['max_batch'] = max(stats['max_batch'], len(group))
+        stats['commit_time'] += commit_time
+        stats['max_commit'] = max(stats['max_commit'], commit_time)
+        for (_, _, future, queued), (ok, result) in zip(group, results):
+            stats['wait_time'] += now - queued
+            stats['max_wait'] = max(stats['max_wait'], now - queued)
+            if future.done():
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _flush_group(self):
+        if self._group_timer is not None:
+            self._group_timer.cancel()
+            self._group_timer = None
+        if not self._group:
+            return
+        group, self._group = self._group, []
+        done = asyncio.get_running_loop().run_in_executor(self._write_executor, self._run_group, group)
+        done.add_done_callback(lambda f: self._finish_group(group, f))
+
+    def group_commit_stats(self):
+        """Метрики группового коммита: размер пачек, время COMMIT и ожидания, мс"""
+        stats = self.group_stats
+        batches, rows = stats['batches'], stats['rows']
+        return {
+            'enabled': self.group_interval > 0,
+            'batches': batches,
+            'rows': rows,
+            'avg_batch': rows / batches if batches else 0,
+            'max_batch': stats['max_batch'],
+            'avg_commit_ms': stats['commit_time'] * 1000 / batches if batches else 0,
+            'max_commit_ms': stats['max_commit'] * 1000,
+            'avg_wait_ms': stats['wait_time'] * 1000 / rows if rows else 0,
+            'max_wait_ms': stats['max_wait'] * 1000,
+        }
+
+    def write_sync(self, fn, *args):
+        """Синхронная запись (для кода вне event loop)"""
+        self.open()
+        return self._write_executor.submit(self._run_write, fn, args).result()
+
+    def read_sync(self, fn, *args):
+        """Синхронное чтение (для кода вне event loop)"""
+        self.open()
+        return self._read_executor.submit(self._run_read, fn, args).result()
+
+    async def write(self, fn, *args):
+        """Выполняет fn(conn, *args) на соединении-писателе и коммитит"""
+        self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self._run_write, fn, args)
+
+    async def write_grouped(self, fn, *args):
+        """Как write(), но с групповым коммитом, если он включён"""
+        if self.group_interval <= 0:
+            return await self.write(fn, *args)
+        self.open()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._group.append((fn, args, future, time.perf_counter()))
+        if len(self._group) >= self.group_size:
+            self._flush_group()
+        elif self._group_timer is None:
+            self._group_timer = loop.call_later(self.group_interval, self._flush_group)
+        return await future
+
+    async def read(self, fn, *args):
+        """Выполняет fn(conn, *args) на свободном соединении-читателе"""
+        self.open()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, self._run_read, fn, args)
+
+
+pool = ConnectionPool()
+
+
+def _wal_checkpoint(conn, mode):
+    """Переносит содержимое WAL в основной файл БД"""
+    return conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone()
+
+
+async def checkpoint_loop(interval=DB_CHECKPOINT_INTERVAL):
+    """Периодический чекпоинт WAL, пока работает бот"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            busy, wal_pages, moved = await pool.write(_wal_checkpoint, 'PASSIVE')
+            logger.info(f"🗄️ Чекпоинт WAL: {moved}/{wal_pages} страниц" + (" (БД занята)" if busy else ""))
+        except Exception as e:
+            logger.error(f"❌ Ошибка чекпоинта WAL: {e}")
+
+
+def close_db():
+    pool.close()
+    recent_cache.clear()
+    known_users.clear()
+
+
+def _local_day_sql(column, modifiers='', offset=None):
+    """SQL: местная дата 'YYYY-MM-DD' для секунд Unix в column.
+    offset - SQL-выражение смещения пояса в секундах, по умолчанию Самара"""
+    shift = f"'{LOCAL_MODIFIER}'" if offset is None else f"({offset}) || ' seconds'"
+    return f"date({column}, 'unixepoch', {shift}{modifiers})"
+
+
+def _day_start_ts_sql(day, modifiers='', offset=None):
+    """SQL: секунды Unix начала местного дня day ('YYYY-MM-DD')"""
+    shift = f"'{UTC_MODIFIER}'" if offset is None else f"(-({offset})) || ' seconds'"
+    return f"CAST(strftime('%s', {day}{modifiers}, {shift}) AS INTEGER)"
+
+
+# Смещение пояса владельца записи w (нужен LEFT JOIN users u)
+_USER_OFFSET_SQL = f'COALESCE(u.tz_offset, {DEFAULT_OFFSET})'
+
+
+def _user_offset(conn, user_id):
+    """Смещение пояса пользователя в секундах (Самара, если пояс не выбран)"""
+    row = conn.execute('SELECT tz_offset FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row and row[0] is not None else DEFAULT_OFFSET
+
+
+# ==================== СВОДКА ПО ПОЛЬЗОВАТЕЛЯМ ====================
+_SUMMARY_SELECT = '''
+    SELECT
+        w.user_id,
+        COUNT(*),
+        SUM(w.weight),
+        MIN(w.weight),
+        MAX(w.weight),
+        MIN(w.ts),
+        MAX(w.ts),
+        (SELECT l.weight FROM weight_records l WHERE l.user_id = w.user_id ORDER BY l.ts DESC LIMIT 1),
+        (SELECT l.id FROM weight_records l WHERE l.user_id = w.user_id ORDER BY l.ts DESC LIMIT 1)
+    FROM weight_records w
+'''
+
+
+def _summary_add(conn, user_id, weight, ts, record_id):
+    """Учитывает новую запись в сводке пользователя"""
+    conn.execute('''
+        INSERT INTO user_summary (user_id, records_count, weight_sum, min_weight, max_weight,
+                                  first_ts, last_ts, last_weight, last_record_id)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            records_count = records_count + 1,
+            weight_sum = weight_sum + excluded.weight_sum,
+            min_weight = MIN(min_weight, excluded.min_weight),
+            max_weight = MAX(max_weight, excluded.max_weight),
+            first_ts = MIN(first_ts, excluded.first_ts),
+            last_weight = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_weight ELSE last_weight END,
+            last_record_id = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_record_id ELSE last_record_id END,
+            last_ts = MAX(last_ts, excluded.last_ts)
+    ''', (user_id, weight, weight, weight, ts, ts, weight, record_id))
+
+
+def _summary_refresh(conn, user_id):
+    """Пересчитывает сводку одного пользователя (после удаления записей)"""
+    conn.execute('DELETE FROM user_summary WHERE user_id = ?', (user_id,))
+    conn.execute(
+        'INSERT INTO user_summary ' + _SUMMARY_SELECT + ' WHERE w.user_id = ? GROUP BY w.user_id',
+        (user_id,)
+    )
+
+
+def _rebuild_user_summary(conn):
+    """Полностью пересобирает user_summary из weight_records"""
+    conn.execute('DELETE FROM user_summary')
+    conn.execute('INSERT INTO user_summary ' + _SUMMARY_SELECT + ' GROUP BY w.user_id')
+    return conn.execute('SELECT COUNT(*) FROM user_summary').fetchone()[0]
+
+
+def _has_other_record_in_range(conn, user_id, start_ts, end_ts, record_id):
+    return conn.execute('''
+        SELECT 1 FROM weight_records
+        WHERE user_id = ? AND ts >= ? AND ts < ? AND id != ?
+        LIMIT 1
+    ''', (user_id, start_ts, end_ts, record_id)).fetchone() is not None
+
+
+def _stats_add(conn, user_id, weight, ts, record_id):
+    """Учитывает новую запись в глобальных счётчиках и дневной корзине"""
+    conn.execute('''
+        UPDATE global_stats SET
+            total_records = total_records + 1,
+            weight_sum = weight_sum + ?,
+            min_weight = MIN(COALESCE(min_weight, ?), ?),
+            max_weight = MAX(COALESCE(max_weight, ?), ?),
+            first_ts = MIN(COALESCE(first_ts, ?), ?),
+            last_ts = MAX(COALESCE(last_ts, ?), ?)
+        WHERE id = 1
+    ''', (weight, weight, weight, weight, weight, ts, ts, ts, ts))
+
+    day, start_ts, end_ts = local_day_bounds(ts)
+    new_user_today = 0 if _has_other_record_in_range(conn, user_id, start_ts, end_ts, record_id) else 1
+    conn.execute('''
+        INSERT INTO daily_stats (day, records_count, active_users) VALUES (?, 1, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            records_count = records_count + 1,
+            active_users = active_users + excluded.active_users
+    ''', (day, new_user_today))
+
+
+def _stats_remove(conn, records):
+    """Вычитает удалённые записи [(user_id, weight, ts, id), ...] из счётчиков.
+    Вызывается после удаления и после обновления user_summary."""
+    if not records:
+        return
+
+    seen = set()
+    for user_id, weight, ts, record_id in records:
+        day, start_ts, end_ts = local_day_bounds(ts)
+        user_left_day = (
+            (user_id, day) not in seen
+            and not _has_other_record_in_range(conn, user_id, start_ts, end_ts, record_id)
+        )
+        seen.add((user_id, day))
+        conn.execute('''
+            UPDATE daily_stats SET
+                records_count = records_count - 1,
+                active_users = active_users - ?
+            WHERE day = ?
+        ''', (1 if user_left_day else 0, day))
+    conn.execute('DELETE FROM daily_stats WHERE records_count <= 0')
+
+    # Минимум/максимум нельзя вычесть: их пересчитывает проход по сводке
+    # пользователей, но только если удалена запись с текущим крайним значением
+    min_weight, max_weight, first_ts, last_ts = conn.execute(
+        'SELECT min_weight, max_weight, first_ts, last_ts FROM global_stats WHERE id = 1'
+    ).fetchone()
+    weights = [r[1] for r in records]
+    timestamps = [r[2] for r in records]
+    extremes = [
+        ('min_weight', 'MIN(min_weight)', min_weight is not None and min(weights) <= min_weight),
+        ('max_weight', 'MAX(max_weight)', max_weight is not None and max(weights) >= max_weight),
+        ('first_ts', 'MIN(first_ts)', first_ts is not None and min(timestamps) <= first_ts),
+        ('last_ts', 'MAX(last_ts)', last_ts is not None and max(timestamps) >= last_ts),
+    ]
+    refresh = ''.join(f', {column} = (SELECT {aggregate} FROM user_summary)'
+                      for column, aggregate, removed in extremes if removed)
+    conn.execute(
+        f'UPDATE global_stats SET total_records = total_records - ?, weight_sum = weight_sum - ?{refresh} WHERE id = 1',
+        (len(records), sum(weights))
+    )
+
+
+# ==================== СВЁРТКИ ИСТОРИИ ====================
+# Корзины считаются в поясе пользователя (users.tz_offset).
+# Модификаторы SQLite: от местной даты к началу корзины и длина корзины
+ROLLUP_PERIODS = {
+    'day': ("", "'+1 day'"),
+    'week': (", 'weekday 0', '-6 days'", "'+7 days'"),
+    'month': (", 'start of month'", "'+1 month'"),
+}
+
+
+def _rollup_add(conn, user_id, weight, ts, tz_offset):
+    """Учитывает новую запись в свёртках всех периодов"""
+    params = {'user_id': user_id, 'weight': weight, 'ts': ts, 'offset': tz_offset}
+    for period, (to_bucket, _) in ROLLUP_PERIODS.items():
+        conn.execute(f'''
+            INSERT INTO weight_rollups (user_id, period, bucket, records_count, weight_sum,
+                                        min_weight, max_weight, last_weight, last_ts)
+            VALUES (:user_id, :period, {_local_day_sql(':ts', to_bucket, ':offset')}, 1,
+                    :weight, :weight, :weight, :weight, :ts)
+            ON CONFLICT (user_id, period, bucket) DO UPDATE SET
+                records_count = records_count + 1,
+                weight_sum = weight_sum + excluded.weight_sum,
+                min_weight = MIN(min_weight, excluded.min_weight),
+                max_weight = MAX(max_weight, excluded.max_weight),
+                last_weight = CASE WHEN excluded.last_ts >= last_ts THEN excluded.last_weight ELSE last_weight END,
+                last_ts = MAX(last_ts, excluded.last_ts)
+        ''', dict(params, period=period))
+
+
+def _rollup_select(period, where):
+    to_bucket, length = ROLLUP_PERIODS[period]
+    bucket = _local_day_sql('w.ts', to_bucket, _USER_OFFSET_SQL)
+    return f'''
+        SELECT
+            w.user_id,
+            '{period}',
+            {bucket},
+            COUNT(*),
+            SUM(w.weight),
+            MIN(w.weight),
+            MAX(w.weight),
+            (SELECT l.weight FROM weight_records l
+             WHERE l.user_id = w.user_id
+               AND l.ts >= {_day_start_ts_sql(bucket, '', _USER_OFFSET_SQL)}
+               AND l.ts < {_day_start_ts_sql(bucket, ', ' + length, _USER_OFFSET_SQL)}
+             ORDER BY l.ts DESC LIMIT 1),
+            MAX(w.ts)
+        FROM weight_records w
+        LEFT JOIN users u ON u.user_id = w.user_id
+        {where}
+        GROUP BY w.user_id, {bucket}
+    '''
+
+
+def _rollup_refresh(conn, user_id, timestamps, tz_offset):
+    """Пересчитывает корзины пользователя, в которые попадали удалённые записи"""
+    for period, (to_bucket, length) in ROLLUP_PERIODS.items():
+        bucket = _local_day_sql(':ts', to_bucket, ':offset')
+        start, end = _day_start_ts_sql(bucket, '', ':offset'), _day_start_ts_sql(bucket, ', ' + length, ':offset')
+        buckets = {
+            conn.execute(f"SELECT {bucket}, {start}, {end}", {'ts': ts, 'offset': tz_offset}).fetchone()
+            for ts in timestamps
+        }
+        for day, start_ts, end_ts in buckets:
+            conn.execute(
+                'DELETE FROM weight_rollups WHERE user_id = ? AND period = ? AND bucket = ?',
+                (user_id, period, day)
+            )
+            conn.execute(
+                'INSERT INTO weight_rollups ' +
+                _rollup_select(period, 'WHERE w.user_id = ? AND w.ts >= ? AND w.ts < ?'),
+                (user_id, start_ts, end_ts)
+            )
+
+
+def _rebuild_rollups(conn):
+    conn.execute('DELETE FROM weight_rollups')
+    for period in ROLLUP_PERIODS:
+        conn.execute('INSERT INTO weight_rollups ' + _rollup_select(period, ''))
+
+
+def _rebuild_user_rollups(conn, user_id):
+    """Пересобирает свёртки одного пользователя (после смены пояса)"""
+    conn.execute('DELETE FROM weight_rollups WHERE user_id = ?', (user_id,))
+    for period in ROLLUP_PERIODS:
+        conn.execute('INSERT INTO weight_rollups ' + _rollup_select(period, 'WHERE w.user_id = ?'), (user_id,))
+
+
+def _get_weight_rollups(conn, user_id, period, today, count):
+    """Свёртки пользователя за последние count периодов, начиная с самых старых"""
+    to_bucket, _ = ROLLUP_PERIODS[period]
+    offset = {'day': f'-{count - 1} days', 'week': f'-{7 * (count - 1)} days', 'month': f'-{count - 1} months'}[period]
+    return conn.execute(f'''
+        SELECT bucket, records_count, weight_sum / records_count, min_weight, max_weight, last_weight
+        FROM weight_rollups
+        WHERE user_id = ? AND period = ? AND bucket >= date(?{to_bucket}, ?)
+        ORDER BY bucket
+    ''', (user_id, period, today, offset)).fetchall()
+
+
+def _rebuild_aggregates(conn):
+    """Пересобирает user_summary, global_stats, daily_stats и weight_rollups из исходных таблиц"""
+    users = _rebuild_user_summary(conn)
+    _rebuild_rollups(conn)
+
+    conn.execute('DELETE FROM global_stats')
+    conn.execute('''
+        INSERT INTO global_stats (id, total_users, total_records, weight_sum,
+                                  min_weight, max_weight, first_ts, last_ts)
+        SELECT 1, (SELECT COUNT(*) FROM users), COUNT(*), COALESCE(SUM(weight), 0),
+               MIN(weight), MAX(weight), MIN(ts), MAX(ts)
+        FROM weight_records
+    ''')
+
+    conn.execute('DELETE FROM daily_stats')
+    conn.execute(f'''
+        INSERT INTO daily_stats (day, records_count, active_users)
+        SELECT {_local_day_sql('ts')}, COUNT(*), COUNT(DISTINCT user_id)
+        FROM weight_records
+        GROUP BY {_local_day_sql('ts')}
+    ''')
+    return users
+
+
+def _verify_user_summary(conn):
+    """Сравнивает user_summary с пересчётом по weight_records.
+    Возвращает список user_id, у которых сводка разошлась с данными."""
+    expected = {row[0]: row for row in conn.execute(_SUMMARY_SELECT + ' GROUP BY w.user_id')}
+    stored = {row[0]: row for row in conn.execute('SELECT * FROM user_summary')}
+
+    drifted = []
+    for user_id in expected.keys() | stored.keys():
+        a, b = expected.get(user_id), stored.get(user_id)
+        if a is None or b is None:
+            drifted.append(user_id)
+            continue
+        for x, y in zip(a, b):
+            if isinstance(x, float) or isinstance(y, float):
+                if x is None or y is None or abs(x - y) > 1e-6:
+                    drifted.append(user_id)
+                    break
+            elif x != y:
+                drifted.append(user_id)
+                break
+    return sorted(drifted)
+
+
+# ==================== ЗАПРОСЫ ====================
+def _register_user(conn, user_id, username, first_name, last_name):
+    """Добавляет пользователя или обновляет изменившиеся имена"""
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, username, first_name, last_name))
+    if cursor.rowcount == 1:
+        conn.execute('UPDATE global_stats SET total_users = total_users + 1 WHERE id = 1')
+        return
+    conn.execute('''
+        UPDATE users SET username = ?, first_name = ?, last_name = ?
+        WHERE user_id = ? AND (username IS NOT ? OR first_name IS NOT ? OR last_name IS NOT ?)
+    ''', (username, first_name, last_name, user_id, username, first_name, last_name))
+
+
+def _get_known_users(conn, limit):
+    """Недавно активные пользователи с именами, от давних к свежим"""
+    rows = conn.execute('''
+        SELECT u.user_id, u.username, u.first_name, u.last_name
+        FROM user_summary s
+        JOIN users u ON u.user_id = s.user_id
+        ORDER BY s.last_ts DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    rows.reverse()
+    return rows
+
+
+def _save_weight(conn, user_id, weight, ts, tz_offset=None):
+    if tz_offset is None:
+        tz_offset = _user_offset(conn, user_id)
+    cursor = conn.execute('''
+        INSERT INTO weight_records (user_id, weight, ts)
+        VALUES (?, ?, ?)
+    ''', (user_id, weight, ts))
+    _summary_add(conn, user_id, weight, ts, cursor.lastrowid)
+    _stats_add(conn, user_id, weight, ts, cursor.lastrowid)
+    _rollup_add(conn, user_id, weight, ts, tz_offset)
+    return cursor.lastrowid
+
+
+def _get_last_weight(conn, user_id):
+    return conn.execute('''
+        SELECT weight, ts, id
+        FROM weight_records
+        WHERE user_id = ?
+        ORDER BY ts DESC
+        LIMIT 1
+    ''', (user_id,)).fetchone()
+
+
+def _delete_last_weight(conn, user_id):
+    record = _get_last_weight(conn, user_id)
+    if not record:
+        return None
+
+    weight, ts, last_id = record
+    conn.execute('DELETE FROM weight_records WHERE id = ?', (last_id,))
+    _summary_refresh(conn, user_id)
+    _stats_remove(conn, [(user_id, weight, ts, last_id)])
+    _rollup_refresh(conn, user_id, [ts], _user_offset(conn, user_id))
+    return weight, ts
+
+
+def _get_recent_weights(conn, user_id, limit):
+    return conn.execute('''
+        SELECT weight, ts, id
+        FROM weight_records
+        WHERE user_id = ?
+        ORDER BY ts DESC
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+def _get_weight_history(conn, user_id, limit):
+    return conn.execute('''
+        SELECT weight, ts
+        FROM weight_records
+        WHERE user_id = ?
+        ORDER BY ts DESC
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+
+def _record_weight(conn, user_id, username, first_name, last_name, weight, ts, tz_offset, recent_limit, register):
+    """Регистрирует пользователя (если register), читает recent_limit последних записей
+    (0 - не читает) и сохраняет новую в одной транзакции.
+    Возвращает (последние записи, id новой записи)."""
+    if register:
+        _register_user(conn, user_id, username, first_name, last_name)
+    recent = _get_recent_weights(conn, user_id, recent_limit) if recent_limit else None
+    return recent, _save_weight(conn, user_id, weight, ts, tz_offset)
+
+
+def _clear_history(conn, user_id):
+    records = conn.execute(
+        'SELECT user_id, weight, ts, id FROM weight_records WHERE user_id = ?', (user_id,)
+    ).fetchall()
+    conn.execute('DELETE FROM weight_records WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM user_summary WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM weight_rollups WHERE user_id = ?', (user_id,))
+    _stats_remove(conn, records)
+
+
+# ==================== КЭШ ПОСЛЕДНИХ ЗАПИСЕЙ ====================
+# user_id -> [(weight, ts, id), ...] от новых к старым: последние RECENT_RECORDS записей
+# (или все, если их меньше). Обновления одного пользователя идут по очереди
+# (concurrency.py), поэтому кэш пользователя не меняется посреди его записи.
+recent_cache = LRUCache(RECENT_CACHE_SIZE, RECENT_CACHE_TTL or None)
+watch_cache('recent_records', recent_cache)
+
+
+def _remember(user_id, record, recent=None):
+    """Write-through новой записи; без recent обновляет только уже закэшированного"""
+    if recent is None:
+        recent = recent_cache.peek(user_id)
+        if recent is None:
+            return
+    records = sorted([record, *recent], key=lambda r: r[1], reverse=True)
+    recent_cache.set(user_id, records[:RECENT_RECORDS])
+
+
+async def _recent_weights(user_id):
+    recent = recent_cache.get(user_id)
+    if recent is None:
+        recent = await pool.read(_get_recent_weights, user_id, RECENT_RECORDS)
+        recent_cache.set(user_id, recent)
+    return recent
+
+
+# user_id -> (username, first_name, last_name), как они записаны в users.
+# БД пишет только этот процесс, поэтому кэш не устаревает.
+known_users = LRUCache(KNOWN_USERS_SIZE)
+watch_cache('known_users', known_users)
+
+
+async def warm_known_users(limit=KNOWN_USERS_SIZE):
+    """Загружает недавно активных пользователей в known_users (при запуске)"""
+    for user_id, *profile in await pool.read(_get_known_users, limit):
+        known_users.set(user_id, tuple(profile))
+    return len(known_users)
+
+
+async def register_user(user_id, username, first_name, last_name):
+    """Регистрирует пользователя; для известного с теми же именами БД не трогает"""
+    profile = (username, first_name, last_name)
+    if known_users.get(user_id) == profile:
+        return
+    await pool.write(_register_user, user_id, username, first_name, last_name)
+    known_users.set(user_id, profile)
+
+
+async def save_weight(user_id, weight, ts, tz_offset=None):
+    record_id = await pool.write_grouped(_save_weight, user_id, weight, ts, tz_offset)
+    _remember(user_id, (weight, ts, record_id))
+    return record_id
+
+
+async def record_weight(user_id, username, first_name, last_name, weight, ts, tz_offset=None):
+    """Сохраняет вес, возвращает (предыдущая запись или None, id новой записи).
+    tz_offset - смещение пояса пользователя для свёрток; если не передано,
+    читается из users в той же транзакции. Если последние записи пользователя
+    в кэше, транзакция их не читает."""
+    recent = recent_cache.get(user_id)
+    profile = (username, first_name, last_name)
+    register = known_users.get(user_id) != profile
+    loaded, record_id = await pool.write_grouped(
+        _record_weight, user_id, username, first_name, last_name, weight, ts, tz_offset,
+        0 if recent is not None else RECENT_RECORDS, register
+    )
+    if register:
+        known_users.set(user_id, profile)
+    if recent is None:
+        recent = loaded
+    _remember(user_id, (weight, ts, record_id), recent)
+    return (recent[0] if recent else None), record_id
+
+
+async def get_last_weight(user_id):
+    recent = await _recent_weights(user_id)
+    return recent[0] if recent else None
+
+
+async def get_last_weight_id(user_id):
+    result = await get_last_weight(user_id)
+    return result[2] if result else None
+
+
+async def delete_last_weight(user_id):
+    try:
+        return await pool.write(_delete_last_weight, user_id)
+    finally:
+        recent_cache.pop(user_id)
+
+
+async def get_weight_history(user_id, limit=10):
+    if limit <= RECENT_RECORDS:
+        return [(weight, ts) for weight, ts, _ in (await _recent_weights(user_id))[:limit]]
+    return await pool.read(_get_weight_history, user_id, limit)
+
+
+async def get_weight_rollups(user_id, period, today, count=12):
+    """Средний/мин/макс/последний вес по корзинам period ('day', 'week', 'month')
+    за последние count корзин, считая от даты today ('YYYY-MM-DD')"""
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Неизвестный период: {period}")
+    return await pool.read(_get_weight_rollups, user_id, period, today, count)
+
+
+async def clear_weight_history(user_id):
+    try:
+        await pool.write(_clear_history, user_id)
+    finally:
+        recent_cache.pop(user_id)
+
+
+async def rebuild_aggregates():
+    return await pool.write(_rebuild_aggregates)
+
+
+async def verify_user_summary():
+    return await pool.read(_verify_user_summary)
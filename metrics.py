@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📈 Metrics for Weight Tracker Bot
+Счётчики и гистограммы задержек в памяти процесса: обработчики бота,
+запросы к БД, бэкапы. Снимаются локальным HTTP-эндпоинтом /metrics
+в текстовом формате Prometheus и сводкой в админской команде /perf.
+
+Горячий путь - одно наблюдение: bisect по границам корзин и сложение
+под блокировкой (наблюдения приходят и из потоков пула БД). Очереди и
+кэши не считаются на лету, а читаются в момент снятия метрик.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# 0 - эндпоинт выключен; /perf работает независимо от него
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9464'))
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+
+# Границы корзин, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BACKUP_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels_text(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Counter:
+    """Монотонный счётчик; inc(*labels, value=1)"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels_text(self.labels, labels), value
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами; observe(seconds, *labels)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [счётчики корзин (+Inf последней), сумма, максимум]
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0.0]
+            series[0][index] += 1
+            series[1] += value
+            if value > series[2]:
+                series[2] = value
+
+    def snapshot(self):
+        """labels -> (счётчики корзин, сумма, максимум) на текущий момент"""
+        with self._lock:
+            return {labels: (list(counts), total, peak) for labels, (counts, total, peak) in self.series.items()}
+
+    def samples(self):
+        bounds = [*(f'{bound:g}' for bound in self.buckets), '+Inf']
+        for labels, (counts, total, _) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket',
+                       _labels_text(self.labels + ('le',), labels + (bound,)), cumulative)
+            yield f'{self.name}_sum', _labels_text(self.labels, labels), total
+            yield f'{self.name}_count', _labels_text(self.labels, labels), cumulative
+
+
+class Gauge:
+    """Метрика, которая читается при снятии: fn() -> [(labels, value), ...].
+    kind='counter' - для счётчиков, которые уже ведёт сам объект (кэш, очередь)."""
+
+    def __init__(self, name, help_text, fn, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.fn = fn
+        self.kind = kind
+
+    def values(self):
+        try:
+            return [(labels, value) for labels, value in self.fn() if value is not None]
+        except Exception as e:
+            logger.error(f"❌ Метрика {self.name}: {e}")
+            return []
+
+    def samples(self):
+        for labels, value in self.values():
+            yield self.name, _labels_text(self.labels, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name, help_text, fn, labels=(), kind='gauge'):
+        """Без меток fn() возвращает число, с метками - [(labels, value), ...]"""
+        if not labels:
+            return self._add(Gauge(name, help_text, lambda: [((), fn())], kind=kind))
+        return self._add(Gauge(name, help_text, fn, labels, kind))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4"""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value:.9g}' if isinstance(value, float) else f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+handler_seconds = registry.histogram(
+    'bot_handler_seconds', 'Время обработчика обновления', ('handler',))
+handler_errors = registry.counter(
+    'bot_handler_errors_total', 'Обработчики, завершившиеся исключением', ('handler',))
+db_query_seconds = registry.histogram(
+    'db_query_seconds', 'Время запроса к БД в потоке пула (с COMMIT для записей)', ('op', 'query'))
+db_query_errors = registry.counter(
+    'db_query_errors_total', 'Запросы к БД, завершившиеся исключением', ('op', 'query'))
+db_slow_queries = registry.counter(
+    'db_slow_queries_total', 'SQL-операторы дольше DB_SLOW_QUERY_MS')
+reminder_minutes_skipped = registry.counter(
+    'reminder_minutes_skipped_total', 'Минуты напоминаний, пропущенные за окном REMINDER_CATCHUP')
+backup_seconds = registry.histogram(
+    'backup_seconds', 'Длительность этапов бэкапа', ('stage',), BACKUP_BUCKETS)
+
+# Наблюдаемые объекты: кэши по имени и приложение бота
+_caches = {}
+_watched = {}
+
+
+def watch_cache(name, cache):
+    """Публикует статистику LRUCache под меткой cache=name"""
+    _caches[name] = cache
+
+
+def watch_application(application):
+    """Публикует очереди приложения: update_queue, очереди пользователей, отправка"""
+    _watched['application'] = application
+
+
+def _cache_stat(key):
+    return lambda: [((name,), cache.stats()[key]) for name, cache in _caches.items()]
+
+
+def _update_queue_size():
+    application = _watched.get('application')
+    return application.update_queue.qsize() if application else None
+
+
+def _user_queues():
+    user_locks = getattr(_watched.get('application'), 'user_locks', None)
+    return len(user_locks) if user_locks is not None else None
+
+
+def _send_queue():
+    application = _watched.get('application')
+    return getattr(application.bot, 'rate_limiter', None) if application else None
+
+
+def _send_queue_size():
+    send_queue = _send_queue()
+    return send_queue.queue_size() if hasattr(send_queue, 'queue_size') else None
+
+
+def _send_results():
+    send_queue = _send_queue()
+    return [((result,), count) for result, count in getattr(send_queue, 'stats', {}).items()]
+
+
+registry.gauge('cache_size', 'Записей в кэше', _cache_stat('size'), ('cache',))
+registry.gauge('cache_hits_total', 'Попадания в кэш', _cache_stat('hits'), ('cache',), 'counter')
+registry.gauge('cache_misses_total', 'Промахи кэша', _cache_stat('misses'), ('cache',), 'counter')
+registry.gauge('cache_evictions_total', 'Вытеснения из кэша', _cache_stat('evictions'), ('cache',), 'counter')
+registry.gauge('bot_update_queue_size', 'Обновления в update_queue, ещё не разобранные', _update_queue_size)
+registry.gauge('bot_user_queues', 'Пользователи с обновлениями в обработке или в очереди', _user_queues)
+registry.gauge('send_queue_size', 'Сообщения в очереди отправки', _send_queue_size)
+registry.gauge('send_messages_total', 'Отправки через очередь по результату', _send_results, ('result',), 'counter')
+
+
+def quantile(counts, buckets, q):
+    """Оценка квантиля по корзинам (как histogram_quantile в Prometheus)"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for i, count in enumerate(counts):
+        if cumulative + count >= rank and count:
+            lower = buckets[i - 1] if i > 0 else 0.0
+            if i == len(buckets):
+                return lower
+            return lower + (buckets[i] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return buckets[-1]
+
+
+def summarize(histogram):
+    """[(labels, calls, mean, p50, p95, p99, max), ...] по убыванию суммарного времени"""
+    rows = []
+    for labels, (counts, total, peak) in histogram.snapshot().items():
+        calls = sum(counts)
+        # Интерполяция внутри корзины не выходит за наблюдённый максимум
+        rows.append((labels, calls, total / calls,
+                     *(min(quantile(counts, histogram.buckets, q), peak) for q in (0.5, 0.95, 0.99)), peak))
+    rows.sort(key=lambda row: -row[1] * row[2])
+    return rows
+
+
+# ==================== ОБРАБОТЧИКИ ====================
+def timed_handler(name, callback):
+    """Оборачивает callback обработчика PTB: время и исключения по имени name"""
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except asyncio.CancelledError:
+            # Отмена (остановка бота) - не ошибка обработчика
+            raise
+        except BaseException:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+    return wrapper
+
+
+def instrument_handlers(application):
+    """Оборачивает все зарегистрированные обработчики приложения"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            handler.callback = timed_handler(handler.callback.__name__, handler.callback)
+
+
+# ==================== HTTP ====================
+async def _serve(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, content_type, body = '200 OK', 'text/plain; version=0.0.4; charset=utf-8', registry.render()
+        else:
+            status, content_type, body = '404 Not Found', 'text/plain; charset=utf-8', 'not found\n'
+        payload = body.encode('utf-8')
+        writer.write(f'HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n'
+                     f'Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + payload)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(listen=METRICS_LISTEN, port=METRICS_PORT):
+    """Поднимает /metrics в текущем event loop; None, если выключен или порт занят"""
+    if not port:
+        return None
+    try:
+        server = await asyncio.start_server(_serve, listen, port)
+    except OSError as e:
+        logger.error(f"❌ Эндпоинт метрик {listen}:{port} не запущен: {e}")
+        return None
+    logger.info(f"📈 Метрики: http://{listen}:{port}/metrics")
+    return server
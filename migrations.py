@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🧬 Schema Migrations for Weight Tracker Bot
+Версионированные миграции weight_tracker.db.
+Изменения схемы (up) применяются при запуске, тяжёлое заполнение данных
+(backfill) идёт небольшими транзакциями в фоне, пока бот обслуживает пользователей.
+
+Запуск вручную: python migrations.py [--dry-run] [--backfill]
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import sqlite3
+import logging
+import argparse
+
+import db
+from db import ROLLUP_PERIODS, _SUMMARY_SELECT, _local_day_sql, _rollup_select
+from timeutils import UTC_MODIFIER, now_ts, local_day_bounds
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH = int(os.getenv('MIGRATION_BATCH', '500'))
+MIGRATION_PAUSE = float(os.getenv('MIGRATION_PAUSE', '0.05'))
+MIGRATION_PROGRESS_INTERVAL = int(os.getenv('MIGRATION_PROGRESS_INTERVAL', '60'))
+
+# Сколько дней daily_stats пересчитывается за одну порцию
+DAYS_PER_BATCH = 7
+_MIN_USER_ID = -2 ** 63
+
+
+class Migration:
+    """Одна миграция схемы.
+
+    up(conn) выполняется при запуске в одной транзакции и должен быть быстрым.
+    backfill(conn, cursor, batch_size) -> (новый курсор или None, обработано)
+    выполняется в фоне порциями; курсор сохраняется в той же транзакции,
+    поэтому заполнение продолжается с места остановки после перезапуска.
+    estimate(conn) -> примерный объём работы backfill для прогресса.
+    """
+
+    def __init__(self, version, name, up=None, backfill=None, estimate=None):
+        self.version = version
+        self.name = name
+        self.up = up
+        self.backfill = backfill
+        self.estimate = estimate
+
+
+# ==================== ТАБЛИЦЫ ====================
+def _create_users_table(conn, name='users'):
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+
+
+def _create_weight_records_table(conn, name='weight_records'):
+    # ts - момент измерения в секундах Unix (UTC)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            weight REAL NOT NULL,
+            ts INTEGER NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+
+# ==================== МИГРАЦИИ ====================
+def _initial_schema(conn):
+    _create_users_table(conn)
+    _create_weight_records_table(conn)
+
+
+def _epoch_timestamps(conn):
+    """Переводит weight_records.date (TEXT, время Самары) и users.created_at (TEXT, UTC)
+    в целые секунды Unix.
+
+    Разовое обновление со старой схемы, выполняется в up, а не в backfill:
+    весь код бота и миграции v3+ (индекс по ts, агрегаты) читают и пишут
+    только ts, поэтому работать поверх таблицы с date бот не может, а
+    двойная запись в date и ts ради одного обновления не окупается.
+    Перезапись идёт до старта бота (~1 с на миллион записей)."""
+    records_columns = {row[1] for row in conn.execute('PRAGMA table_info(weight_records)')}
+    users_columns = {row[1]: row[2] for row in conn.execute('PRAGMA table_info(users)')}
+
+    # Новая таблица создаётся рядом и переименовывается после удаления старой,
+    # чтобы ALTER TABLE не переписал ссылки FOREIGN KEY на временное имя
+    if users_columns.get('created_at', 'INTEGER') != 'INTEGER':
+        _create_users_table(conn, 'users_new')
+        conn.execute('''
+            INSERT INTO users_new (user_id, username, first_name, last_name, created_at)
+            SELECT user_id, username, first_name, last_name,
+                   COALESCE(CAST(strftime('%s', created_at) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))
+            FROM users
+        ''')
+        conn.execute('DROP TABLE users')
+        conn.execute('ALTER TABLE users_new RENAME TO users')
+
+    if 'date' in records_columns:
+        records = conn.execute('SELECT COUNT(*) FROM weight_records').fetchone()[0]
+        logger.info(f"🧬 Перезапись weight_records в секунды Unix: {records} записей одной транзакцией")
+        _create_weight_records_table(conn, 'weight_records_new')
+        conn.execute(f'''
+            INSERT INTO weight_records_new (id, user_id, weight, ts)
+            SELECT id, user_id, weight, CAST(strftime('%s', date, '{UTC_MODIFIER}') AS INTEGER)
+            FROM weight_records
+            WHERE date IS NOT NULL
+        ''')
+        conn.execute('DROP TABLE weight_records')
+        conn.execute('ALTER TABLE weight_records_new RENAME TO weight_records')
+
+
+def _weight_records_indexes(conn):
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_weight_records
+        ON weight_records (user_id, ts DESC)
+    ''')
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_weight_records_ts
+        ON weight_records (ts)
+    ''')
+
+
+def _aggregate_tables(conn):
+    # Агрегаты по пользователю, обновляются при каждой записи/удалении
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_summary (
+            user_id INTEGER PRIMARY KEY,
+            records_count INTEGER NOT NULL,
+            weight_sum REAL NOT NULL,
+            min_weight REAL,
+            max_weight REAL,
+            first_ts INTEGER,
+            last_ts INTEGER,
+            last_weight REAL,
+            last_record_id INTEGER
+        )
+    ''')
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_summary_count
+        ON user_summary (records_count DESC)
+    ''')
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_summary_last_ts
+        ON user_summary (last_ts)
+    ''')
+
+    # Глобальные счётчики для /stats (одна строка)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS global_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_users INTEGER NOT NULL,
+            total_records INTEGER NOT NULL,
+            weight_sum REAL NOT NULL,
+            min_weight REAL,
+            max_weight REAL,
+            first_ts INTEGER,
+            last_ts INTEGER
+        )
+    ''')
+
+    # Дневные корзины (местные дни Самары): записей и уникальных пользователей за день
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            records_count INTEGER NOT NULL,
+            active_users INTEGER NOT NULL
+        )
+    ''')
+
+    # Свёртки истории пользователя по дням/неделям/месяцам (местное время пользователя)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weight_rollups (
+            user_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            records_count INTEGER NOT NULL,
+            weight_sum REAL NOT NULL,
+            min_weight REAL NOT NULL,
+            max_weight REAL NOT NULL,
+            last_weight REAL NOT NULL,
+            last_ts INTEGER NOT NULL,
+            PRIMARY KEY (user_id, period, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+    # Содержимое пересобирается в backfill; пока он идёт, живые записи
+    # обновляют агрегаты как обычно, global_stats пересчитывается в конце
+    for table in ('user_summary', 'daily_stats', 'weight_rollups', 'global_stats'):
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute('INSERT INTO global_stats (id, total_users, total_records, weight_sum) VALUES (1, 0, 0, 0)')
+
+
+def _estimate_aggregates(conn):
+    users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    first_ts = conn.execute('SELECT MIN(ts) FROM weight_records').fetchone()[0]
+    days = (now_ts() - first_ts) // 86400 + 1 if first_ts else 0
+    return users + days + 1
+
+
+def _backfill_aggregates(conn, cursor, batch_size):
+    """Заполняет user_summary/weight_rollups порциями пользователей,
+    затем daily_stats порциями дней, затем global_stats из user_summary.
+
+    Каждая порция пересчитывает свой диапазон целиком из weight_records,
+    поэтому записи, сделанные ботом во время заполнения, не теряются."""
+    cursor = cursor or {'phase': 'users', 'after': _MIN_USER_ID}
+
+    if cursor['phase'] == 'users':
+        ids = [row[0] for row in conn.execute('''
+            SELECT DISTINCT user_id FROM weight_records
+            WHERE user_id > ?
+            ORDER BY user_id
+            LIMIT ?
+        ''', (cursor['after'], batch_size))]
+        if not ids:
+            first_ts = conn.execute('SELECT MIN(ts) FROM weight_records').fetchone()[0]
+            start = local_day_bounds(first_ts)[1] if first_ts is not None else now_ts()
+            return {'phase': 'days', 'from': start}, 0
+
+        bounds = (cursor['after'], ids[-1])
+        conn.execute('DELETE FROM user_summary WHERE user_id > ? AND user_id <= ?', bounds)
+        conn.execute(
+            'INSERT INTO user_summary ' + _SUMMARY_SELECT +
+            ' WHERE w.user_id > ? AND w.user_id <= ? GROUP BY w.user_id',
+            bounds
+        )
+        conn.execute('DELETE FROM weight_rollups WHERE user_id > ? AND user_id <= ?', bounds)
+        for period in ROLLUP_PERIODS:
+            conn.execute(
+                'INSERT INTO weight_rollups ' + _rollup_select(period, 'WHERE w.user_id > ? AND w.user_id <= ?'),
+                bounds
+            )
+        return {'phase': 'users', 'after': ids[-1]}, len(ids)
+
+    if cursor['phase'] == 'days':
+        start = cursor['from']
+        if start > now_ts():
+            return {'phase': 'global'}, 0
+
+        end = start + DAYS_PER_BATCH * 86400
+        conn.execute(
+            'DELETE FROM daily_stats WHERE day >= ? AND day < ?',
+            (local_day_bounds(start)[0], local_day_bounds(end)[0])
+        )
+        conn.execute(f'''
+            INSERT INTO daily_stats (day, records_count, active_users)
+            SELECT {_local_day_sql('ts')}, COUNT(*), COUNT(DISTINCT user_id)
+            FROM weight_records
+            WHERE ts >= ? AND ts < ?
+            GROUP BY {_local_day_sql('ts')}
+        ''', (start, end))
+        return {'phase': 'days', 'from': end}, DAYS_PER_BATCH
+
+    conn.execute('DELETE FROM global_stats')
+    conn.execute('''
+        INSERT INTO global_stats (id, total_users, total_records, weight_sum,
+                                  min_weight, max_weight, first_ts, last_ts)
+        SELECT 1, (SELECT COUNT(*) FROM users), COALESCE(SUM(records_count), 0), COALESCE(SUM(weight_sum), 0),
+               MIN(min_weight), MAX(max_weight), MIN(first_ts), MAX(last_ts)
+        FROM user_summary
+    ''')
+    return None, 1
+
+
+def _reminders_table(conn):
+    # Ежедневные напоминания: local_minute - выбранная пользователем минута суток
+    # (местное время), utc_minute - та же минута по UTC, по ней планировщик
+    # раз в минуту выбирает только тех, кому пора напомнить
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            user_id INTEGER PRIMARY KEY,
+            local_minute INTEGER NOT NULL,
+            utc_minute INTEGER NOT NULL,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )
+    ''')
+
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reminders_utc_minute
+        ON reminders (utc_minute, user_id)
+    ''')
+
+
+def _user_timezones(conn):
+    # Пояс пользователя: tz - имя IANA, tz_offset - его смещение от UTC в секундах,
+    # по нему считаются корзины свёрток. NULL - пояс по умолчанию (Самара),
+    # поэтому существующие свёртки остаются верными и пересчёт не нужен
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+    if 'tz' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN tz TEXT')
+    if 'tz_offset' not in columns:
+        conn.execute('ALTER TABLE users ADD COLUMN tz_offset INTEGER')
+
+
+def _users_created_index(conn):
+    # Список пользователей в админке листается по ключу (created_at, user_id):
+    # каждая страница - короткий проход по индексу от курсора
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_created_at
+        ON users (created_at, user_id)
+    ''')
+
+
+MIGRATIONS = [
+    Migration(1, 'initial_schema', up=_initial_schema),
+    Migration(2, 'epoch_timestamps', up=_epoch_timestamps),
+    Migration(3, 'weight_records_indexes', up=_weight_records_indexes),
+    Migration(4, 'aggregates', up=_aggregate_tables, backfill=_backfill_aggregates, estimate=_estimate_aggregates),
+    Migration(5, 'reminders', up=_reminders_table),
+    Migration(6, 'user_timezones', up=_user_timezones),
+    Migration(7, 'users_created_index', up=_users_created_index),
+]
+
+
+# ==================== ДВИЖОК ====================
+def _ensure_migrations_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            backfill_cursor TEXT,
+            backfill_done INTEGER NOT NULL DEFAULT 0,
+            backfill_total INTEGER,
+            applied_at INTEGER
+        )
+    ''')
+
+
+def _applied_versions(conn):
+    _ensure_migrations_table(conn)
+    return {row[0] for row in conn.execute('SELECT version FROM schema_migrations')}
+
+
+def _apply(conn, migration):
+    """Применяет up миграции и записывает её статус в той же транзакции"""
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    if migration.up:
+        migration.up(conn)
+
+    if migration.backfill:
+        total = migration.estimate(conn) if migration.estimate else None
+        status = 'backfill'
+    else:
+        total = None
+        status = 'applied'
+    conn.execute('''
+        INSERT INTO schema_migrations (version, name, status, backfill_total, applied_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (migration.version, migration.name, status, total, now_ts()))
+
+
+def _apply_pending(conn):
+    """Применяет все ожидающие миграции на одном соединении (без пула)"""
+    applied = _applied_versions(conn)
+    for migration in MIGRATIONS:
+        if migration.version not in applied:
+            _apply(conn, migration)
+
+
+def _plan(conn):
+    """Описание ожидающих миграций (для --dry-run), без изменений в БД"""
+    has_table = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_migrations'"
+    ).fetchone()
+    applied = {row[0] for row in conn.execute('SELECT version FROM schema_migrations')} if has_table else set()
+
+    plan = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        line = f"v{migration.version} {migration.name}"
+        if migration.backfill:
+            # Объём можно оценить, только если схема до этой миграции уже актуальна
+            estimate = migration.estimate(conn) if migration.estimate and not plan else '?'
+            line += f" + фоновое заполнение (~{estimate} ед.)"
+        plan.append(line)
+    return plan
+
+
+def _dry_run_plan(path):
+    """План на отдельном соединении только для чтения: пул не открывается,
+    поэтому journal_mode и PRAGMA файла не меняются и -wal/-shm не создаются"""
+    if os.path.exists(path):
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    else:
+        # БД ещё нет: ожидают все миграции
+        conn = sqlite3.connect(':memory:')
+    try:
+        return _plan(conn)
+    finally:
+        conn.close()
+
+
+def migrate(dry_run=False):
+    """Применяет ожидающие миграции. Возвращает список применённых (или
+    запланированных при dry_run) миграций."""
+    if dry_run:
+        return _dry_run_plan(db.pool.path)
+
+    applied = db.pool.write_sync(_applied_versions)
+    done = []
+    for migration in MIGRATIONS:
+        if migration.version in applied:
+            continue
+        logger.info(f"🧬 Миграция v{migration.version} {migration.name}...")
+        db.pool.write_sync(_apply, migration)
+        done.append(f"v{migration.version} {migration.name}")
+    return done
+
+
+def init_db():
+    """Создаёт/обновляет схему БД и открывает пул соединений"""
+    os.makedirs(os.path.dirname(db.pool.path) or '.', exist_ok=True)
+    migrate()
+    print("✅ База данных инициализирована")
+
+
+def _backfill_step(conn, migration, batch_size):
+    row = conn.execute(
+        'SELECT backfill_cursor, backfill_done, backfill_total FROM schema_migrations WHERE version = ?',
+        (migration.version,)
+    ).fetchone()
+    cursor = json.loads(row[0]) if row[0] else None
+    new_cursor, processed = migration.backfill(conn, cursor, batch_size)
+    done = row[1] + processed
+
+    if new_cursor is None:
+        conn.execute('''
+            UPDATE schema_migrations
+            SET status = 'applied', backfill_cursor = NULL, backfill_done = ?, applied_at = ?
+            WHERE version = ?
+        ''', (done, now_ts(), migration.version))
+    else:
+        conn.execute(
+            'UPDATE schema_migrations SET backfill_cursor = ?, backfill_done = ? WHERE version = ?',
+            (json.dumps(new_cursor), done, migration.version)
+        )
+    return new_cursor is None, done, row[2]
+
+
+def _pending_backfills(conn):
+    versions = {row[0] for row in conn.execute("SELECT version FROM schema_migrations WHERE status = 'backfill'")}
+    return [m for m in MIGRATIONS if m.version in versions]
+
+
+def _backfill_all(conn, batch_size=MIGRATION_BATCH):
+    """Выполняет незавершённые backfill-миграции до конца на одном соединении"""
+    for migration in _pending_backfills(conn):
+        while not _backfill_step(conn, migration, batch_size)[0]:
+            pass
+
+
+async def run_backfills(batch_size=MIGRATION_BATCH, pause=MIGRATION_PAUSE, progress=None):
+    """Выполняет незавершённые backfill-миграции порциями.
+    Между порциями отдаёт управление, чтобы запросы пользователей шли без задержек.
+    progress - async-функция(text) для отчётов админу."""
+    for migration in await db.pool.read(_pending_backfills):
+        title = f"v{migration.version} {migration.name}"
+        logger.info(f"🧬 Фоновое заполнение {title}...")
+        if progress:
+            await progress(f"🧬 Миграция {title}: начато фоновое заполнение")
+
+        started = last_report = time.monotonic()
+        finished = False
+        while not finished:
+            finished, done, total = await db.pool.write(_backfill_step, migration, batch_size)
+            if progress and time.monotonic() - last_report >= MIGRATION_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                percent = f" ({min(100, done * 100 // total)}%)" if total else ""
+                await progress(f"🧬 Миграция {title}: {done}/{total or '?'}{percent}")
+            await asyncio.sleep(pause)
+
+        elapsed = time.monotonic() - started
+        logger.info(f"✅ Миграция {title} завершена за {elapsed:.1f} с")
+        if progress:
+            await progress(f"✅ Миграция {title} завершена за {elapsed:.1f} с")
+
+
+def _status(conn):
+    return conn.execute('''
+        SELECT version, name, status, backfill_done, backfill_total, applied_at
+        FROM schema_migrations ORDER BY version
+    ''').fetchall()
+
+
+async def get_migrations_status():
+    """[(version, name, status, done, total, applied_at), ...] + ожидающие версии"""
+    rows = await db.pool.read(_status)
+    known = {row[0] for row in rows}
+    pending = [f"v{m.version} {m.name}" for m in MIGRATIONS if m.version not in known]
+    return rows, pending
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Миграции weight_tracker.db')
+    parser.add_argument('--dry-run', action='store_true', help='только показать ожидающие миграции')
+    parser.add_argument('--backfill', action='store_true', help='сразу выполнить фоновые заполнения')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if args.dry_run:
+            plan = migrate(dry_run=True)
+            print("\n".join(plan) if plan else "✅ Схема актуальна")
+            return
+
+        for line in migrate():
+            print(f"✅ {line}")
+
+        if args.backfill:
+            async def report(text):
+                print(text)
+            asyncio.run(run_backfills(pause=0, progress=report))
+    finally:
+        db.close_db()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🔎 Query Plan Audit for Weight Tracker Bot
+Выполняет все зарегистрированные запросы бота (QUERIES) на временной БД,
+собирает каждый SQL-оператор с параметрами и прогоняет его через
+EXPLAIN QUERY PLAN. Полный просмотр weight_records (SCAN) - ошибка, кроме
+обслуживающих запросов, которые читают всю таблицу по назначению.
+
+Каждый запрос выполняется в своей транзакции и откатывается, поэтому
+данные для следующих запросов не меняются. С --db аудит идёт на копии
+настоящей БД (online backup API), сама БД не изменяется.
+
+Каждая закрытая функция запроса fn(conn, ...) в модулях MODULES должна быть
+в QUERIES или в EXEMPT, иначе новый запрос молча выпал бы из аудита.
+
+Запуск: python query_audit.py [--db data/weight_tracker.db] [--verbose]
+Код выхода 1 (для CI), если найден недопустимый просмотр weight_records,
+запрос упал с исключением или функция запроса не учтена в аудите.
+"""
+
+import os
+import re
+import sys
+import inspect
+import sqlite3
+import argparse
+import tempfile
+
+import db
+import migrations
+import reminders
+import timezones
+import admin_stats
+
+# Таблица, полный просмотр которой недопустим на горячем пути
+AUDITED_TABLE = 'weight_records'
+
+# Данные временной БД: пользователи с историей и один без записей
+USERS = 50
+RECORDS_PER_USER = 40
+AUDIT_USER = 1
+EMPTY_USER = USERS + 1
+FIRST_TS = 1704067200  # 2024-01-01 UTC
+TODAY = '2024-02-15'
+
+_KEYWORDS = {'WHERE', 'ON', 'GROUP', 'ORDER', 'LEFT', 'JOIN', 'INNER', 'CROSS', 'LIMIT', 'USING', 'SET', 'VALUES'}
+_ALIAS = re.compile(rf'\b{AUDITED_TABLE}\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+_SCAN = re.compile(r'^SCAN (\w+)')
+
+
+def _zone():
+    return timezones.make_zone('Asia/Yekaterinburg', 5 * 3600)
+
+
+# (имя, fn(conn, *args), args, полный просмотр допустим)
+QUERIES = [
+    # Запись и чтение веса
+    ('db._register_user', db._register_user, (EMPTY_USER, 'audit', 'Audit', None), False),
+    ('db._get_known_users', db._get_known_users, (1000,), False),
+    ('db._record_weight', db._record_weight,
+     (AUDIT_USER, 'user1', 'User', None, 81.5, FIRST_TS + 60 * 86400, None, 10, True), False),
+    ('db._save_weight', db._save_weight, (AUDIT_USER, 80.0, FIRST_TS + 61 * 86400), False),
+    ('db._get_last_weight', db._get_last_weight, (AUDIT_USER,), False),
+    ('db._get_recent_weights', db._get_recent_weights, (AUDIT_USER, 10), False),
+    ('db._get_weight_history', db._get_weight_history, (AUDIT_USER, 30), False),
+    ('db._delete_last_weight', db._delete_last_weight, (AUDIT_USER,), False),
+    ('db._clear_history', db._clear_history, (AUDIT_USER,), False),
+    ('db._get_weight_rollups(day)', db._get_weight_rollups, (AUDIT_USER, 'day', TODAY, 90), False),
+    ('db._get_weight_rollups(week)', db._get_weight_rollups, (AUDIT_USER, 'week', TODAY, 52), False),
+    ('db._get_weight_rollups(month)', db._get_weight_rollups, (AUDIT_USER, 'month', TODAY, 24), False),
+    # Часовые пояса и напоминания
+    ('timezones._get_user_tz', timezones._get_user_tz, (AUDIT_USER,), False),
+    ('timezones._set_user_tz', timezones._set_user_tz, (AUDIT_USER, 'user1', 'User', None, _zone()), False),
+    ('reminders._set_reminder', reminders._set_reminder, (AUDIT_USER, 8 * 60, 4 * 3600), False),
+    ('reminders._get_reminder', reminders._get_reminder, (AUDIT_USER,), False),
+    ('reminders._due_reminders', reminders._due_reminders, (FIRST_TS // 60 + 4 * 60, 0, 500), False),
+    ('reminders._delete_reminders', reminders._delete_reminders, ([AUDIT_USER, 2],), False),
+    # Админка
+    ('admin_stats._get_db_stats', admin_stats._get_db_stats, (), False),
+    ('admin_stats._get_users_page(first)', admin_stats._get_users_page, (), False),
+    ('admin_stats._get_users_page(older)', admin_stats._get_users_page,
+     (admin_stats.USERS_OLDER, (FIRST_TS, USERS // 2)), False),
+    ('admin_stats._get_users_page(newer)', admin_stats._get_users_page,
+     (admin_stats.USERS_NEWER, (FIRST_TS, USERS // 2)), False),
+    ('admin_stats._get_detailed_user_stats', admin_stats._get_detailed_user_stats, (AUDIT_USER,), False),
+    # Обслуживание: пересборка и сверка читают weight_records целиком
+    ('db._verify_user_summary', db._verify_user_summary, (), True),
+    ('db._rebuild_aggregates', db._rebuild_aggregates, (), True),
+    ('migrations._backfill_all', migrations._backfill_all, (), False),
+]
+
+# Модули, функции запросов которых должны быть учтены в аудите
+MODULES = (db, reminders, timezones, admin_stats)
+
+# Функции fn(conn, ...), которые не проверяются отдельно: их SQL уже попадает
+# в аудит через вызывающий запрос (указан) или не читает таблиц
+EXEMPT = {
+    'db._wal_checkpoint': 'PRAGMA wal_checkpoint',
+    'db._user_offset': 'db._save_weight',
+    'db._summary_add': 'db._save_weight',
+    'db._stats_add': 'db._save_weight',
+    'db._rollup_add': 'db._save_weight',
+    'db._has_other_record_in_range': 'db._save_weight, db._delete_last_weight',
+    'db._summary_refresh': 'db._delete_last_weight',
+    'db._stats_remove': 'db._delete_last_weight, db._clear_history',
+    'db._rollup_refresh': 'db._delete_last_weight',
+    'db._rebuild_user_summary': 'db._rebuild_aggregates',
+    'db._rebuild_rollups': 'db._rebuild_aggregates',
+    'db._rebuild_user_rollups': 'timezones._set_user_tz',
+}
+
+
+def _seed(conn):
+    """Схема миграций и немного истории: USERS пользователей по RECORDS_PER_USER записей"""
+    migrations._apply_pending(conn)
+    conn.commit()
+    for user_id in range(1, USERS + 1):
+        db._register_user(conn, user_id, f'user{user_id}', 'User', None)
+        for day in range(RECORDS_PER_USER):
+            db._save_weight(conn, user_id, 70 + (user_id + day) % 15 * 0.5, FIRST_TS + day * 86400 + user_id * 60)
+    conn.executemany('UPDATE users SET created_at = ? WHERE user_id = ?',
+                     ((FIRST_TS + (uid // 3) * 3600, uid) for uid in range(1, USERS + 1)))
+    reminders._set_reminder(conn, 2, 8 * 60, 4 * 3600)
+    # Повторное заполнение агрегатов для migrations._backfill_all
+    conn.execute("UPDATE schema_migrations SET status = 'backfill', backfill_cursor = NULL WHERE version = 4")
+    conn.commit()
+
+
+def _copy(source, target):
+    src = sqlite3.connect(f'file:{source}?mode=ro', uri=True)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def _collect(conn, fn, args):
+    """Выполняет запрос в транзакции с откатом, возвращает [(sql, params), ...]"""
+    conn.statements = []
+    try:
+        fn(conn, *args)
+    finally:
+        statements, conn.statements = conn.statements, None
+        conn.rollback()
+    return statements
+
+
+def query_functions():
+    """Имена закрытых функций fn(conn, ...), объявленных в MODULES"""
+    names = set()
+    for module in MODULES:
+        for name, fn in vars(module).items():
+            if (name.startswith('_') and inspect.isfunction(fn) and fn.__module__ == module.__name__
+                    and next(iter(inspect.signature(fn).parameters), None) == 'conn'):
+                names.add(f'{module.__name__}.{name}')
+    return names
+
+
+def check_coverage():
+    """Печатает неучтённые функции запросов и устаревшие исключения; возвращает их число"""
+    found = query_functions()
+    listed = {f'{fn.__module__}.{fn.__name__}' for _, fn, _, _ in QUERIES}
+    missing = sorted(found - listed - set(EXEMPT))
+    stale = sorted(set(EXEMPT) - found)
+    for name in missing:
+        print(f"❌ {name}: функция запроса не в QUERIES и не в EXEMPT")
+    for name in stale:
+        print(f"❌ {name}: в EXEMPT, но такой функции запроса нет")
+    return len(missing) + len(stale)
+
+
+def full_scans(conn, sql, params):
+    """(план, строки плана с полным просмотром AUDITED_TABLE)"""
+    names = {AUDITED_TABLE} | {alias for alias in _ALIAS.findall(sql) if alias.upper() not in _KEYWORDS}
+    plan = db.explain(conn, sql, params)
+    scans = [line for line in plan if (match := _SCAN.match(line)) and match.group(1) in names]
+    return plan, scans
+
+
+def _inspect(conn, fn, args, verbose):
+    """(число разных операторов, [(sql, план) с полным просмотром AUDITED_TABLE])"""
+    seen = set()
+    problems = []
+    for sql, params in _collect(conn, fn, args):
+        if sql in seen:
+            continue
+        seen.add(sql)
+        plan, scans = full_scans(conn, sql, params)
+        if scans:
+            problems.append((sql, plan))
+        if verbose and plan:
+            print(f"   {' '.join(sql.split())[:100]}")
+            for line in plan:
+                print(f"      {line}")
+    return len(seen), problems
+
+
+def audit(conn, verbose=False):
+    """Печатает отчёт; возвращает число недопустимых полных просмотров и упавших запросов"""
+    failures = 0
+    for name, fn, args, scan_ok in QUERIES:
+        # Упавший запрос - ошибка аудита, остальные всё равно проверяются
+        try:
+            statements, problems = _inspect(conn, fn, args, verbose)
+        except Exception as e:
+            failures += 1
+            print(f"❌ {name}: ошибка запроса: {e!r}")
+            continue
+
+        if problems and not scan_ok:
+            failures += len(problems)
+            print(f"❌ {name}: полный просмотр {AUDITED_TABLE}")
+            for sql, plan in problems:
+                print(f"   SQL: {' '.join(sql.split())}")
+                print(f"   План: {' ; '.join(plan)}")
+        elif problems:
+            print(f"⚠️ {name}: полный просмотр {AUDITED_TABLE} (обслуживание, допустимо)")
+        else:
+            print(f"✅ {name}: операторов {statements}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN QUERY PLAN для всех запросов бота')
+    parser.add_argument('--db', help='проверить на копии этой БД (по умолчанию - временная с тестовыми данными)')
+    parser.add_argument('--verbose', action='store_true', help='печатать планы всех операторов')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'audit.db')
+        if args.db:
+            _copy(args.db, path)
+        conn = sqlite3.connect(path, factory=db.AuditConnection)
+        conn.slow_ms = 0
+        try:
+            if args.db:
+                migrations._apply_pending(conn)
+                conn.commit()
+            else:
+                _seed(conn)
+            failures = check_coverage() + audit(conn, args.verbose)
+        finally:
+            conn.close()
+
+    if failures:
+        print(f"\n❌ Проблем аудита: {failures}")
+        return 1
+    print(f"\n✅ Все запросы обходятся без полного просмотра {AUDITED_TABLE}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
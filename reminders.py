@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+⏰ Daily Weigh-in Reminders for Weight Tracker Bot
+Пользователь выбирает время в своём поясе (/remind 08:00), напоминание приходит каждый день.
+Таблица reminders проиндексирована по минуте суток UTC, поэтому задача JobQueue
+раз в минуту читает только тех, кому пора, порциями по REMINDER_BATCH,
+и не трогает users. Кто уже взвесился сегодня, напоминание не получает.
+Отправка идёт через SendQueue в фоновой полосе, лимиты Telegram соблюдаются там.
+"""
+
+import os
+import asyncio
+import logging
+from telegram import Update
+from telegram.error import Forbidden
+from telegram.ext import ContextTypes
+
+import db
+from metrics import reminder_minutes_skipped
+from send_queue import PRIORITY_BACKGROUND, send_lane
+from timezones import get_user_zone
+from timeutils import MINUTES_PER_DAY, now_ts, parse_local_time, format_minute, utc_minute_of_day
+
+logger = logging.getLogger(__name__)
+
+REMINDER_BATCH = int(os.getenv('REMINDER_BATCH', '500'))
+# Сколько пропущенных минут догонять, если задача опоздала (event loop был занят,
+# предыдущая рассылка не уложилась в минуту). Более старые минуты пропускаются
+# с предупреждением в логе и счётчиком reminder_minutes_skipped_total в /metrics
+REMINDER_CATCHUP = int(os.getenv('REMINDER_CATCHUP', '15'))
+REMINDER_JOB_NAME = 'reminders'
+
+REMINDER_TEXT = "⏰ Пора взвеситься! Отправьте вес числом (например: 75.5)"
+
+_MIN_USER_ID = -2 ** 63
+
+
+# ==================== ЗАПРОСЫ ====================
+def _set_reminder(conn, user_id, local_minute, tz_offset):
+    conn.execute('''
+        INSERT INTO reminders (user_id, local_minute, utc_minute) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET
+            local_minute = excluded.local_minute,
+            utc_minute = excluded.utc_minute
+    ''', (user_id, local_minute, utc_minute_of_day(local_minute, tz_offset)))
+
+
+def _get_reminder(conn, user_id):
+    row = conn.execute('SELECT local_minute FROM reminders WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+
+def _delete_reminders(conn, user_ids):
+    conn.executemany('DELETE FROM reminders WHERE user_id = ?', ((uid,) for uid in user_ids))
+
+
+def _due_reminders(conn, minute, after, limit):
+    """Следующая порция пользователей с напоминанием на минуту minute (целые минуты Unix,
+    user_id > after), которые ещё не взвешивались сегодня. В момент напоминания у
+    пользователя local_minute минут местных суток, отсюда начало его дня."""
+    return [row[0] for row in conn.execute('''
+        SELECT r.user_id
+        FROM reminders r
+        LEFT JOIN user_summary s ON s.user_id = r.user_id
+        WHERE r.utc_minute = ? AND r.user_id > ?
+          AND (s.last_ts IS NULL OR s.last_ts < ? - r.local_minute * 60)
+        ORDER BY r.user_id
+        LIMIT ?
+    ''', (minute % MINUTES_PER_DAY, after, minute * 60, limit))]
+
+
+async def set_reminder(user_id, local_minute, tz_offset):
+    await db.pool.write(_set_reminder, user_id, local_minute, tz_offset)
+
+
+async def get_reminder(user_id):
+    return await db.pool.read(_get_reminder, user_id)
+
+
+async def delete_reminder(user_id):
+    await db.pool.write(_delete_reminders, [user_id])
+
+
+# ==================== РАССЫЛКА ====================
+async def send_reminders(bot, minute, batch_size=REMINDER_BATCH):
+    """Рассылает напоминания за минуту minute (целые минуты Unix).
+    Возвращает (отправлено, отписано, ошибок)."""
+    sent = removed = failed = 0
+    after = _MIN_USER_ID
+    with send_lane(PRIORITY_BACKGROUND):
+        while True:
+            user_ids = await db.pool.read(_due_reminders, minute, after, batch_size)
+            if not user_ids:
+                break
+            after = user_ids[-1]
+
+            results = await asyncio.gather(
+                *(bot.send_message(chat_id=user_id, text=REMINDER_TEXT) for user_id in user_ids),
+                return_exceptions=True
+            )
+            # Пользователь заблокировал бота - напоминания ему больше не нужны
+            blocked = [uid for uid, result in zip(user_ids, results) if isinstance(result, Forbidden)]
+            if blocked:
+                await db.pool.write(_delete_reminders, blocked)
+            errors = sum(1 for r in results if isinstance(r, Exception)) - len(blocked)
+            sent += len(user_ids) - len(blocked) - errors
+            removed += len(blocked)
+            failed += errors
+
+            if len(user_ids) < batch_size:
+                break
+    return sent, removed, failed
+
+
+async def reminder_job(context):
+    """Задача JobQueue: раз в минуту рассылает напоминания, наверстывая пропущенные минуты"""
+    current = now_ts() // 60
+    last = context.bot_data.get('reminders_minute', current - 1)
+    first = current - REMINDER_CATCHUP + 1
+    if last + 1 < first:
+        # Рассылка отстала больше чем на окно догона: эти минуты не отправляются
+        skipped = first - last - 1
+        reminder_minutes_skipped.inc(value=skipped)
+        logger.warning(f"⚠️ Напоминания отстали: пропущено минут {skipped} "
+                       f"({format_minute((last + 1) % MINUTES_PER_DAY)}-{format_minute((first - 1) % MINUTES_PER_DAY)} UTC), "
+                       f"окно REMINDER_CATCHUP={REMINDER_CATCHUP}")
+    for minute in range(max(last + 1, first), current + 1):
+        try:
+            sent, removed, failed = await send_reminders(context.bot, minute)
+        except Exception as e:
+            logger.error(f"❌ Ошибка рассылки напоминаний: {e}")
+            sent = removed = failed = 0
+        context.bot_data['reminders_minute'] = minute
+        if sent or removed or failed:
+            logger.info(f"⏰ Напоминания {format_minute(minute % MINUTES_PER_DAY)} UTC: "
+                        f"отправлено {sent}, отписано {removed}, ошибок {failed}")
+
+
+def schedule_reminders(application):
+    """Ставит рассылку напоминаний в JobQueue, с запуском в начале каждой минуты"""
+    if application.job_queue is None:
+        logger.error("❌ JobQueue недоступна: напоминания отключены")
+        return None
+
+    job = application.job_queue.run_repeating(
+        reminder_job,
+        interval=60,
+        first=60 - now_ts() % 60,
+        name=REMINDER_JOB_NAME,
+        job_kwargs={
+            # Пока идёт долгая рассылка, новые запуски не копятся:
+            # следующий сам догонит пропущенные минуты
+            'misfire_grace_time': 60,
+            'coalesce': True,
+            'max_instances': 1,
+        },
+    )
+    logger.info("⏰ Напоминания: проверка каждую минуту")
+    return job
+
+
+# ==================== КОМАНДА ====================
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/remind - показать время, /remind 08:00 - включить, /remind off - выключить"""
+    user_id = update.effective_user.id
+    args = context.args or []
+    zone = await get_user_zone(user_id)
+
+    if not args:
+        minute = await get_reminder(user_id)
+        if minute is None:
+            await update.message.reply_text(
+                "🔕 Напоминание выключено.\n"
+                f"Включить: /remind 08:00 (пояс {zone.label}, сменить: /timezone)"
+            )
+        else:
+            await update.message.reply_text(
+                f"⏰ Напоминание каждый день в {format_minute(minute)} ({zone.label}).\n"
+                f"Выключить: /remind off"
+            )
+        return
+
+    if args[0].lower() in ('off', 'выкл'):
+        await delete_reminder(user_id)
+        await update.message.reply_text("🔕 Напоминание выключено.")
+        return
+
+    try:
+        minute = parse_local_time(args[0])
+    except ValueError:
+        await update.message.reply_text("❌ Укажите время в формате ЧЧ:ММ, например: /remind 08:00")
+        return
+
+    await set_reminder(user_id, minute, zone.offset)
+    await update.message.reply_text(
+        f"⏰ Буду напоминать каждый день в {format_minute(minute)} ({zone.label}).\n"
+        f"Если вы уже взвесились в этот день, напоминания не будет."
+    )
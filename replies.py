@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+💬 Reply Rendering for Weight Tracker Bot
+Тексты частых ответов и главная клавиатура. Шаблоны разбираются один раз
+при импорте (связанные str.format), ответ собирается одним join без
+повторных конкатенаций. Клавиатура - один неизменяемый объект на процесс:
+объекты PTB после создания заморожены, их можно отдавать во все ответы.
+"""
+
+from telegram import ReplyKeyboardMarkup, KeyboardButton
+
+# ==================== КЛАВИАТУРА ====================
+BUTTON_SEND_WEIGHT = "📊 Отправить вес"
+BUTTON_LAST = "📅 Последний вес"
+BUTTON_HISTORY = "📈 История"
+BUTTON_DELETE = "🗑️ Удалить последнее"
+BUTTON_HELP = "ℹ️ Помощь"
+
+MAIN_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [KeyboardButton(BUTTON_SEND_WEIGHT)],
+        [KeyboardButton(BUTTON_LAST), KeyboardButton(BUTTON_HISTORY)],
+        [KeyboardButton(BUTTON_DELETE), KeyboardButton(BUTTON_HELP)],
+    ],
+    resize_keyboard=True,
+    one_time_keyboard=False,
+)
+
+# Лимит Telegram - 4096 символов, с запасом
+MESSAGE_LIMIT = 4000
+
+# ==================== ШАБЛОНЫ ====================
+_CHANGE_UP = "📈 {}: +{:.1f} кг".format
+_CHANGE_DOWN = "📉 {}: {:.1f} кг".format
+NO_CHANGE = "📊 Вес не изменился"
+
+_WEIGHT_SAVED = (
+    "✅ Вес сохранен!\n\n"
+    "🌍 Временная зона: {}\n"
+    "📅 Дата и время: {}\n"
+    "⚖️ Вес: {} кг\n"
+).format
+_COMPARISON = (
+    "\n📊 Сравнение с последним измерением ({}):\n"
+    "Предыдущий вес: {} кг\n"
+).format
+FIRST_RECORD = "\n🎉 Это ваша первая запись! Продолжайте в том же духе!"
+
+_LAST_WEIGHT = (
+    "🌍 Временная зона: {}\n"
+    "📅 Последнее измерение: {}\n"
+    "⚖️ Вес: {} кг"
+).format
+NO_RECORDS = "📭 У вас еще нет записей о весе. Отправьте свой вес!"
+
+_HISTORY_HEADER = "🌍 Временная зона: {}\n📊 История ваших измерений:\n\n".format
+_HISTORY_LINE = "{}. {}: {} кг\n".format
+NO_HISTORY = "📭 У вас еще нет записей о весе."
+
+_TREND_HEADER = "📊 Динамика веса по {} (последние {}):\n".format
+_TREND_LINE = "📅 {}: ⌀ {:.1f} кг (⬇️ {} / ⬆️ {}), последний {} кг".format
+
+
+def format_change(label, difference):
+    """'📈 label: +1.5 кг', '📉 label: -1.5 кг' или 'Вес не изменился'"""
+    if difference > 0:
+        return _CHANGE_UP(label, difference)
+    if difference < 0:
+        return _CHANGE_DOWN(label, difference)
+    return NO_CHANGE
+
+
+def render_weight_saved(zone_label, current_time, weight, previous=None):
+    """Ответ на новую запись; previous - (дата, вес) предыдущей записи или None"""
+    if previous is None:
+        return _WEIGHT_SAVED(zone_label, current_time, weight) + FIRST_RECORD
+    previous_date, previous_weight = previous
+    return ''.join((
+        _WEIGHT_SAVED(zone_label, current_time, weight),
+        _COMPARISON(previous_date, previous_weight),
+        format_change("Изменение", weight - previous_weight),
+    ))
+
+
+def render_last_weight(zone_label, date, weight):
+    return _LAST_WEIGHT(zone_label, date, weight)
+
+
+def render_history(zone_label, rows):
+    """rows - [(дата, вес), ...] от новых к старым, не пустой"""
+    parts = [_HISTORY_HEADER(zone_label)]
+    parts.extend(_HISTORY_LINE(i, date, weight) for i, (date, weight) in enumerate(rows, 1))
+    if len(rows) > 1:
+        parts.append("\n")
+        parts.append(format_change("Общее изменение", rows[0][1] - rows[-1][1]))
+    return ''.join(parts)
+
+
+def render_trend(period_name, count, rows):
+    """rows - [(дата корзины, среднее, мин, макс, последний), ...] от старых к новым"""
+    lines = [_TREND_HEADER(period_name, count)]
+    lines.extend(_TREND_LINE(*row) for row in rows)
+    if len(rows) > 1:
+        lines.append("\n" + format_change("Изменение за период", rows[-1][4] - rows[0][4]))
+    return "\n".join(lines)
+
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """Делит длинный ответ на сообщения по границам строк; строка длиннее
+    limit режется по limit"""
+    chunks = []
+    current = []
+    size = 0
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if current and size + 1 + len(line) > limit:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        size += len(line) + (1 if current else 0)
+        current.append(line)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
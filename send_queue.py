@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+📤 Outgoing Send Queue for Weight Tracker Bot
+Все запросы бота к Telegram с chat_id проходят через очередь: token bucket
+на весь бот и на каждый чат (лимиты Telegram), приоритетные полосы
+(ответы пользователям раньше отчётов админу и бэкапов), схлопывание
+устаревших сообщений и повтор после 429 Retry-After.
+
+Полоса задаётся для текущей задачи: with send_lane(PRIORITY_ADMIN): ...
+или декоратором @admin_lane на обработчике команды.
+"""
+
+import os
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, 20/мин в группу
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))
+SEND_GLOBAL_BURST = float(os.getenv('SEND_GLOBAL_BURST', '30'))
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))
+SEND_CHAT_BURST = float(os.getenv('SEND_CHAT_BURST', '3'))
+SEND_GROUP_RATE = float(os.getenv('SEND_GROUP_RATE', str(20 / 60)))
+SEND_MAX_RETRIES = int(os.getenv('SEND_MAX_RETRIES', '3'))
+
+# Полосы: меньше - раньше
+PRIORITY_USER = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BACKGROUND = 2
+
+# Когда бакетов чатов больше, полные (давно простаивающие) удаляются
+_MAX_IDLE_BUCKETS = 10000
+
+_current_lane = contextvars.ContextVar('send_lane', default=(PRIORITY_USER, None))
+
+
+@contextmanager
+def send_lane(priority, coalesce=None):
+    """Полоса для отправок внутри блока. coalesce - ключ схлопывания: если
+    сообщение с тем же ключом в тот же чат ещё ждёт в очереди, уйдёт только новое."""
+    token = _current_lane.set((priority, coalesce))
+    try:
+        yield
+    finally:
+        _current_lane.reset(token)
+
+
+def admin_lane(handler):
+    """Декоратор обработчика: все его ответы идут в полосе отчётов админу"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        with send_lane(PRIORITY_ADMIN):
+            return await handler(*args, **kwargs)
+    return wrapper
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Сколько ждать до свободного токена (0 - можно отправлять)"""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Send:
+    __slots__ = ('priority', 'seq', 'chat_id', 'key', 'callback', 'args', 'kwargs', 'future', 'attempts')
+
+    def __init__(self, priority, seq, chat_id, key, callback, args, kwargs, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.key = key
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        self.attempts = 0
+
+
+def _chain_result(target, source):
+    """Переносит результат future source в target"""
+    if target.done():
+        return
+    if source.cancelled():
+        target.cancel()
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class SendQueue(BaseRateLimiter):
+    """Rate limiter для ApplicationBuilder.rate_limiter()"""
+
+    def __init__(self):
+        self._global = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+        self._chats = {}
+        # Полоса (priority) -> deque отправок в порядке постановки: выбор
+        # следующей отправки идёт по головам полос без сортировки всей очереди
+        self._lanes = {}
+        self._size = 0
+        self._coalesce = {}
+        self._seq = 0
+        self._paused_until = 0.0
+        self._wakeup = None
+        self._dispatcher = None
+        self._inflight = set()
+        self.stats = {'sent': 0, 'retried': 0, 'coalesced': 0, 'failed': 0}
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._dispatcher = asyncio.create_task(self._dispatch_loop())
+
+    async def shutdown(self):
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for lane in self._lanes.values():
+            for entry in lane:
+                if not entry.future.done():
+                    entry.future.cancel()
+        self._lanes.clear()
+        self._size = 0
+        self._coalesce.clear()
+
+    def queue_size(self):
+        return self._size
+
+    def _push(self, entry, front=False):
+        lane = self._lanes.get(entry.priority)
+        if lane is None:
+            lane = self._lanes[entry.priority] = deque()
+            self._lanes = dict(sorted(self._lanes.items()))
+        if front:
+            lane.appendleft(entry)
+        else:
+            lane.append(entry)
+        self._size += 1
+        if entry.key:
+            self._coalesce[entry.key] = entry
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= _MAX_IDLE_BUCKETS:
+                now = time.monotonic()
+                for idle in [c for c, b in self._chats.items() if b.is_idle(now)]:
+                    del self._chats[idle]
+            group = isinstance(chat_id, int) and chat_id < 0
+            bucket = self._chats[chat_id] = (
+                TokenBucket(SEND_GROUP_RATE, 1) if group else TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+            )
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # getMe, answerCallbackQuery, setWebhook и т.п. - без очереди
+            return await callback(*args, **kwargs)
+
+        priority, coalesce = _current_lane.get()
+        if isinstance(rate_limit_args, dict):
+            priority = rate_limit_args.get('priority', priority)
+            coalesce = rate_limit_args.get('coalesce', coalesce)
+
+        key = (chat_id, endpoint, coalesce) if coalesce is not None else None
+        queued = self._coalesce.get(key) if key else None
+        if queued is not None:
+            # Старое сообщение ещё не ушло: отправится только новое,
+            # оба вызова получат его результат
+            queued.callback, queued.args, queued.kwargs = callback, args, kwargs
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(queued.future)
+
+        now = time.monotonic()
+        if (not self._size and self._paused_until <= now
+                and self._global.wait_time(now) == 0 and self._chat_bucket(chat_id).wait_time(now) == 0):
+            # Очередь пуста и лимиты свободны: отправляем сразу, без диспетчера
+            self._global.take(now)
+            self._chat_bucket(chat_id).take(now)
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.stats['retried'] += 1
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"⏳ Telegram 429: пауза отправки {e.retry_after} с (чат {chat_id})")
+            except Exception:
+                self.stats['failed'] += 1
+                raise
+            else:
+                self.stats['sent'] += 1
+                return result
+
+        self._seq += 1
+        entry = _Send(priority, self._seq, chat_id, key, callback, args, kwargs,
+                      asyncio.get_running_loop().create_future())
+        self._push(entry)
+        # shield: отмена ожидающего обработчика не должна отменять общий результат
+        return await asyncio.shield(entry.future)
+
+    def _next_ready(self, now):
+        """Снимает с очереди самую приоритетную отправку, чей чат готов;
+        иначе (None, сколько ждать). Обычно это голова первой полосы, дальше
+        просматриваются только отправки в чаты, упёршиеся в свой лимит."""
+        wait = None
+        blocked = set()
+        for lane in self._lanes.values():
+            for index, entry in enumerate(lane):
+                if entry.chat_id in blocked:
+                    continue
+                delay = self._chat_bucket(entry.chat_id).wait_time(now)
+                if delay == 0:
+                    del lane[index]
+                    self._size -= 1
+                    if entry.key:
+                        self._coalesce.pop(entry.key, None)
+                    return entry, 0
+                blocked.add(entry.chat_id)
+                wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _dispatch_loop(self):
+        while True:
+            if not self._size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            delay = max(self._paused_until - now, self._global.wait_time(now))
+            if delay <= 0:
+                entry, delay = self._next_ready(now)
+                if entry is not None:
+                    self._global.take(now)
+                    self._chat_bucket(entry.chat_id).take(now)
+                    task = asyncio.create_task(self._send(entry))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                    continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, entry):
+        try:
+            result = await entry.callback(*entry.args, **entry.kwargs)
+        except RetryAfter as e:
+            entry.attempts += 1
+            if entry.attempts > SEND_MAX_RETRIES:
+                self.stats['failed'] += 1
+                if not entry.future.done():
+                    entry.future.set_exception(e)
+                return
+            # 429 относится ко всему боту: останавливаем все отправки на retry_after
+            self.stats['retried'] += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"⏳ Telegram 429: пауза отправки {e.retry_after} с (чат {entry.chat_id})")
+            newer = self._coalesce.get(entry.key) if entry.key else None
+            if newer is not None:
+                # Пока шла попытка, в очередь встала новая версия сообщения:
+                # повторять старую не нужно, её ожидающие получат результат новой
+                self.stats['coalesced'] += 1
+                newer.future.add_done_callback(functools.partial(_chain_result, entry.future))
+                return
+            # Отправка старше всего, что ждёт в её полосе: возвращается в начало
+            self._push(entry, front=True)
+            return
+        except Exception as e:
+            self.stats['failed'] += 1
+            if not entry.future.done():
+                entry.future.set_exception(e)
+            return
+        self.stats['sent'] += 1
+        if not entry.future.done():
+            entry.future.set_result(result)
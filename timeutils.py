@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🌍 Time helpers for Weight Tracker Bot
+В БД время хранится как целые секунды Unix (UTC),
+часовой пояс применяется только при выводе пользователю.
+По умолчанию - Самара (UTC+4): пояс бота, админских отчётов и daily_stats;
+у пользователей может быть свой пояс (timezones.py).
+"""
+
+import time
+from datetime import datetime, timezone, timedelta
+
+# Настройка временной зоны Самары (UTC+4)
+SAMARA_TZ = timezone(timedelta(hours=4))
+
+# Модификаторы SQLite для перевода UTC <-> местное время Самары,
+# например date(ts, 'unixepoch', LOCAL_MODIFIER)
+_OFFSET_SECONDS = int(SAMARA_TZ.utcoffset(None).total_seconds())
+DEFAULT_OFFSET = _OFFSET_SECONDS
+LOCAL_MODIFIER = f'{_OFFSET_SECONDS:+d} seconds'
+UTC_MODIFIER = f'{-_OFFSET_SECONDS:+d} seconds'
+
+MINUTES_PER_DAY = 1440
+
+
+def now_ts():
+    """Текущее время в секундах Unix (UTC)"""
+    return int(time.time())
+
+
+def get_local_time(tz=SAMARA_TZ):
+    """Текущее время в часовом поясе tz"""
+    return datetime.now(tz)
+
+
+def get_samara_time():
+    """Получить текущее время в Самаре"""
+    return get_local_time(SAMARA_TZ)
+
+
+def from_ts(ts, tz=SAMARA_TZ):
+    """Секунды Unix -> datetime в часовом поясе tz (по умолчанию Самара)"""
+    return datetime.fromtimestamp(ts, tz)
+
+
+def local_day_bounds(ts, offset=_OFFSET_SECONDS):
+    """Местный день момента ts при смещении offset (секунды от UTC):
+    ('YYYY-MM-DD', начало дня, начало следующего дня)"""
+    start = ts - (ts + offset) % 86400
+    day = datetime.fromtimestamp(start + offset, timezone.utc).strftime('%Y-%m-%d')
+    return day, start, start + 86400
+
+
+def format_local_time(dt=None, date_only=False, tz=SAMARA_TZ):
+    """Форматировать время в поясе tz (datetime или секунды Unix)"""
+    if dt is None:
+        dt = get_local_time(tz)
+    elif isinstance(dt, (int, float)):
+        dt = from_ts(dt, tz)
+
+    if date_only:
+        return dt.strftime('%d.%m.%Y')
+    else:
+        return dt.strftime('%d.%m.%Y %H:%M')
+
+
+def format_samara_time(dt=None, date_only=False):
+    """Форматировать время в Самаре (datetime или секунды Unix)"""
+    return format_local_time(dt, date_only, SAMARA_TZ)
+
+
+def format_day(day):
+    """'YYYY-MM-DD' (корзины статистики) -> 'DD.MM.YYYY'"""
+    return f'{day[8:10]}.{day[5:7]}.{day[0:4]}'
+
+
+def parse_local_time(text):
+    """'HH:MM' (местное время) -> минута суток; ValueError, если формат неверный"""
+    hours, sep, minutes = text.strip().partition(':')
+    if not sep or not hours.isdigit() or len(minutes) != 2 or not minutes.isdigit():
+        raise ValueError(f"Неверное время: {text}")
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Неверное время: {text}")
+    return hours * 60 + minutes
+
+
+def format_minute(minute):
+    """Минута суток -> 'HH:MM'"""
+    return f'{minute // 60:02d}:{minute % 60:02d}'
+
+
+def utc_minute_of_day(local_minute, offset=_OFFSET_SECONDS):
+    """Минута суток по местному времени (смещение offset секунд) -> минута суток UTC"""
+    return (local_minute - offset // 60) % MINUTES_PER_DAY
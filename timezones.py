@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+🕰️ Per-user Time Zones for Weight Tracker Bot
+Пояс пользователя хранится в users (tz, tz_offset) и выбирается командой /timezone.
+Обработчики получают его через LRU-кэш по user_id, поэтому ответы на горячих
+путях не читают БД ради пояса. Без выбора действует пояс бота - Самара (UTC+4).
+
+Свёртки истории и напоминания считаются по tz_offset - смещению пояса на
+момент выбора, поэтому выбрать можно только пояс с постоянным смещением
+(все пояса России, Etc/GMT±N, Asia/Tokyo и т.п.). Пояса с летним временем
+отклоняются: иначе полгода записи около полуночи попадали бы в корзину
+другого дня, чем время, которое видит пользователь.
+"""
+
+import os
+import logging
+from collections import namedtuple
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+
+import db
+from cache import LRUCache
+from metrics import watch_cache
+from timeutils import SAMARA_TZ, DEFAULT_OFFSET, MINUTES_PER_DAY, format_local_time
+
+logger = logging.getLogger(__name__)
+
+TZ_CACHE_SIZE = int(os.getenv('TZ_CACHE_SIZE', '100000'))
+
+# Часовые пояса России с запада на восток: (имя IANA, город)
+RUSSIAN_ZONES = [
+    ('Europe/Kaliningrad', 'Калининград'),
+    ('Europe/Moscow', 'Москва'),
+    ('Europe/Samara', 'Самара'),
+    ('Asia/Yekaterinburg', 'Екатеринбург'),
+    ('Asia/Omsk', 'Омск'),
+    ('Asia/Krasnoyarsk', 'Красноярск'),
+    ('Asia/Irkutsk', 'Иркутск'),
+    ('Asia/Yakutsk', 'Якутск'),
+    ('Asia/Vladivostok', 'Владивосток'),
+    ('Asia/Magadan', 'Магадан'),
+    ('Asia/Kamchatka', 'Камчатка'),
+]
+_CITIES = dict(RUSSIAN_ZONES)
+
+# name - имя IANA, tz - tzinfo для вывода, offset - смещение в секундах для свёрток
+UserZone = namedtuple('UserZone', 'name tz offset label')
+
+DEFAULT_ZONE = UserZone('Europe/Samara', SAMARA_TZ, DEFAULT_OFFSET, 'Самара (UTC+4)')
+
+_zones = LRUCache(TZ_CACHE_SIZE)
+watch_cache('user_zones', _zones)
+
+
+def _offset_label(offset):
+    hours, rest = divmod(abs(offset), 3600)
+    return f"UTC{'+' if offset >= 0 else '-'}{hours}" + (f":{rest // 60:02d}" if rest else "")
+
+
+def _has_dst(tz):
+    """Меняется ли смещение пояса в течение текущего года"""
+    year = datetime.now(tz).year
+    return datetime(year, 1, 1, tzinfo=tz).utcoffset() != datetime(year, 7, 1, tzinfo=tz).utcoffset()
+
+
+def make_zone(name, offset=None):
+    """UserZone по имени IANA; ValueError, если пояс неизвестен или переходит
+    на летнее время. С offset (сохранённый пояс) пояс с летним временем не
+    отклоняется, а выводится с тем же постоянным смещением, что и свёртки."""
+    try:
+        tz = ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Неизвестный часовой пояс: {name}")
+    if _has_dst(tz):
+        if offset is None:
+            raise ValueError(f"Пояс {name} переходит на летнее время, нужен пояс с постоянным смещением")
+        tz = timezone(timedelta(seconds=offset))
+    if offset is None:
+        offset = int(datetime.now(tz).utcoffset().total_seconds())
+    return UserZone(name, tz, offset, f"{_CITIES.get(name, name)} ({_offset_label(offset)})")
+
+
+def parse_zone(text):
+    """Пояс по имени IANA, городу из RUSSIAN_ZONES или смещению ('+3', 'UTC+3').
+    Смещение без пояса России - Etc/GMT∓N (знак в именах Etc/GMT обратный)."""
+    text = text.strip()
+    lowered = text.lower()
+    for name, city in RUSSIAN_ZONES:
+        if lowered in (name.lower(), city.lower()):
+            return make_zone(name)
+
+    offset = lowered[3:] if lowered.startswith('utc') else lowered
+    if offset[:1] in ('+', '-') and offset[1:].isdigit():
+        for name, _ in RUSSIAN_ZONES:
+            zone = make_zone(name)
+            if zone.offset == int(offset) * 3600:
+                return zone
+        return make_zone(f'Etc/GMT{-int(offset):+d}')
+    return make_zone(text)
+
+
+# ==================== ЗАПРОСЫ ====================
+def _get_user_tz(conn, user_id):
+    return conn.execute('SELECT tz, tz_offset FROM users WHERE user_id = ?', (user_id,)).fetchone()
+
+
+def _set_user_tz(conn, user_id, username, first_name, last_name, zone):
+    """Сохраняет пояс, пересобирает свёртки и переносит напоминание в новом поясе"""
+    db._register_user(conn, user_id, username, first_name, last_name)
+    conn.execute('UPDATE users SET tz = ?, tz_offset = ? WHERE user_id = ?', (zone.name, zone.offset, user_id))
+    db._rebuild_user_rollups(conn, user_id)
+    conn.execute(f'''
+        UPDATE reminders
+        SET utc_minute = ((local_minute - ?) % {MINUTES_PER_DAY} + {MINUTES_PER_DAY}) % {MINUTES_PER_DAY}
+        WHERE user_id = ?
+    ''', (zone.offset // 60, user_id))
+
+
+async def get_user_zone(user_id):
+    """Пояс пользователя (из кэша, при промахе - из users)"""
+    zone = _zones.get(user_id)
+    if zone is None:
+        row = await db.pool.read(_get_user_tz, user_id)
+        zone = DEFAULT_ZONE
+        if row and row[0]:
+            try:
+                zone = make_zone(row[0], row[1])
+            except ValueError as e:
+                logger.error(f"❌ Пояс пользователя {user_id}: {e}")
+        _zones.set(user_id, zone)
+    return zone
+
+
+async def set_user_zone(user, zone):
+    await db.pool.write(_set_user_tz, user.id, user.username, user.first_name, user.last_name, zone)
+    db.known_users.set(user.id, (user.username, user.first_name, user.last_name))
+    _zones.set(user.id, zone)
+
+
+# ==================== КОМАНДА ====================
+def _zones_keyboard():
+    buttons = [
+        InlineKeyboardButton(make_zone(name).label, callback_data=f"tz_{name}")
+        for name, _ in RUSSIAN_ZONES
+    ]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+def _zone_set_text(zone):
+    return (
+        f"✅ Часовой пояс: {zone.label}\n"
+        f"🕐 Текущее время: {format_local_time(tz=zone.tz)}\n\n"
+        f"История, /trend и напоминания теперь в этом поясе."
+    )
+
+
+async def timezone_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone - выбрать пояс кнопками, /timezone Москва (или +3, Asia/Omsk) - сразу"""
+    user = update.effective_user
+    args = context.args or []
+
+    if not args:
+        zone = await get_user_zone(user.id)
+        await update.message.reply_text(
+            f"🌍 Ваш часовой пояс: {zone.label}\n"
+            f"🕐 Текущее время: {format_local_time(tz=zone.tz)}\n\n"
+            f"Выберите новый пояс:",
+            reply_markup=_zones_keyboard()
+        )
+        return
+
+    try:
+        zone = parse_zone(' '.join(args))
+    except ValueError as e:
+        await update.message.reply_text(
+            f"❌ {e}. Примеры: /timezone Москва, /timezone +7, /timezone Asia/Omsk"
+        )
+        return
+
+    await set_user_zone(user, zone)
+    await update.message.reply_text(_zone_set_text(zone))
+
+
+async def timezone_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    try:
+        zone = make_zone(query.data[len('tz_'):])
+    except ValueError as e:
+        await query.edit_message_text(f"❌ {e}")
+        return
+
+    await set_user_zone(query.from_user, zone)
+    await query.edit_message_text(_zone_set_text(zone))
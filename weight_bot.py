@@ -1,15 +1,48 @@
 import os
-import sqlite3
+import asyncio
 import logging
-from datetime import datetime, timezone, timedelta
-from telegram import Update, InputFile, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+import secrets
+from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from timeutils import now_ts, get_local_time, format_local_time, format_samara_time, format_day
+from db import (
+    DB_PATH,
+    close_db,
+    checkpoint_loop,
+    warm_known_users,
+    register_user,
+    record_weight,
+    get_last_weight,
+    delete_last_weight,
+    get_weight_history,
+    get_weight_rollups,
+    clear_weight_history
+)
+from migrations import init_db, run_backfills
+from concurrency import configure_concurrency
+from send_queue import SendQueue, PRIORITY_ADMIN, send_lane, admin_lane
+from reminders import remind_command, schedule_reminders
+from timezones import get_user_zone, timezone_command, timezone_callback
 from admin_stats import (
     stats_command,
     users_command,
     user_details_command,
+    summary_check_command,
+    migrations_command,
+    perf_command,
     admin_callback_handler
 )
+from metrics import instrument_handlers, watch_application, start_metrics_server
+from replies import (
+    MAIN_KEYBOARD,
+    NO_RECORDS,
+    NO_HISTORY,
+    render_weight_saved,
+    render_last_weight,
+    render_history,
+    render_trend,
+    split_message
+)
 
 # Настройка логирования
 logging.basicConfig(
@@ -32,189 +65,58 @@ if ':' not in TELEGRAM_TOKEN:
     logger.error("Токен должен быть: 1234567890:ABCdefGHIjklMNOpqrsTUVwxyz")
     exit(1)
 
+# ========== РЕЖИМ ЗАПУСКА ==========
+# BOT_MODE=polling (по умолчанию) или webhook: Telegram сам присылает обновления
+# на WEBHOOK_URL/WEBHOOK_PATH, бот принимает их локальным HTTP-сервером
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443')))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Telegram передаёт секрет в заголовке X-Telegram-Bot-Api-Secret-Token,
+# запросы без него отклоняются. Если не задан - генерируется при каждом запуске.
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+# Другой адрес Bot API (локальный telegram-bot-api сервер или стенд бенчмарка)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 logger.info(f"✅ Токен получен: {TELEGRAM_TOKEN[:10]}...")
 logger.info("🤖 Запускаем Telegram Weight Bot...")
-logger.info("🌍 Временная зона: Самара (UTC+4)")
+logger.info("🌍 Временная зона по умолчанию: Самара (UTC+4), у пользователей - своя (/timezone)")
 logger.info("📋 Доступные команды в боте:")
 logger.info("  /start - Начать работу")
 logger.info("  /help - Помощь и инструкции")
 logger.info("  /last - Последний вес")
 logger.info("  /history - История измерений")
+logger.info("  /trend [day|week|month] [N] - Динамика веса по периодам")
 logger.info("  /delete_last - Удалить последнюю запись о весе")
+logger.info("  /remind [ЧЧ:ММ|off] - Ежедневное напоминание взвеситься")
+logger.info("  /timezone - Выбрать часовой пояс")
 logger.info("  Просто отправьте вес числом (например: 75.5)")
 
-# Настройка временной зоны Самары (UTC+4)
-SAMARA_TZ = timezone(timedelta(hours=4))
-
-
-def get_samara_time():
-    """Получить текущее время в Самаре"""
-    return datetime.now(SAMARA_TZ)
-
-
-def format_samara_time(dt=None, date_only=False):
-    """Форматировать время в Самаре"""
-    if dt is None:
-        dt = get_samara_time()
-
-    if isinstance(dt, str):
-        try:
-            dt = datetime.strptime(dt, '%Y-%m-%d %H:%M:%S')
-        except:
-            return dt
-
-    if date_only:
-        return dt.strftime('%d.%m.%Y')
-    else:
-        return dt.strftime('%d.%m.%Y %H:%M')
-
-
-# Инициализация базы данных
-def init_db():
-    os.makedirs('data', exist_ok=True)
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS weight_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            weight REAL NOT NULL,
-            date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE INDEX IF NOT EXISTS idx_weight_records 
-        ON weight_records (user_id, date DESC)
-    ''')
-
-    conn.commit()
-    conn.close()
-    print("✅ База данных инициализирована")
-
-
-# Функции БД
-def register_user(user_id, username, first_name, last_name):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR IGNORE INTO users (user_id, username, first_name, last_name)
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, username, first_name, last_name))
-    conn.commit()
-    conn.close()
-
-
-def save_weight(user_id, weight):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    current_time = get_samara_time().strftime('%Y-%m-%d %H:%M:%S')
-    cursor.execute('''
-        INSERT INTO weight_records (user_id, weight, date)
-        VALUES (?, ?, ?)
-    ''', (user_id, weight, current_time))
-    conn.commit()
-    conn.close()
-
-
-def get_last_weight(user_id):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT weight, date, id
-        FROM weight_records 
-        WHERE user_id = ? 
-        ORDER BY date DESC 
-        LIMIT 1
-    ''', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
-
-
-def get_last_weight_id(user_id):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id
-        FROM weight_records 
-        WHERE user_id = ? 
-        ORDER BY date DESC 
-        LIMIT 1
-    ''', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result else None
-
-
-def delete_last_weight(user_id):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    last_id = get_last_weight_id(user_id)
-    if not last_id:
-        conn.close()
-        return None
-
-    cursor.execute('SELECT weight, date FROM weight_records WHERE id = ?', (last_id,))
-    record_to_delete = cursor.fetchone()
-    cursor.execute('DELETE FROM weight_records WHERE id = ?', (last_id,))
-    conn.commit()
-    conn.close()
-    return record_to_delete
-
-
-def get_weight_history(user_id, limit=10):
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT weight, date 
-        FROM weight_records 
-        WHERE user_id = ? 
-        ORDER BY date DESC 
-        LIMIT ?
-    ''', (user_id, limit))
-    results = cursor.fetchall()
-    conn.close()
-    return results
-
 
 # Клавиатуры
 def get_main_keyboard():
-    keyboard = [
-        [KeyboardButton("📊 Отправить вес")],
-        [KeyboardButton("📅 Последний вес"), KeyboardButton("📈 История")],
-        [KeyboardButton("🗑️ Удалить последнее"), KeyboardButton("ℹ️ Помощь")]
-    ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True, one_time_keyboard=False)
+    """Главная клавиатура: один общий неизменяемый объект (replies.MAIN_KEYBOARD)"""
+    return MAIN_KEYBOARD
 
 
-from backup import backup_database, start_backup_scheduler
+from backup import BACKUP_DIR, BACKUP_JOB_NAME, backup_database, fetch_backup_status, schedule_backups
 logger.info("🔥 БЭКАПЫ ЗАГРУЖЕНЫ! АДМИНУ БУДЕТ ПРИХОДИТЬ КАЖДУЮ МИНУТУ!")
 
 
 # Команды бота
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
-    register_user(user.id, user.username, user.first_name, user.last_name)
-    current_time = format_samara_time()
+    await register_user(user.id, user.username, user.first_name, user.last_name)
+    zone = await get_user_zone(user.id)
+    current_time = format_local_time(tz=zone.tz)
     welcome_text = f"""
 👋 Привет, {user.first_name}!
 
 Я бот для отслеживания веса.
 
-🌍 Временная зона: Самара (UTC+4)
+🌍 Временная зона: {zone.label} (сменить: /timezone)
 🕐 Текущее время: {current_time}
 
 📊 Просто отправь мне свой вес в килограммах (например: 75.5 или 80).
@@ -227,11 +129,12 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    current_time = format_samara_time()
+    zone = await get_user_zone(update.effective_user.id)
+    current_time = format_local_time(tz=zone.tz)
     help_text = f"""
 📋 Как пользоваться ботом:
 
-🌍 Временная зона: Самара (UTC+4)
+🌍 Временная зона: {zone.label}
 🕐 Текущее время: {current_time}
 
 Просто отправьте свой вес в килограммах.
@@ -241,6 +144,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 📊 Отправить вес - Ввести текущий вес
 📅 Последний вес - Посмотреть последнее измерение
 📈 История - История измерений (последние 10)
+/trend week 52 - Динамика за год по неделям (также day, month)
+/remind 08:00 - Напоминать взвеситься каждый день (/remind off - выключить)
+/timezone - Выбрать часовой пояс
 🗑️ Удалить последнее - Удалить последнюю запись
 ℹ️ Помощь - Эта справка
 
@@ -251,50 +157,75 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def last_weight(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    last_record = get_last_weight(user_id)
+    last_record = await get_last_weight(user_id)
     if last_record:
-        weight, date, _ = last_record
-        formatted_date = format_samara_time(date)
+        weight, ts, _ = last_record
+        zone = await get_user_zone(user_id)
+        formatted_date = format_local_time(ts, tz=zone.tz)
         await update.message.reply_text(
-            f"🌍 Временная зона: Самара (UTC+4)\n"
-            f"📅 Последнее измерение: {formatted_date}\n"
-            f"⚖️ Вес: {weight} кг",
+            render_last_weight(zone.label, formatted_date, weight),
             reply_markup=get_main_keyboard()
         )
     else:
-        await update.message.reply_text(
-            "📭 У вас еще нет записей о весе. Отправьте свой вес!",
-            reply_markup=get_main_keyboard()
-        )
+        await update.message.reply_text(NO_RECORDS, reply_markup=get_main_keyboard())
 
 
 async def weight_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    history = get_weight_history(user_id)
+    history = await get_weight_history(user_id)
     if history:
-        response = "🌍 Временная зона: Самара (UTC+4)\n"
-        response += "📊 История ваших измерений:\n\n"
-        for i, (weight, date) in enumerate(history, 1):
-            formatted_date = format_samara_time(date, date_only=True)
-            response += f"{i}. {formatted_date}: {weight} кг\n"
-        if len(history) > 1:
-            first_weight = history[-1][0]
-            last_weight = history[0][0]
-            difference = last_weight - first_weight
-            if difference > 0:
-                response += f"\n📈 Общее изменение: +{difference:.1f} кг"
-            elif difference < 0:
-                response += f"\n📉 Общее изменение: {difference:.1f} кг"
-            else:
-                response += f"\n📊 Вес не изменился"
+        zone = await get_user_zone(user_id)
+        response = render_history(
+            zone.label, [(format_local_time(ts, date_only=True, tz=zone.tz), weight) for weight, ts in history]
+        )
     else:
-        response = "📭 У вас еще нет записей о весе."
+        response = NO_HISTORY
     await update.message.reply_text(response, reply_markup=get_main_keyboard())
 
 
+TREND_PERIODS = {
+    'day': ('дням', 90),
+    'week': ('неделям', 52),
+    'month': ('месяцам', 24),
+}
+
+
+async def weight_trend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    args = context.args or []
+    period = args[0] if args else 'week'
+    if period not in TREND_PERIODS:
+        await update.message.reply_text(
+            "❌ Период: day, week или month. Пример: /trend week 52",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    period_name, max_count = TREND_PERIODS[period]
+    try:
+        count = int(args[1]) if len(args) > 1 else 12
+    except ValueError:
+        await update.message.reply_text("❌ Количество периодов должно быть числом", reply_markup=get_main_keyboard())
+        return
+    count = max(1, min(count, max_count))
+
+    zone = await get_user_zone(user_id)
+    today = get_local_time(zone.tz).strftime('%Y-%m-%d')
+    rollups = await get_weight_rollups(user_id, period, today, count)
+    if not rollups:
+        await update.message.reply_text("📭 За этот период записей нет.", reply_markup=get_main_keyboard())
+        return
+
+    response = render_trend(period_name, count, [
+        (format_day(bucket), avg, min_w, max_w, last) for bucket, _, avg, min_w, max_w, last in rollups
+    ])
+    for chunk in split_message(response):
+        await update.message.reply_text(chunk, reply_markup=get_main_keyboard())
+
+
 async def delete_last_weight_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    last_record = get_last_weight(user_id)
+    last_record = await get_last_weight(user_id)
     if not last_record:
         await update.message.reply_text(
             "📭 У вас нет записей для удаления.",
@@ -308,11 +239,12 @@ async def delete_last_weight_command(update: Update, context: ContextTypes.DEFAU
             InlineKeyboardButton("❌ Нет, отмена", callback_data=f"delete_cancel_{user_id}")
         ]
     ]
-    weight, date, _ = last_record
-    formatted_date = format_samara_time(date)
+    weight, ts, _ = last_record
+    zone = await get_user_zone(user_id)
+    formatted_date = format_local_time(ts, tz=zone.tz)
     await update.message.reply_text(
         f"❓ Вы уверены, что хотите удалить последнюю запись?\n\n"
-        f"🌍 Временная зона: Самара (UTC+4)\n"
+        f"🌍 Временная зона: {zone.label}\n"
         f"📅 Дата: {formatted_date}\n"
         f"⚖️ Вес: {weight} кг\n\n"
         f"Это действие нельзя отменить!",
@@ -329,13 +261,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # УБРАЛ ВСЯ ХУЙНЮ С ПРОВЕРКАМИ
 
     if callback_data.startswith("delete_confirm"):
-        deleted_record = delete_last_weight(user_id)
+        deleted_record = await delete_last_weight(user_id)
         if deleted_record:
-            weight, date = deleted_record
-            formatted_date = format_samara_time(date)
+            weight, ts = deleted_record
+            zone = await get_user_zone(user_id)
+            formatted_date = format_local_time(ts, tz=zone.tz)
             await query.edit_message_text(
                 f"🗑️ Запись успешно удалена!\n\n"
-                f"🌍 Временная зона: Самара (UTC+4)\n"
+                f"🌍 Временная зона: {zone.label}\n"
                 f"📅 Дата: {formatted_date}\n"
                 f"⚖️ Вес: {weight} кг\n\n"
                 f"Теперь последней записью является предыдущее измерение."
@@ -356,9 +289,10 @@ async def handle_button_press(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id = update.effective_user.id
 
     if text == "📊 Отправить вес":
-        current_time = format_samara_time()
+        zone = await get_user_zone(user_id)
+        current_time = format_local_time(tz=zone.tz)
         await update.message.reply_text(
-            f"🌍 Временная зона: Самара (UTC+4)\n"
+            f"🌍 Временная зона: {zone.label}\n"
             f"🕐 Текущее время: {current_time}\n\n"
             f"Введите ваш вес в килограммах (например: 75.5 или 80):",
             reply_markup=get_main_keyboard()
@@ -387,30 +321,17 @@ async def handle_weight_message(update: Update, context: ContextTypes.DEFAULT_TY
             return
 
         user = update.effective_user
-        register_user(user.id, user.username, user.first_name, user.last_name)
-        last_record = get_last_weight(user_id)
-        save_weight(user_id, weight)
-        current_time = format_samara_time()
-
-        response = f"✅ Вес сохранен!\n\n"
-        response += f"🌍 Временная зона: Самара (UTC+4)\n"
-        response += f"📅 Дата и время: {current_time}\n"
-        response += f"⚖️ Вес: {weight} кг\n"
+        zone = await get_user_zone(user.id)
+        last_record, _ = await record_weight(
+            user.id, user.username, user.first_name, user.last_name, weight, now_ts(), zone.offset
+        )
+        current_time = format_local_time(tz=zone.tz)
 
+        previous = None
         if last_record:
-            last_weight_value, last_date, _ = last_record
-            difference = weight - last_weight_value
-            formatted_last_date = format_samara_time(last_date, date_only=True)
-            response += f"\n📊 Сравнение с последним измерением ({formatted_last_date}):\n"
-            response += f"Предыдущий вес: {last_weight_value} кг\n"
-            if difference > 0:
-                response += f"📈 Изменение: +{difference:.1f} кг"
-            elif difference < 0:
-                response += f"📉 Изменение: {difference:.1f} кг"
-            else:
-                response += f"📊 Вес не изменился"
-        else:
-            response += "\n🎉 Это ваша первая запись! Продолжайте в том же духе!"
+            last_weight_value, last_ts, _ = last_record
+            previous = (format_local_time(last_ts, date_only=True, tz=zone.tz), last_weight_value)
+        response = render_weight_saved(zone.label, current_time, weight, previous)
 
         await update.message.reply_text(response, reply_markup=get_main_keyboard())
 
@@ -425,6 +346,7 @@ async def handle_weight_message(update: Update, context: ContextTypes.DEFAULT_TY
 ADMIN_ID = 203790724
 
 
+@admin_lane
 async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if user_id != ADMIN_ID:
@@ -432,7 +354,7 @@ async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     await update.message.reply_text("🔄 Создаю резервную копию...")
-    backup_file = backup_database()
+    backup_file = await backup_database()
 
     if backup_file and os.path.exists(backup_file):
         try:
@@ -448,47 +370,51 @@ async def backup_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def show_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    current_time = format_samara_time()
+    zone = await get_user_zone(update.effective_user.id)
+    current_time = format_local_time(tz=zone.tz)
     time_info = f"""
-🌍 Временная зона: Самара (UTC+4)
+🌍 Временная зона: {zone.label}
 🕐 Текущее время: {current_time}
 
-📅 Все записи о весе сохраняются с местным временем Самары.
+📅 Даты записей показываются в вашем часовом поясе. Сменить: /timezone
 """
     await update.message.reply_text(time_info, reply_markup=get_main_keyboard())
 
 
+@admin_lane
 async def backup_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     if user_id != ADMIN_ID:
         await update.message.reply_text("⛔ Эта команда только для администратора")
         return
 
-    backup_dir = 'backups'
     try:
-        if not os.path.exists(backup_dir):
-            await update.message.reply_text("📭 Папка бекапов не найдена")
-            return
-
-        backups = sorted([f for f in os.listdir(backup_dir) if f.endswith('.db')])
-        if not backups:
+        status = await fetch_backup_status()
+        if not status:
             await update.message.reply_text("📭 Бекапов не найдено")
             return
 
+        entries = status['entries']
         response = "📊 Статус бекапов:\n\n"
-        response += f"📁 Папка: {backup_dir}\n"
-        response += f"📦 Всего бекапов: {len(backups)}\n\n"
-
-        for i, backup in enumerate(backups[-5:], 1):
-            backup_path = os.path.join(backup_dir, backup)
-            size_mb = os.path.getsize(backup_path) / 1024 / 1024
-            created = os.path.getctime(backup_path)
-            created_date = datetime.fromtimestamp(created).strftime('%d.%m.%Y %H:%M')
-            response += f"{i}. {backup}\n"
-            response += f"   📅 {created_date} | 📦 {size_mb:.2f} MB\n\n"
-
-        response += "⏰ Следующий автоматический бекап через 30 мин\n"
-        response += "🔄 Автобэкапы: ВКЛЮЧЕНЫ ✅"
+        response += f"📁 Папка: {BACKUP_DIR}\n"
+        response += f"🔗 Цепочек: {status['chains']} | 💾 Всего: {status['total_stored'] / 1024 / 1024:.2f} MB\n\n"
+        response += f"🔗 Текущая цепочка: {status['chain']}\n"
+        response += f"📦 Точек восстановления: {len(entries)} (1 полный + {len(entries) - 1} инкрементов)\n"
+        response += f"💾 Размер цепочки: {status['chain_stored'] / 1024 / 1024:.2f} MB\n"
+        response += f"🗜️ Сжатие gzip: x{status['compression']:.1f}\n"
+        response += f"📉 Против полных копий: x{status['vs_full_copies']:.1f}\n\n"
+
+        for entry in entries[-5:]:
+            kind = "полный" if entry['kind'] == 'full' else "инкремент"
+            response += f"{entry['file']}\n"
+            response += f"   📅 {format_samara_time(entry['created'])} | {kind}, {entry['pages']} стр. | 📦 {entry['stored_bytes'] / 1024:.1f} KB\n\n"
+
+        jobs = context.job_queue.get_jobs_by_name(BACKUP_JOB_NAME) if context.job_queue else []
+        if jobs and jobs[0].next_t:
+            response += f"⏰ Следующий автоматический бекап: {format_samara_time(int(jobs[0].next_t.timestamp()))}\n"
+            response += "🔄 Автобэкапы: ВКЛЮЧЕНЫ ✅"
+        else:
+            response += "🔄 Автобэкапы: ВЫКЛЮЧЕНЫ ❌"
 
         await update.message.reply_text(response)
 
@@ -498,40 +424,77 @@ async def backup_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def clear_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    conn = sqlite3.connect('data/weight_tracker.db')
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM weight_records WHERE user_id = ?', (user_id,))
-    conn.commit()
-    conn.close()
+    await clear_weight_history(user_id)
     await update.message.reply_text("🗑️ Ваша история веса очищена!", reply_markup=get_main_keyboard())
 
 
-# Главная функция
-def main():
-    logger.info("🗄️ Инициализация БАЗЫ ДАННЫХ...")
-    init_db()
+async def run_migration_backfills(application: Application):
+    async def report(text):
+        try:
+            # Прогресс устаревает: в очереди остаётся только последнее сообщение
+            with send_lane(PRIORITY_ADMIN, coalesce='migration_progress'):
+                await application.bot.send_message(chat_id=ADMIN_ID, text=text)
+        except Exception as e:
+            logger.error(f"❌ Не удалось отправить прогресс миграции: {e}")
 
-    if os.path.exists('data/weight_tracker.db'):
-        size = os.path.getsize('data/weight_tracker.db') / 1024 / 1024
-        logger.info(f"✅ БД готова: {size:.2f} MB")
-    else:
-        logger.error("❌ БД НЕ СОЗДАНА!!!")
+    try:
+        await run_backfills(progress=report)
+    except Exception as e:
+        logger.error(f"❌ Ошибка фоновой миграции: {e}")
+        await report(f"❌ Ошибка фоновой миграции: {e}")
+
+
+async def start_db_maintenance(application: Application):
+    try:
+        logger.info(f"👥 Известных пользователей загружено: {await warm_known_users()}")
+    except Exception as e:
+        logger.error(f"❌ Не удалось загрузить известных пользователей: {e}")
+    watch_application(application)
+    application.bot_data['metrics_server'] = await start_metrics_server()
+    application.bot_data['checkpoint_task'] = asyncio.create_task(checkpoint_loop())
+    application.bot_data['backfill_task'] = asyncio.create_task(run_migration_backfills(application))
+
+
+async def shutdown_db(application: Application):
+    for name in ('backfill_task', 'checkpoint_task'):
+        task = application.bot_data.pop(name, None)
+        if task:
+            task.cancel()
+    server = application.bot_data.pop('metrics_server', None)
+    if server:
+        server.close()
+    close_db()
+
+
+def run_webhook(application: Application):
+    if not WEBHOOK_URL:
+        logger.error("❌ BOT_MODE=webhook, но WEBHOOK_URL не задан")
         return
 
-    logger.info("=" * 60)
-    logger.info("🔄 ЗАПУСК БЭКАПОВ")
-    logger.info("=" * 60)
-    start_backup_scheduler()
-    logger.info("=" * 60)
+    webhook_url = f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}"
+    logger.info(f"🌐 Webhook: {webhook_url} -> {WEBHOOK_LISTEN}:{WEBHOOK_PORT}, "
+                f"до {WEBHOOK_MAX_CONNECTIONS} соединений")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=webhook_url,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+    )
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
 
-    # Обработчики
+def add_handlers(application: Application):
+    """Регистрирует обработчики бота (их же прогоняет benchmarks/bench_replay.py)"""
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("last", last_weight))
     application.add_handler(CommandHandler("history", weight_history))
+    application.add_handler(CommandHandler("trend", weight_trend))
     application.add_handler(CommandHandler("delete_last", delete_last_weight_command))
+    application.add_handler(CommandHandler("remind", remind_command))
+    application.add_handler(CommandHandler("timezone", timezone_command))
     application.add_handler(CommandHandler("clear", clear_history))
     application.add_handler(CommandHandler("backup", backup_command))
     application.add_handler(CommandHandler("time", show_time))
@@ -539,9 +502,13 @@ def main():
     application.add_handler(CommandHandler("stats", stats_command))
     application.add_handler(CommandHandler("users", users_command))
     application.add_handler(CommandHandler("user", user_details_command))
+    application.add_handler(CommandHandler("summary_check", summary_check_command))
+    application.add_handler(CommandHandler("migrations", migrations_command))
+    application.add_handler(CommandHandler("perf", perf_command))
 
     # ⭐ СНАЧАЛА специфичный для админ-кнопок (pattern)
     application.add_handler(CallbackQueryHandler(admin_callback_handler, pattern="^admin_"))
+    application.add_handler(CallbackQueryHandler(timezone_callback, pattern="^tz_"))
 
     # ПОТОМ общий обработчик для всех остальных кнопок
     application.add_handler(CallbackQueryHandler(button_callback))
@@ -556,13 +523,50 @@ def main():
         handle_weight_message
     ))
 
+
+# Главная функция
+def main():
+    logger.info("🗄️ Инициализация БАЗЫ ДАННЫХ...")
+    init_db()
+
+    if os.path.exists(DB_PATH):
+        size = os.path.getsize(DB_PATH) / 1024 / 1024
+        logger.info(f"✅ БД готова: {size:.2f} MB")
+    else:
+        logger.error("❌ БД НЕ СОЗДАНА!!!")
+        return
+
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(start_db_maintenance)
+        .post_shutdown(shutdown_db)
+        .rate_limiter(SendQueue())
+    )
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    application = configure_concurrency(builder).build()
+
+    logger.info("=" * 60)
+    logger.info("🔄 ЗАПУСК БЭКАПОВ")
+    logger.info("=" * 60)
+    schedule_backups(application)
+    logger.info("=" * 60)
+    schedule_reminders(application)
+
+    add_handlers(application)
+    instrument_handlers(application)
+
     logger.info("🤖 Бот успешно запущен на Railway!")
-    logger.info("🌍 Временная зона: Самара (UTC+4)")
+    logger.info("🌍 Временная зона по умолчанию: Самара (UTC+4)")
     logger.info("📱 Откройте Telegram и найдите своего бота")
     logger.info("👉 Отправьте команду /start")
 
     try:
-        application.run_polling()
+        if BOT_MODE == 'webhook':
+            run_webhook(application)
+        else:
+            application.run_polling()
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
         logger.info("🔄 Попробуйте перезапустить деплоймент на Railway")